@@ -1,24 +1,61 @@
 import eventlet
 eventlet.monkey_patch()
+from eventlet import tpool
 
 import os
+import sys
+import json
+import base64
+import binascii
+import atexit
+import signal
+import hashlib
 import datetime
-import threading
 import subprocess
+import itertools
+from collections import OrderedDict
+import numpy as np
 import pymysql
 import pymysql.cursors
-from flask import Flask, send_from_directory, abort, jsonify, request
+from flask import Flask, Response, send_file, abort, jsonify, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
-from formermatlabfunc import process_pipeline
 from werkzeug.utils import secure_filename
+from sqlalchemy import event
 
 INTERNAL_DATA_FOLDER = os.environ.get('INPUT_FOLDER_INTERNAL', '/app/data')
+# Liczba procesów dla klatek w process_pipeline (0 = wszystkie rdzenie)
+PIPELINE_WORKERS = int(os.environ.get('PIPELINE_WORKERS', 1))
+# Ile zadań (osobnych procesów) może działać jednocześnie: meshowanie (segmentacja klatek) i pakowanie GLB
+# mają osobne limity, więc pakowanie jednego organoidu nie czeka na segmentację kolejnego
+MAX_CONCURRENT_JOBS = int(os.environ.get('MAX_CONCURRENT_JOBS', 2))
+MAX_PACKAGE_JOBS = int(os.environ.get('MAX_PACKAGE_JOBS', 1))
+JOB_SLOTS = {'mesh': MAX_CONCURRENT_JOBS, 'package': MAX_PACKAGE_JOBS}
+# Po zakończonym przesyłaniu zbiór od razu trafia do kolejki meshowania
+AUTO_PROCESS_UPLOADS = os.environ.get('AUTO_PROCESS_UPLOADS', '1') == '1'
+# Profil parametrów pipeline'u dla zadań bez 'profile' (w tym automatycznych po uploadzie)
+DEFAULT_PROFILE = os.environ.get('DEFAULT_PARAMETER_PROFILE', 'default')
+SCHEDULER_INTERVAL = float(os.environ.get('SCHEDULER_INTERVAL', 2.0))
+# Bufor logów: zapis do bazy jednym INSERT-em i jedno zdarzenie 'server_logs' co tyle wpisów / sekund
+LOG_FLUSH_SIZE = int(os.environ.get('LOG_FLUSH_SIZE', 200))
+LOG_FLUSH_INTERVAL = float(os.environ.get('LOG_FLUSH_INTERVAL', 0.5))
+# Przy niedostępnej bazie trzymamy najwyżej tyle wpisów do ponownej próby
+LOG_BUFFER_MAX = int(os.environ.get('LOG_BUFFER_MAX', 10000))
+# Retencja: logi starsze niż LOG_RETENTION_DAYS trafiają do process_logs_archive (+ dzienne podsumowania),
+# archiwum starsze niż LOG_ARCHIVE_DAYS jest usuwane (0 = trzymaj zawsze); podsumowania zostają
+LOG_RETENTION_DAYS = int(os.environ.get('LOG_RETENTION_DAYS', 30))
+LOG_ARCHIVE_DAYS = int(os.environ.get('LOG_ARCHIVE_DAYS', 365))
+LOG_RETENTION_INTERVAL = float(os.environ.get('LOG_RETENTION_INTERVAL', 3600))
+LOG_RETENTION_BATCH = int(os.environ.get('LOG_RETENTION_BATCH', 5000))
+LOG_PAGE_MAX = 1000
+# Cache odpowiedzi /organoid/ (liczba wariantów zapytań), czyszczony po każdym commicie zmieniającym organoidy
+ORGANOID_CACHE_SIZE = int(os.environ.get('ORGANOID_CACHE_SIZE', 256))
+ORGANOID_PAGE_MAX = 500
 
 app = Flask("Organoid Review")
-CORS(app)
+CORS(app, expose_headers=['ETag', 'X-Total-Count'])
 
 socketio = SocketIO(app, cors_allowed_origins='*', async_mode='eventlet')
 
@@ -32,6 +69,33 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 UPLOAD_FOLDER = os.path.join(app.root_path, 'tiffs')
 MATLAB_FOLDER = os.path.join(app.root_path, 'matlab')
+PIPELINE_SCRIPT = os.path.join(app.root_path, 'formermatlabfunc.py')
+GLB_FOLDER = os.path.join(app.root_path, 'glbs')
+# GLB pojedynczych klatek zapisywane przez zadanie mesh: frames/<plik>/<warstwa>/frame_NNNN.glb
+FRAME_GLB_FOLDER = os.path.join(GLB_FOLDER, 'frames')
+# Musi być zgodny z FRAME_GLB_MARKER w formermatlabfunc.py
+FRAME_GLB_MARKER = 'FRAME_GLB'
+# Cache-Control dla GLB pobieranych z ?v=<wersja> (adres zmienia się razem z plikiem)
+GLB_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Prekompresowane warianty obok pliku .glb (tworzone przy publikacji), w kolejności preferencji
+GLB_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# Tabele ścieżek jąder (<plik>.tracks.npy) - muszą być zgodne z tracks_path w formermatlabfunc.py
+TRACKS_FOLDER = os.path.join(INTERNAL_DATA_FOLDER, 'output-tracks')
+# Cechy jąder (<plik>.parquet albo katalog kolumn .npy) - zgodne z morphometrics_path w morphometrics.py
+MORPHOMETRICS_FOLDER = os.path.join(INTERNAL_DATA_FOLDER, 'output-morphometrics')
+MORPHOMETRICS_PAGE_MAX = int(os.environ.get('MORPHOMETRICS_PAGE_MAX', 10000))
+# Piramidy kafli przekrojów surowego stosu (<plik>/level<L>.npy, mip<L>.npy) - budowane przez zadanie mesh
+SLICE_PYRAMID_FOLDER = os.path.join(INTERNAL_DATA_FOLDER, 'slice-pyramid')
+# Otwarte stosy (memmap + piramida) i wyrenderowane kafle na stos - LRU
+SLICE_SOURCE_CACHE_SIZE = int(os.environ.get('SLICE_SOURCE_CACHE_SIZE', 8))
+SLICE_TILE_CACHE_SIZE = int(os.environ.get('SLICE_TILE_CACHE_SIZE', 512))
+# Pliki --metrics-file z procesów pipeline'u (po wczytaniu do stage_metrics są usuwane)
+METRICS_FOLDER = os.path.join(INTERNAL_DATA_FOLDER, 'pipeline-metrics')
+# Przesyłanie porcjami (/dataset/uploads): rozmiar porcji sugerowany klientowi i ile bajtów początku pliku
+# wystarcza do sprawdzenia nagłówka ImageJ (pierwszy IFD i ImageDescription)
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+UPLOAD_VALIDATE_BYTES = int(os.environ.get('UPLOAD_VALIDATE_BYTES', 1024 * 1024))
+UPLOAD_READ_BLOCK = 1024 * 1024
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -41,9 +105,13 @@ migrate = Migrate(app, db)
 
 SERVER_STATE = {
     "status": "waiting", # waiting/processing
-    "current_task": None
+    "current_task": None,
+    "running_jobs": []
 }
 
+# job_id -> subprocess.Popen dla zadań uruchomionych przez ten proces
+RUNNING_JOBS = {}
+
 class Organoid(db.Model):
     __tablename__ = 'organoids'
     id = db.Column(db.Integer, primary_key=True)
@@ -52,6 +120,18 @@ class Organoid(db.Model):
     is_initialized = db.Column(db.Boolean, default=False)
     is_processed_glb = db.Column(db.Boolean, default=False)
     is_in_current_rd = db.Column(db.Boolean, default=False)
+    # uploading -> uploaded -> meshing -> meshed -> packaging -> published (albo failed)
+    stage = db.Column(db.String(20), nullable=True)
+
+# Pola API organoidu -> kolumny (projekcja ?fields= i sortowanie ?sort=)
+ORGANOID_FIELDS = {
+    'id': Organoid.id,
+    'name': Organoid.name,
+    'isInitialized': Organoid.is_initialized,
+    'isProcessedGlb': Organoid.is_processed_glb,
+    'isInCurrentRd': Organoid.is_in_current_rd,
+    'stage': Organoid.stage
+}
 
 class ProcessLog(db.Model):
     __tablename__ = 'process_logs'
@@ -61,6 +141,13 @@ class ProcessLog(db.Model):
     message = db.Column(db.Text)
     organoid_id = db.Column(db.Integer, db.ForeignKey('organoids.id'), nullable=True)
 
+    # Paginacja kursorem po (timestamp, id) z filtrem organoidu / poziomu
+    __table_args__ = (
+        db.Index('ix_process_logs_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_process_logs_organoid_id_timestamp', 'organoid_id', 'timestamp', 'id'),
+        db.Index('ix_process_logs_level_timestamp', 'level', 'timestamp', 'id'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -70,27 +157,554 @@ class ProcessLog(db.Model):
             'organoid_id': self.organoid_id
         }
 
+class ProcessLogArchive(db.Model):
+    """Logi po okresie retencji (te same id co w process_logs); bez klucza obcego - organoid mógł zniknąć"""
+    __tablename__ = 'process_logs_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    timestamp = db.Column(db.DateTime)
+    level = db.Column(db.String(50))
+    message = db.Column(db.Text)
+    organoid_id = db.Column(db.Integer, nullable=True)
+    archived_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_process_logs_archive_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_process_logs_archive_organoid_id_timestamp', 'organoid_id', 'timestamp', 'id'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'timestamp': self.timestamp.isoformat(),
+            'level': self.level,
+            'message': self.message,
+            'organoid_id': self.organoid_id,
+            'archived_at': self.archived_at.isoformat() if self.archived_at else None
+        }
+
+class LogRollup(db.Model):
+    """Dzienne liczniki logów (dzień, organoid, poziom) - zostają po usunięciu archiwum"""
+    __tablename__ = 'process_log_rollups'
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    organoid_id = db.Column(db.Integer, nullable=True)
+    level = db.Column(db.String(50))
+    count = db.Column(db.Integer, default=0)
+    first_timestamp = db.Column(db.DateTime)
+    last_timestamp = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_process_log_rollups_day_organoid_id_level', 'day', 'organoid_id', 'level'),
+    )
+
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'organoid_id': self.organoid_id,
+            'level': self.level,
+            'count': self.count,
+            'first_timestamp': self.first_timestamp.isoformat() if self.first_timestamp else None,
+            'last_timestamp': self.last_timestamp.isoformat() if self.last_timestamp else None
+        }
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    organoid_id = db.Column(db.Integer, db.ForeignKey('organoids.id'), nullable=True)
+    input_path = db.Column(db.String(1024), nullable=False)
+    kind = db.Column(db.String(20), nullable=False, default='mesh', server_default='mesh') # mesh, package
+    status = db.Column(db.String(20), default='queued', index=True) # queued, running, done, failed, cancelled
+    priority = db.Column(db.Integer, default=0)
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    workers = db.Column(db.Integer, nullable=True)
+    # Profil i kopia jego parametrów z chwili zlecenia (zmiana profilu nie zmienia zadań w kolejce)
+    profile = db.Column(db.String(64), nullable=True)
+    params = db.Column(db.Text, nullable=True) # JSON nadpisań DEFAULT_PARAMS
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'organoid_id': self.organoid_id,
+            'input_path': self.input_path,
+            'kind': self.kind,
+            'status': self.status,
+            'priority': self.priority,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'workers': self.workers,
+            'profile': self.profile,
+            'params': json.loads(self.params) if self.params else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class ParameterProfile(db.Model):
+    """Nazwany zestaw nadpisań DEFAULT_PARAMS (formermatlabfunc) wybierany per zadanie, np. preview / final"""
+    __tablename__ = 'parameter_profiles'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), unique=True, nullable=False)
+    description = db.Column(db.Text, nullable=True)
+    params = db.Column(db.Text, nullable=False, default='{}') # JSON
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'params': json.loads(self.params),
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class StageMetric(db.Model):
+    __tablename__ = 'stage_metrics'
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('jobs.id'), nullable=False, index=True)
+    attempt = db.Column(db.Integer, default=1)
+    frame = db.Column(db.Integer, nullable=True) # None = etap całego przebiegu (open, frames, glb, total)
+    stage = db.Column(db.String(64), nullable=False)
+    seconds = db.Column(db.Float, nullable=False)
+    rss_mb = db.Column(db.Float, nullable=True)
+    max_rss_mb = db.Column(db.Float, nullable=True)
+    pid = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'attempt': self.attempt,
+            'frame': self.frame,
+            'stage': self.stage,
+            'seconds': self.seconds,
+            'rss_mb': self.rss_mb,
+            'max_rss_mb': self.max_rss_mb,
+            'pid': self.pid
+        }
+
+class Upload(db.Model):
+    """Wznawialne przesyłanie stosu porcjami prosto do tiffs/<nazwa>.tif; organoid jest
+    inicjalizowany dopiero po complete"""
+    __tablename__ = 'uploads'
+    id = db.Column(db.Integer, primary_key=True)
+    organoid_id = db.Column(db.Integer, db.ForeignKey('organoids.id'), nullable=True)
+    filename = db.Column(db.String(255), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, default=0)
+    sha256 = db.Column(db.String(64), nullable=True) # suma całego pliku podana przez klienta (opcjonalna)
+    status = db.Column(db.String(20), default='uploading', index=True) # uploading, complete, failed, aborted
+    image_metadata = db.Column(db.Text, nullable=True) # JSON z parse_imagej_metadata po walidacji nagłówka
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'organoid_id': self.organoid_id,
+            'filename': self.filename,
+            'total_size': self.total_size,
+            'received': self.received,
+            'chunk_size': UPLOAD_CHUNK_SIZE,
+            'status': self.status,
+            'metadata': json.loads(self.image_metadata) if self.image_metadata else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class ResponseCache:
+    """Gotowe odpowiedzi JSON (treść + ETag) per zapytanie, LRU; clear() przy zmianie danych."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, payload, headers=None):
+        body = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+        entry = (body, hashlib.sha1(body.encode('utf-8')).hexdigest(), headers or {})
+        self.entries[key] = entry
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        self.entries.clear()
+
+ORGANOID_CACHE = ResponseCache(ORGANOID_CACHE_SIZE)
+
+@event.listens_for(db.session, 'after_flush')
+def mark_organoid_changes(session, flush_context):
+    if any(isinstance(obj, Organoid) for obj in itertools.chain(session.new, session.dirty, session.deleted)):
+        session.info['organoids_changed'] = True
+
+# Czyszczenie dopiero po commicie - inaczej równoległe żądanie mogłoby zapisać w cache stan sprzed commitu
+@event.listens_for(db.session, 'after_commit')
+def invalidate_organoid_cache(session):
+    if session.info.pop('organoids_changed', False):
+        ORGANOID_CACHE.clear()
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_organoid_changes(session):
+    session.info.pop('organoids_changed', None)
+
+class LogSink:
+    """Buforowany zapis logów: wiersze ProcessLog idą do bazy paczkami (bulk insert), a do klientów
+    jedno zdarzenie 'server_logs' z listą wpisów zamiast commit + emit na każdą linię."""
+
+    def __init__(self, flush_size=LOG_FLUSH_SIZE, flush_interval=LOG_FLUSH_INTERVAL, max_buffer=LOG_BUFFER_MAX):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer = []
+        self._flusher = None
+
+    def add(self, level, message, organoid_id=None):
+        self._buffer.append({
+            'timestamp': datetime.datetime.utcnow(),
+            'level': level,
+            'message': message,
+            'organoid_id': organoid_id
+        })
+        if self._flusher is None:
+            self._flusher = socketio.start_background_task(self._flush_loop)
+        if len(self._buffer) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        # Podmiana bufora przed I/O - wpisy dodane w trakcie zapisu trafią do następnej paczki
+        rows, self._buffer = self._buffer, []
+        if not rows:
+            return
+        socketio.emit('server_logs', [dict(row, timestamp=row['timestamp'].isoformat()) for row in rows])
+        with app.app_context():
+            try:
+                db.session.bulk_insert_mappings(ProcessLog, rows)
+                db.session.commit()
+            except Exception as e:
+                print(f"Błąd zapisu logów do DB ({len(rows)} wpisów): {e}")
+                db.session.rollback()
+                # Ponowna próba przy następnym flushu; najstarsze wpisy odpadają, gdy bufor jest pełny
+                self._buffer = (rows + self._buffer)[-self.max_buffer:]
+
+    def _flush_loop(self):
+        while True:
+            socketio.sleep(self.flush_interval)
+            self.flush()
+
+LOG_SINK = LogSink()
+atexit.register(LOG_SINK.flush)
+
 def broadcast_log(message, level="INFO", organoid_id=None):
     print(f"[{level}] {message}")
-    
-    socketio.emit('server_log', {
-        'timestamp': datetime.datetime.utcnow().isoformat(),
-        'level': level,
-        'message': message,
-        'organoid_id': organoid_id
+    LOG_SINK.add(level, message, organoid_id)
+
+def refresh_server_state():
+    running = sorted(RUNNING_JOBS)
+    state = {
+        "status": "processing" if running else "waiting",
+        "current_task": ", ".join(f"Job ID: {job_id}" for job_id in running) or None,
+        "running_jobs": running
+    }
+    # 'server_state' tylko przy faktycznej zmianie (nowi klienci dostają stan przy 'connect')
+    if state != SERVER_STATE:
+        SERVER_STATE.update(state)
+        socketio.emit('server_state', SERVER_STATE)
+
+def set_organoid_stage(organoid_id, stage, **flags):
+    """Przejście organoidu między etapami: zapis etapu i flag + zdarzenie 'organoid_stage' dla klientów."""
+    organoid = db.session.get(Organoid, organoid_id) if organoid_id else None
+    if organoid is None:
+        return
+    organoid.stage = stage
+    for key, value in flags.items():
+        setattr(organoid, key, value)
+    db.session.commit()
+    socketio.emit('organoid_stage', {
+        'organoid_id': organoid.id,
+        'stage': organoid.stage,
+        'isInitialized': organoid.is_initialized,
+        'isProcessedGlb': organoid.is_processed_glb
     })
-    
-    socketio.emit('server_state', SERVER_STATE)
 
-    # W funkcji wątku użyjemy app.app_context(), tutaj zakładamy, że jest dostępne
+def validate_pipeline_params(params):
+    """ValueError, gdy nadpisania nie pasują do DEFAULT_PARAMS pipeline'u."""
+    from formermatlabfunc import resolve_params
+
+    if not isinstance(params, dict):
+        raise ValueError("Parametry muszą być obiektem JSON")
+    resolve_params(params)
+
+def resolve_job_params(profile_name=None, overrides=None):
+    """(profil, nadpisania) dla zadania: parametry profilu z bazy + 'params' z żądania.
+    ValueError = nieznany profil albo parametr."""
+    profile_name = profile_name or DEFAULT_PROFILE
+    profile = ParameterProfile.query.filter_by(name=profile_name).first()
+    if profile is None and profile_name != DEFAULT_PROFILE:
+        raise ValueError(f"Nieznany profil parametrów: {profile_name}")
+    params = json.loads(profile.params) if profile is not None else {}
+    if overrides is not None:
+        if not isinstance(overrides, dict):
+            raise ValueError("Parametry muszą być obiektem JSON")
+        params.update(overrides)
+    validate_pipeline_params(params)
+    return profile_name, params
+
+def submit_job(input_path, organoid_id=None, priority=0, max_attempts=3, workers=None, kind='mesh', profile=None,
+               params=None):
+    job = Job(input_path=input_path, organoid_id=organoid_id, priority=priority,
+              max_attempts=max_attempts, workers=workers, kind=kind, profile=profile,
+              params=json.dumps(params) if params is not None else None)
+    db.session.add(job)
+    db.session.commit()
+    broadcast_log(f"Zadanie {job.id} ({kind}, profil {profile or DEFAULT_PROFILE}) dodane do kolejki: "
+                  f"{os.path.basename(input_path)}", "INFO", organoid_id)
+    return job
+
+def start_job(job):
+    job.status = 'running'
+    job.attempts += 1
+    job.started_at = datetime.datetime.utcnow()
+    job.finished_at = None
+    db.session.commit()
+
+    workers = job.workers if job.workers is not None else PIPELINE_WORKERS
+    cmd = [sys.executable, '-u', PIPELINE_SCRIPT, job.input_path, INTERNAL_DATA_FOLDER,
+           '--workers', str(workers), '--metrics-file', job_metrics_path(job)]
+    if job.kind == 'package':
+        # GLB z klatek zapisanych przez zadanie mesh (manifest), bez ponownej segmentacji
+        cmd += ['--package-only', '--glb-folder', GLB_FOLDER]
+    else:
+        cmd += ['--frame-glb-folder', FRAME_GLB_FOLDER, '--slice-pyramid-folder', SLICE_PYRAMID_FOLDER]
+    if job.params:
+        cmd += ['--params', job.params]
+    if job.profile:
+        cmd += ['--profile', job.profile]
+    # Osobna sesja, żeby anulowanie zabiło także procesy puli
+    try:
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+            start_new_session=True
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        # Bez procesu zadanie nie może zostać 'running' - zajmowałoby slot do restartu serwera
+        job.status = 'failed'
+        job.error = f"Nie udało się uruchomić procesu: {e}"
+        job.finished_at = datetime.datetime.utcnow()
+        db.session.commit()
+        broadcast_log(f"Zadanie {job.id} nie wystartowało: {e}", "ERROR", job.organoid_id)
+        set_organoid_stage(job.organoid_id, 'failed')
+        refresh_server_state()
+        return
+    RUNNING_JOBS[job.id] = process
+    refresh_server_state()
+    set_organoid_stage(job.organoid_id, 'packaging' if job.kind == 'package' else 'meshing')
+    broadcast_log(f"Start zadania {job.id} (próba {job.attempts}/{job.max_attempts})", "INFO", job.organoid_id)
+    socketio.start_background_task(watch_job, job.id, job.organoid_id, process)
+
+def watch_job(job_id, organoid_id, process):
+    with app.app_context():
+        # Czytanie logów na żywo (stdout jest nieblokujący pod eventletem)
+        for line in iter(process.stdout.readline, ''):
+            line = line.strip()
+            if line.startswith(FRAME_GLB_MARKER + ' '):
+                announce_frame(job_id, organoid_id, line)
+            elif line:
+                broadcast_log(line, "PIPELINE", organoid_id)
+
+        process.stdout.close()
+        return_code = process.wait()
+        RUNNING_JOBS.pop(job_id, None)
+
+        job = db.session.get(Job, job_id)
+        ingest_job_metrics(job)
+        if job.status == 'cancelled':
+            pass
+        elif return_code == 0:
+            job.status = 'done'
+            job.error = None
+            broadcast_log(f"Zadanie {job_id} zakończone sukcesem.", "SUCCESS", organoid_id)
+            advance_pipeline(job)
+        elif job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.error = f"Kod wyjścia {return_code}"
+            broadcast_log(f"Zadanie {job_id} zakończone błędem (kod {return_code}), ponawiam.", "ERROR", organoid_id)
+        else:
+            job.status = 'failed'
+            job.error = f"Kod wyjścia {return_code}"
+            broadcast_log(f"Zadanie {job_id} nie powiodło się (kod {return_code}).", "ERROR", organoid_id)
+            set_organoid_stage(organoid_id, 'failed')
+        job.finished_at = datetime.datetime.utcnow()
+        db.session.commit()
+        refresh_server_state()
+
+def advance_pipeline(job):
+    """Po udanym meshowaniu kolejkuje pakowanie GLB; po pakowaniu organoid jest opublikowany."""
+    if job.kind == 'package':
+        set_organoid_stage(job.organoid_id, 'published', is_processed_glb=True)
+        return
+    set_organoid_stage(job.organoid_id, 'meshed')
+    submit_job(job.input_path, organoid_id=job.organoid_id, priority=job.priority,
+               max_attempts=job.max_attempts, workers=job.workers, kind='package', profile=job.profile,
+               params=json.loads(job.params) if job.params else None)
+
+def announce_frame(job_id, organoid_id, line):
+    """'FRAME_GLB <t> outer,inner' z pipeline'u -> zdarzenie 'frame_available' (klatkę można już pobrać)."""
     try:
-        new_log = ProcessLog(level=level, message=message, organoid_id=organoid_id)
-        db.session.add(new_log)
+        _, frame, layers = line.split(' ', 2)
+        frame = int(frame)
+    except ValueError:
+        print(f"Nieprawidłowa linia klatki: {line}")
+        return
+    socketio.emit('frame_available', {
+        'job_id': job_id,
+        'organoid_id': organoid_id,
+        'frame': frame,
+        'layers': layers.split(',')
+    })
+
+def job_metrics_path(job):
+    return os.path.join(METRICS_FOLDER, f"job-{job.id}-{job.attempts}.json")
+
+def ingest_job_metrics(job):
+    """Czasy etapów z pliku --metrics-file (także po błędzie / anulowaniu) -> stage_metrics."""
+    path = job_metrics_path(job)
+    if not os.path.isfile(path):
+        return
+    try:
+        with open(path) as f:
+            records = json.load(f).get('records', [])
+        db.session.bulk_insert_mappings(StageMetric, [
+            {'job_id': job.id, 'attempt': job.attempts, 'frame': r.get('frame'), 'stage': r['stage'],
+             'seconds': r['seconds'], 'rss_mb': r.get('rss_mb'), 'max_rss_mb': r.get('max_rss_mb'), 'pid': r.get('pid')}
+            for r in records
+        ])
         db.session.commit()
+        os.remove(path)
     except Exception as e:
-        print(f"Błąd zapisu logu do DB: {e}")
+        print(f"Błąd wczytywania metryk zadania {job.id}: {e}")
         db.session.rollback()
 
+def cancel_job(job):
+    if job.status not in ('queued', 'running'):
+        return False
+    was_running = job.status == 'running'
+    job.status = 'cancelled'
+    job.finished_at = datetime.datetime.utcnow()
+    db.session.commit()
+
+    process = RUNNING_JOBS.get(job.id)
+    if was_running and process is not None:
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    broadcast_log(f"Zadanie {job.id} anulowane.", "INFO", job.organoid_id)
+    # Organoid wraca na ostatni ukończony etap
+    set_organoid_stage(job.organoid_id, 'meshed' if job.kind == 'package' else 'uploaded')
+    return True
+
+def scheduler_loop():
+    with app.app_context():
+        # Wznowienie: zadania przerwane restartem serwera wracają do kolejki
+        interrupted = Job.query.filter_by(status='running').all()
+        for job in interrupted:
+            job.status = 'queued'
+        db.session.commit()
+        if interrupted:
+            broadcast_log(f"Wznawiam {len(interrupted)} przerwanych zadań.", "INFO")
+
+    while True:
+        with app.app_context():
+            try:
+                # Każdy rodzaj zadań ma własne sloty - etapy różnych organoidów idą równolegle
+                for kind, slots in JOB_SLOTS.items():
+                    free_slots = slots - Job.query.filter_by(status='running', kind=kind).count()
+                    if free_slots <= 0:
+                        continue
+                    jobs = (Job.query.filter_by(status='queued', kind=kind)
+                            .order_by(Job.priority.desc(), Job.id.asc())
+                            .limit(free_slots).all())
+                    for job in jobs:
+                        start_job(job)
+            except Exception as e:
+                print(f"Błąd schedulera: {e}")
+                db.session.rollback()
+        socketio.sleep(SCHEDULER_INTERVAL)
+
+def archive_old_logs(now=None):
+    """Jeden przebieg retencji: paczkami przenosi stare logi do archiwum i dolicza je do dziennych podsumowań.
+    Zwraca liczbę przeniesionych wierszy."""
+    now = now or datetime.datetime.utcnow()
+    cutoff = now - datetime.timedelta(days=LOG_RETENTION_DAYS)
+    moved = 0
+    while True:
+        rows = (ProcessLog.query.filter(ProcessLog.timestamp < cutoff)
+                .order_by(ProcessLog.timestamp, ProcessLog.id).limit(LOG_RETENTION_BATCH).all())
+        if not rows:
+            break
+
+        rollups = {}
+        for row in rows:
+            key = (row.timestamp.date(), row.organoid_id, row.level)
+            count, first, last = rollups.get(key, (0, row.timestamp, row.timestamp))
+            rollups[key] = (count + 1, min(first, row.timestamp), max(last, row.timestamp))
+        for (day, organoid_id, level), (count, first, last) in rollups.items():
+            same_organoid = (LogRollup.organoid_id.is_(None) if organoid_id is None
+                             else LogRollup.organoid_id == organoid_id)
+            rollup = LogRollup.query.filter(LogRollup.day == day, same_organoid, LogRollup.level == level).first()
+            if rollup is None:
+                db.session.add(LogRollup(day=day, organoid_id=organoid_id, level=level, count=count,
+                                         first_timestamp=first, last_timestamp=last))
+            else:
+                rollup.count += count
+                rollup.first_timestamp = min(rollup.first_timestamp, first)
+                rollup.last_timestamp = max(rollup.last_timestamp, last)
+
+        db.session.bulk_insert_mappings(ProcessLogArchive, [
+            {'id': row.id, 'timestamp': row.timestamp, 'level': row.level, 'message': row.message,
+             'organoid_id': row.organoid_id, 'archived_at': now}
+            for row in rows
+        ])
+        ProcessLog.query.filter(ProcessLog.id.in_([row.id for row in rows])).delete(synchronize_session=False)
+        db.session.commit()
+        moved += len(rows)
+
+    if LOG_ARCHIVE_DAYS:
+        archive_cutoff = now - datetime.timedelta(days=LOG_ARCHIVE_DAYS)
+        ProcessLogArchive.query.filter(ProcessLogArchive.timestamp < archive_cutoff).delete(synchronize_session=False)
+        db.session.commit()
+    return moved
+
+def retention_loop():
+    while True:
+        with app.app_context():
+            try:
+                moved = archive_old_logs()
+                if moved:
+                    print(f"Retencja logów: przeniesiono {moved} wpisów do archiwum")
+            except Exception as e:
+                print(f"Błąd retencji logów: {e}")
+                db.session.rollback()
+        socketio.sleep(LOG_RETENTION_INTERVAL)
+
 # def run_matlab_task(organoid_id, filename_base):
 #     global SERVER_STATE
     
@@ -148,10 +762,83 @@ def index():
 @app.route('/logs/recent', methods=['GET'])
 def get_recent_logs():
     """Zwraca 10 ostatnich logów"""
-    logs = ProcessLog.query.order_by(ProcessLog.timestamp.desc()).limit(10).all()
+    LOG_SINK.flush()
+    logs = ProcessLog.query.order_by(ProcessLog.timestamp.desc(), ProcessLog.id.desc()).limit(10).all()
     # Odwracamy kolejność, żeby na froncie najnowsze były na dole (chyba że wolisz odwrotnie)
     return jsonify([log.to_dict() for log in logs][::-1])
 
+def encode_log_cursor(log):
+    return base64.urlsafe_b64encode(f"{log.timestamp.isoformat()}|{log.id}".encode()).decode()
+
+def decode_log_cursor(cursor):
+    timestamp, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.datetime.fromisoformat(timestamp), int(log_id)
+
+@app.route('/logs', methods=['GET'])
+def get_logs():
+    """Logi stronicowane kursorem (timestamp, id).
+    Filtry: organoid_id, level (lista po przecinku), since / until (ISO 8601), archived=1 (archiwum).
+    order=desc (domyślnie, najnowsze najpierw) albo asc; limit <= LOG_PAGE_MAX; cursor z poprzedniej strony."""
+    LOG_SINK.flush()
+    model = ProcessLogArchive if request.args.get('archived', type=int) else ProcessLog
+    query = model.query
+
+    organoid_id = request.args.get('organoid_id', type=int)
+    if organoid_id is not None:
+        query = query.filter(model.organoid_id == organoid_id)
+    levels = [level for level in request.args.get('level', '').split(',') if level]
+    if levels:
+        query = query.filter(model.level.in_(levels))
+    try:
+        since = request.args.get('since')
+        until = request.args.get('until')
+        if since:
+            query = query.filter(model.timestamp >= datetime.datetime.fromisoformat(since))
+        if until:
+            query = query.filter(model.timestamp < datetime.datetime.fromisoformat(until))
+        cursor = decode_log_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except (ValueError, TypeError, binascii.Error):
+        return jsonify({'error': 'Nieprawidłowy parametr since / until / cursor'}), 400
+
+    descending = request.args.get('order', 'desc') != 'asc'
+    if cursor:
+        timestamp, log_id = cursor
+        if descending:
+            query = query.filter(db.or_(model.timestamp < timestamp,
+                                        db.and_(model.timestamp == timestamp, model.id < log_id)))
+        else:
+            query = query.filter(db.or_(model.timestamp > timestamp,
+                                        db.and_(model.timestamp == timestamp, model.id > log_id)))
+    if descending:
+        query = query.order_by(model.timestamp.desc(), model.id.desc())
+    else:
+        query = query.order_by(model.timestamp.asc(), model.id.asc())
+
+    limit = max(1, min(request.args.get('limit', 100, type=int), LOG_PAGE_MAX))
+    # Jeden wiersz więcej mówi, czy jest następna strona
+    logs = query.limit(limit + 1).all()
+    next_cursor = encode_log_cursor(logs[limit - 1]) if len(logs) > limit else None
+    return jsonify({'logs': [log.to_dict() for log in logs[:limit]], 'next_cursor': next_cursor})
+
+@app.route('/logs/rollups', methods=['GET'])
+def get_log_rollups():
+    """Dzienne liczniki zarchiwizowanych logów (filtry: organoid_id, level, since / until jako daty)"""
+    query = LogRollup.query
+    organoid_id = request.args.get('organoid_id', type=int)
+    if organoid_id is not None:
+        query = query.filter(LogRollup.organoid_id == organoid_id)
+    if request.args.get('level'):
+        query = query.filter(LogRollup.level.in_(request.args['level'].split(',')))
+    try:
+        if request.args.get('since'):
+            query = query.filter(LogRollup.day >= datetime.date.fromisoformat(request.args['since']))
+        if request.args.get('until'):
+            query = query.filter(LogRollup.day < datetime.date.fromisoformat(request.args['until']))
+    except ValueError:
+        return jsonify({'error': 'Nieprawidłowy parametr since / until'}), 400
+    rollups = query.order_by(LogRollup.day.desc(), LogRollup.id).limit(LOG_PAGE_MAX).all()
+    return jsonify([rollup.to_dict() for rollup in rollups])
+
 @app.route('/server/state', methods=['GET'])
 def get_server_state():
     """Zwraca aktualny stan (czy mieli dane)"""
@@ -159,21 +846,208 @@ def get_server_state():
 
 @app.route('/process/<int:organoid_id>', methods=['POST'])
 def trigger_processing(organoid_id):
-    if SERVER_STATE["status"] != "idle":
-        return jsonify({'error': 'Serwer jest zajęty innym zadaniem'}), 429
-
-    organoid = Organoid.query.get(organoid_id)
+    organoid = db.session.get(Organoid, organoid_id)
     if not organoid:
         return jsonify({'error': 'Nie znaleziono organoidu'}), 404
 
-    # Uruchamiamy wątek w tle
-    thread = threading.Thread(target=run_matlab_task, args=(organoid.id, organoid.filename))
-    thread.start()
+    data = request.get_json(silent=True) or {}
+    try:
+        profile, params = resolve_job_params(data.get('profile'), data.get('params'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    tiff_path = os.path.join(app.config['UPLOAD_FOLDER'], organoid.filename + '.tif')
+    job = submit_job(tiff_path, organoid_id=organoid.id, priority=data.get('priority', 0),
+                     workers=data.get('workers'), profile=profile, params=params)
+
+    return jsonify({'message': 'Zadanie dodane do kolejki', 'organoid': organoid.name, 'job': job.to_dict()}), 202
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    data = request.get_json(silent=True) or {}
+    organoid_id = data.get('organoid_id')
+    file_path = data.get('file_path')
+
+    if organoid_id is not None:
+        organoid = db.session.get(Organoid, organoid_id)
+        if not organoid:
+            return jsonify({'error': 'Nie znaleziono organoidu'}), 404
+        input_path = os.path.join(app.config['UPLOAD_FOLDER'], organoid.filename + '.tif')
+    elif file_path:
+        input_path = os.path.join(INTERNAL_DATA_FOLDER, file_path)
+    else:
+        return jsonify({'error': "Brakuje parametru 'organoid_id' lub 'file_path'"}), 400
+
+    if not os.path.exists(input_path):
+        return jsonify({'error': f"File not found: {input_path}"}), 404
+    try:
+        profile, params = resolve_job_params(data.get('profile'), data.get('params'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    job = submit_job(input_path, organoid_id=organoid_id, priority=data.get('priority', 0),
+                     max_attempts=data.get('max_attempts', 3), workers=data.get('workers'),
+                     profile=profile, params=params)
+    return jsonify(job.to_dict()), 202
+
+@app.route('/jobs', methods=['GET'])
+def get_jobs():
+    query = Job.query
+    status = request.args.get('status')
+    if status:
+        query = query.filter_by(status=status)
+    kind = request.args.get('kind')
+    if kind:
+        query = query.filter_by(kind=kind)
+    limit = max(1, min(request.args.get('limit', 50, type=int), LOG_PAGE_MAX))
+    jobs = query.order_by(Job.id.desc()).limit(limit).all()
+    return jsonify([job.to_dict() for job in jobs])
+
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({'error': 'Nie znaleziono zadania'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<int:job_id>/metrics', methods=['GET'])
+def get_job_metrics(job_id):
+    """Czasy etapów zadania: podsumowanie per etap i rekordy per klatka (?attempt=, domyślnie ostatnia próba)"""
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({'error': 'Nie znaleziono zadania'}), 404
+
+    attempt = request.args.get('attempt', type=int)
+    if attempt is None:
+        attempt = db.session.query(db.func.max(StageMetric.attempt)).filter_by(job_id=job_id).scalar()
+    query = StageMetric.query.filter_by(job_id=job_id, attempt=attempt)
+
+    rows = (query.with_entities(StageMetric.stage, db.func.count(StageMetric.id), db.func.sum(StageMetric.seconds),
+                                db.func.max(StageMetric.seconds), db.func.max(StageMetric.max_rss_mb))
+            .group_by(StageMetric.stage).all())
+    stages = {stage: {'count': count, 'total_seconds': total, 'mean_seconds': total / count if count else None,
+                      'max_seconds': longest, 'max_rss_mb': rss}
+              for stage, count, total, longest, rss in rows}
+    records = query.order_by(StageMetric.frame, StageMetric.id).all()
+    return jsonify({'job_id': job_id, 'attempt': attempt, 'stages': stages,
+                    'records': [record.to_dict() for record in records]})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Ekspozycja tekstowa Prometheusa: kolejka zadań i sumaryczne czasy etapów pipeline'u"""
+    lines = [
+        '# HELP organoid_jobs Number of pipeline jobs by status.',
+        '# TYPE organoid_jobs gauge'
+    ]
+    for status, count in db.session.query(Job.status, db.func.count(Job.id)).group_by(Job.status).all():
+        lines.append(f'organoid_jobs{{status="{status}"}} {count}')
+    lines += [
+        '# HELP organoid_running_jobs Pipeline processes started by this server.',
+        '# TYPE organoid_running_jobs gauge',
+        f'organoid_running_jobs {len(RUNNING_JOBS)}'
+    ]
+
+    rows = (db.session.query(StageMetric.stage, db.func.count(StageMetric.id), db.func.sum(StageMetric.seconds),
+                             db.func.max(StageMetric.max_rss_mb))
+            .group_by(StageMetric.stage).order_by(StageMetric.stage).all())
+    lines += [
+        '# HELP organoid_pipeline_stage_seconds Time spent in pipeline stages (per frame or per run).',
+        '# TYPE organoid_pipeline_stage_seconds summary'
+    ]
+    for stage, count, total, _ in rows:
+        lines.append(f'organoid_pipeline_stage_seconds_sum{{stage="{stage}"}} {total or 0.0}')
+        lines.append(f'organoid_pipeline_stage_seconds_count{{stage="{stage}"}} {count}')
+    lines += [
+        '# HELP organoid_pipeline_stage_max_rss_megabytes Peak resident memory of the process after the stage.',
+        '# TYPE organoid_pipeline_stage_max_rss_megabytes gauge'
+    ]
+    for stage, _, _, rss in rows:
+        if rss is not None:
+            lines.append(f'organoid_pipeline_stage_max_rss_megabytes{{stage="{stage}"}} {rss}')
+
+    # Ostatnie zadanie z metrykami - do wychwytywania regresji po zmianie parametrów
+    last_job_id = db.session.query(db.func.max(StageMetric.job_id)).scalar()
+    if last_job_id is not None:
+        lines += [
+            '# HELP organoid_pipeline_last_job_stage_seconds Total stage time of the most recent measured job.',
+            '# TYPE organoid_pipeline_last_job_stage_seconds gauge'
+        ]
+        last_rows = (db.session.query(StageMetric.stage, db.func.sum(StageMetric.seconds))
+                     .filter_by(job_id=last_job_id).group_by(StageMetric.stage).order_by(StageMetric.stage).all())
+        for stage, total in last_rows:
+            lines.append(f'organoid_pipeline_last_job_stage_seconds{{job_id="{last_job_id}",stage="{stage}"}} {total}')
+
+    return app.response_class('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/profiles', methods=['GET'])
+def get_profiles():
+    profiles = ParameterProfile.query.order_by(ParameterProfile.name.asc()).all()
+    return jsonify([profile.to_dict() for profile in profiles])
+
+@app.route('/profiles/<string:name>', methods=['GET'])
+def get_profile(name):
+    profile = ParameterProfile.query.filter_by(name=name).first()
+    if profile is None:
+        return jsonify({'error': 'Nie znaleziono profilu'}), 404
+    return jsonify(profile.to_dict())
+
+@app.route('/profiles', methods=['POST'])
+def create_profile():
+    data = request.get_json(silent=True) or {}
+    name = data.get('name')
+    params = data.get('params', {})
+    if not name:
+        return jsonify({'error': "Brakuje parametru 'name'"}), 400
+    if ParameterProfile.query.filter_by(name=name).first():
+        return jsonify({'error': 'Profil o tej nazwie już istnieje'}), 409
+    try:
+        validate_pipeline_params(params)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    profile = ParameterProfile(name=name, description=data.get('description'), params=json.dumps(params))
+    db.session.add(profile)
+    db.session.commit()
+    return jsonify(profile.to_dict()), 201
+
+@app.route('/profiles/<string:name>', methods=['PUT'])
+def update_profile(name):
+    profile = ParameterProfile.query.filter_by(name=name).first()
+    if profile is None:
+        return jsonify({'error': 'Nie znaleziono profilu'}), 404
+    data = request.get_json(silent=True) or {}
+    if 'params' in data:
+        try:
+            validate_pipeline_params(data['params'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        profile.params = json.dumps(data['params'])
+    if 'description' in data:
+        profile.description = data['description']
+    db.session.commit()
+    return jsonify(profile.to_dict())
+
+@app.route('/profiles/<string:name>', methods=['DELETE'])
+def delete_profile(name):
+    # Zadania mają własną kopię parametrów, więc usunięcie profilu ich nie zmienia
+    profile = ParameterProfile.query.filter_by(name=name).first()
+    if profile is None:
+        return jsonify({'error': 'Nie znaleziono profilu'}), 404
+    db.session.delete(profile)
+    db.session.commit()
+    return jsonify({'message': 'Profil usunięty'})
 
-    return jsonify({'message': 'Proces uruchomiony w tle', 'organoid': organoid.name}), 202
+@app.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job_endpoint(job_id):
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({'error': 'Nie znaleziono zadania'}), 404
+    if not cancel_job(job):
+        return jsonify({'error': f"Zadanie ma status '{job.status}'"}), 409
+    return jsonify(job.to_dict())
 
 @app.route('/dataset/', methods=['POST'])
 def upload_dataset():
+    # Stary upload jednym żądaniem multipart; duże stosy -> /dataset/uploads
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     file = request.files['file']
@@ -182,37 +1056,300 @@ def upload_dataset():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     if file and name:
+        save_path = None
         try:
-            # Tu zapisz plik i dodaj wpis do bazy danych
             safe_base_name = secure_filename(name.replace(" ", "_"))
             tiff_filename = safe_base_name + ".tif"
             save_path = os.path.join(app.config['UPLOAD_FOLDER'], tiff_filename)
-            new_organoid = Organoid(name=name, filename=safe_base_name)
+            # Najpierw plik, potem wpis w bazie - organoid nie istnieje bez danych na dysku
+            file.save(save_path)
+            print(f"Otrzymano plik: {file.filename} dla zbioru: {name}")
+            new_organoid = Organoid(name=name, filename=safe_base_name, is_initialized=True, stage='uploaded')
             db.session.add(new_organoid)
             db.session.commit()
 
             print(f"Dodano do bazy: {name} (ID: {new_organoid.id})")
-            file.save(save_path)
-            print(f"Otrzymano plik: {file.filename} dla zbioru: {name}")
-            return jsonify({'message': 'Success'}), 200
         except Exception as e:
             db.session.rollback()
+            if save_path and os.path.exists(save_path):
+                os.remove(save_path)
             print(f"Błąd: {str(e)}")
             return jsonify({'error': str(e)}), 500
+        # Poza try - wpis już jest w bazie, więc błąd kolejki nie może usunąć jego pliku TIFF
+        start_organoid_pipeline(new_organoid)
+        return jsonify({'message': 'Success'}), 200
     return jsonify({'error': 'Invalid data'}), 400
 
+def start_organoid_pipeline(organoid):
+    """Przesłany zbiór -> kolejka meshowania (dalej advance_pipeline: pakowanie GLB i publikacja)."""
+    if not AUTO_PROCESS_UPLOADS:
+        return None
+    tiff_path = os.path.join(app.config['UPLOAD_FOLDER'], organoid.filename + '.tif')
+    profile, params = resolve_job_params()
+    return submit_job(tiff_path, organoid_id=organoid.id, profile=profile, params=params)
+
+def upload_path(upload):
+    return os.path.join(app.config['UPLOAD_FOLDER'], upload.filename)
+
+def validate_upload_header(path, received, total_size, final=False):
+    """Metadane ImageJ z początku przesyłanego pliku. None = pierwszy IFD / opis jeszcze nie dotarł
+    (tylko gdy final=False), ValueError = plik na pewno nie nadaje się do pipeline'u."""
+    import tifffile
+    from formermatlabfunc import parse_imagej_metadata
+
+    try:
+        tif = tifffile.TiffFile(path)
+    except Exception as e:
+        if final:
+            raise ValueError(f"Nieprawidłowy plik TIFF: {e}")
+        return None
+    with tif:
+        page = tif.pages[0]
+        description = page.tags.get('ImageDescription')
+        if not final and (page.offset >= received or
+                          (description is not None and description.valueoffset + description.count > received)):
+            return None
+        if description is None or not tif.is_imagej:
+            raise ValueError("Plik nie jest stosem ImageJ (brak opisu ImageJ w nagłówku)")
+        metadata = parse_imagej_metadata(tif)
+        if len(page.shape) != 2 or page.dtype is None:
+            raise ValueError(f"Nieobsługiwany format płaszczyzny: {page.shape}")
+        metadata.update({'height': int(page.shape[0]), 'width': int(page.shape[1]), 'dtype': str(page.dtype)})
+        data_size = (metadata['frames'] * metadata['slices'] * metadata['channels'] *
+                     page.shape[0] * page.shape[1] * page.dtype.itemsize)
+        if data_size > total_size:
+            raise ValueError(f"Nagłówek opisuje {data_size} B danych, a plik ma {total_size} B")
+    return metadata
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(UPLOAD_READ_BLOCK), b''):
+            digest.update(block)
+            eventlet.sleep(0)
+    return digest.hexdigest()
+
+def discard_upload(upload, status, error=None):
+    """Kończy nieudane / przerwane przesyłanie: usuwa plik i niezainicjalizowany organoid."""
+    upload.status = status
+    upload.error = error
+    path = upload_path(upload)
+    if os.path.exists(path):
+        os.remove(path)
+    organoid = db.session.get(Organoid, upload.organoid_id) if upload.organoid_id else None
+    if organoid is not None and not organoid.is_initialized:
+        upload.organoid_id = None
+        db.session.delete(organoid)
+    db.session.commit()
+    if error:
+        broadcast_log(f"Odrzucono przesyłany plik {upload.filename}: {error}", "ERROR")
+
+@app.route('/dataset/uploads', methods=['POST'])
+def create_upload():
+    data = request.get_json(silent=True) or {}
+    name = data.get('name')
+    size = data.get('size')
+    checksum = data.get('sha256')
+    if not name or not isinstance(size, int) or size <= 0:
+        return jsonify({'error': 'Wymagane pola: name, size (> 0)'}), 400
+
+    safe_base_name = secure_filename(name.replace(" ", "_"))
+    if not safe_base_name:
+        return jsonify({'error': 'Nieprawidłowa nazwa zbioru'}), 400
+    tiff_filename = safe_base_name + ".tif"
+
+    # Ten sam plik w trakcie przesyłania - klient wznawia od 'received'
+    pending = Upload.query.filter_by(filename=tiff_filename, status='uploading').first()
+    if pending is not None:
+        if pending.total_size != size:
+            return jsonify({'error': 'Trwa przesyłanie innego pliku o tej nazwie', 'upload': pending.to_dict()}), 409
+        return jsonify(pending.to_dict()), 200
+
+    save_path = os.path.join(app.config['UPLOAD_FOLDER'], tiff_filename)
+    if os.path.exists(save_path) or Organoid.query.filter_by(filename=safe_base_name).first():
+        return jsonify({'error': 'Zbiór o tej nazwie już istnieje'}), 409
+
+    organoid = Organoid(name=name, filename=safe_base_name, is_initialized=False, stage='uploading')
+    db.session.add(organoid)
+    db.session.flush()
+    upload = Upload(organoid_id=organoid.id, filename=tiff_filename, total_size=size, received=0,
+                    sha256=checksum.lower() if checksum else None)
+    db.session.add(upload)
+    # Pusty plik docelowy - porcje są dopisywane od razu w miejscu końcowym, bez składania z części
+    open(save_path, 'wb').close()
+    db.session.commit()
+    return jsonify(upload.to_dict()), 201
+
+@app.route('/dataset/uploads/<int:upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    upload = db.session.get(Upload, upload_id)
+    if upload is None:
+        return jsonify({'error': 'Nie znaleziono przesyłania'}), 404
+    return jsonify(upload.to_dict())
+
+@app.route('/dataset/uploads/<int:upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Porcja = surowe bajty w ciele żądania; Upload-Offset musi równać się 'received',
+    opcjonalny X-Chunk-Sha256 (hex) jest sprawdzany przed przesunięciem 'received'."""
+    upload = db.session.get(Upload, upload_id)
+    if upload is None:
+        return jsonify({'error': 'Nie znaleziono przesyłania'}), 404
+    if upload.status != 'uploading':
+        return jsonify({'error': f'Przesyłanie ma status {upload.status}', 'upload': upload.to_dict()}), 409
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', request.args.get('offset')))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Brak lub nieprawidłowy Upload-Offset'}), 400
+    if offset != upload.received:
+        return jsonify({'error': 'Offset porcji nie zgadza się z odebranymi danymi',
+                        'received': upload.received}), 409
+
+    expected_checksum = request.headers.get('X-Chunk-Sha256')
+    digest = hashlib.sha256()
+    end = offset
+    path = upload_path(upload)
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        # Strumieniowo z ciała żądania do pliku - porcja nie jest trzymana w pamięci w całości
+        for block in iter(lambda: request.stream.read(UPLOAD_READ_BLOCK), b''):
+            if end + len(block) > upload.total_size:
+                f.truncate(upload.received)
+                return jsonify({'error': 'Porcja wykracza poza zadeklarowany rozmiar pliku',
+                                'received': upload.received}), 413
+            f.write(block)
+            digest.update(block)
+            end += len(block)
+        if expected_checksum and digest.hexdigest() != expected_checksum.lower():
+            f.truncate(upload.received)
+            return jsonify({'error': 'Suma kontrolna porcji się nie zgadza', 'received': upload.received}), 400
+
+    upload.received = end
+    # Walidacja nagłówka, gdy tylko dotrze początek pliku - zły plik odrzucamy przed przesłaniem reszty
+    if upload.image_metadata is None and (end >= UPLOAD_VALIDATE_BYTES or end == upload.total_size):
+        try:
+            metadata = validate_upload_header(path, end, upload.total_size)
+        except ValueError as e:
+            discard_upload(upload, 'failed', str(e))
+            return jsonify({'error': str(e), 'upload': upload.to_dict()}), 422
+        if metadata is not None:
+            upload.image_metadata = json.dumps(metadata)
+    db.session.commit()
+    return jsonify(upload.to_dict())
+
+@app.route('/dataset/uploads/<int:upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    upload = db.session.get(Upload, upload_id)
+    if upload is None:
+        return jsonify({'error': 'Nie znaleziono przesyłania'}), 404
+    if upload.status == 'complete':
+        return jsonify(upload.to_dict())
+    if upload.status != 'uploading':
+        return jsonify({'error': f'Przesyłanie ma status {upload.status}', 'upload': upload.to_dict()}), 409
+    if upload.received != upload.total_size:
+        return jsonify({'error': 'Plik nie został przesłany w całości', 'received': upload.received}), 409
+
+    path = upload_path(upload)
+    try:
+        metadata = validate_upload_header(path, upload.received, upload.total_size, final=True)
+        if upload.sha256 and file_sha256(path) != upload.sha256:
+            raise ValueError("Suma kontrolna pliku się nie zgadza")
+    except ValueError as e:
+        discard_upload(upload, 'failed', str(e))
+        return jsonify({'error': str(e), 'upload': upload.to_dict()}), 422
+
+    upload.image_metadata = json.dumps(metadata)
+    upload.status = 'complete'
+    db.session.commit()
+    set_organoid_stage(upload.organoid_id, 'uploaded', is_initialized=True)
+    organoid = db.session.get(Organoid, upload.organoid_id)
+    broadcast_log(f"Przesłano zbiór {organoid.name}: {metadata['frames']} klatek, {metadata['slices']} płaszczyzn, "
+                  f"{metadata['channels']} kanały", organoid_id=organoid.id)
+    start_organoid_pipeline(organoid)
+    return jsonify(upload.to_dict())
+
+@app.route('/dataset/uploads/<int:upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    upload = db.session.get(Upload, upload_id)
+    if upload is None:
+        return jsonify({'error': 'Nie znaleziono przesyłania'}), 404
+    if upload.status != 'uploading':
+        return jsonify({'error': f'Przesyłanie ma status {upload.status}', 'upload': upload.to_dict()}), 409
+    discard_upload(upload, 'aborted')
+    return jsonify(upload.to_dict())
+
+def cached_json_response(build):
+    """Odpowiedź z ORGANOID_CACHE (klucz = ścieżka + parametry) z ETag; If-None-Match -> 304 bez zapytania do bazy"""
+    key = (request.path, tuple(sorted(request.args.items(multi=True))))
+    entry = ORGANOID_CACHE.get(key)
+    if entry is None:
+        payload, headers = build()
+        entry = ORGANOID_CACHE.put(key, payload, headers)
+    body, etag, headers = entry
+
+    response = Response(body, mimetype='application/json', headers=headers)
+    response.set_etag(etag)
+    # Klient zawsze rewaliduje - po zmianie danych ETag się zmienia
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def organoid_projection():
+    """Kolumny z ?fields=id,name,... (domyślnie wszystkie pola API); None = nieznane pole"""
+    fields = request.args.get('fields')
+    if not fields:
+        return list(ORGANOID_FIELDS)
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    if not names or any(name not in ORGANOID_FIELDS for name in names):
+        return None
+    return names
+
 @app.route('/organoid/', methods=['GET'])
 def get_organoids():
-    organoids = Organoid.query.all()
-    organoid_list = [{'id': o.id, 'name': o.name, 'isInitialized': o.is_initialized, 'isProcessedGlb': o.is_processed_glb, 'isInCurrentRd': o.is_in_current_rd} for o in organoids]
-    return jsonify(organoid_list)
+    """Lista organoidów: ?sort=name|-id|..., ?offset=&limit= (łączna liczba w X-Total-Count),
+    ?fields= projekcja kolumn, ?stage= filtr etapu"""
+    fields = organoid_projection()
+    if fields is None:
+        return jsonify({'error': f"Dozwolone pola: {', '.join(ORGANOID_FIELDS)}"}), 400
+
+    sort = request.args.get('sort', 'id')
+    sort_field = sort.lstrip('-')
+    if sort_field not in ORGANOID_FIELDS:
+        return jsonify({'error': f"Nieznane pole sortowania: {sort_field}"}), 400
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    if offset < 0 or (limit is not None and not 0 < limit <= ORGANOID_PAGE_MAX):
+        return jsonify({'error': f"offset >= 0, limit od 1 do {ORGANOID_PAGE_MAX}"}), 400
+
+    def build():
+        query = db.session.query(*(ORGANOID_FIELDS[name] for name in fields))
+        stage = request.args.get('stage')
+        if stage:
+            query = query.filter(Organoid.stage == stage)
+        total = query.order_by(None).count()
+
+        column = ORGANOID_FIELDS[sort_field]
+        # id jako drugi klucz - stabilna kolejność stron przy powtarzających się wartościach
+        query = query.order_by(column.desc() if sort.startswith('-') else column.asc(), Organoid.id.asc())
+        query = query.offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
+        return [dict(zip(fields, row)) for row in query.all()], {'X-Total-Count': str(total)}
+
+    return cached_json_response(build)
 
 @app.route('/organoid/<int:organoid_id>/', methods=['GET'])
 def get_organoid(organoid_id):
-    organoids = Organoid.query.filter_by(id=organoid_id).all()
-    organoid_list = [{'id': o.id, 'name': o.name, 'isInitialized': o.is_initialized, 'isProcessedGlb': o.is_processed_glb, 'isInCurrentRd': o.is_in_current_rd} for o in organoids]
-    return jsonify(organoid_list[0] if organoid_list else {})
-    
+    fields = organoid_projection()
+    if fields is None:
+        return jsonify({'error': f"Dozwolone pola: {', '.join(ORGANOID_FIELDS)}"}), 400
+
+    def build():
+        row = (db.session.query(*(ORGANOID_FIELDS[name] for name in fields))
+               .filter(Organoid.id == organoid_id).first())
+        return (dict(zip(fields, row)) if row else {}), None
+
+    return cached_json_response(build)
+
 @app.route('/organoid/<int:organoid_id>/<string:layer_type>', methods=['GET'])
 def get_glb_file(organoid_id, layer_type):
     if layer_type not in ['inner', 'outer']:
@@ -225,12 +1362,243 @@ def get_glb_file(organoid_id, layer_type):
     if not organoid.filename:
         return abort(404, description="Organoid has no associated glb file")
 
-    directory = os.path.join(app.root_path, 'glbs', layer_type)
-    try:
-        return send_from_directory(directory, organoid.filename + '.glb')
-    except FileNotFoundError:
+    glb_path = os.path.join(GLB_FOLDER, layer_type, organoid.filename + '.glb')
+    if not os.path.isfile(glb_path):
         return abort(404, description="Synchronization error: file not found on server")
 
+    # ?lod=<poziom> - uproszczona animacja z piramidy LOD (0 = pełna); bez pliku poziomu zwracamy pełny model
+    lod = request.args.get('lod', 0, type=int)
+    if lod < 0:
+        return abort(400, description="LOD level must be >= 0")
+    if lod:
+        lod_path = os.path.join(GLB_FOLDER, layer_type, f"{organoid.filename}.lod{lod}.glb")
+        if os.path.isfile(lod_path):
+            glb_path = lod_path
+    return send_glb(glb_path)
+
+def glb_version(glb_path):
+    """Wersja pliku do ?v= (mtime w ns) - zmienia się przy każdym zapisie, więc adres z nią może być immutable"""
+    try:
+        return str(os.stat(glb_path).st_mtime_ns)
+    except OSError:
+        return None
+
+def organoid_frames(organoid):
+    """{klatka: {warstwa: wersja}} z GLB klatek na dysku"""
+    frames = {}
+    for layer in ('inner', 'outer'):
+        folder = os.path.join(FRAME_GLB_FOLDER, organoid.filename, layer)
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            if name.startswith('frame_') and name.endswith('.glb'):
+                try:
+                    frame = int(name[6:-4])
+                except ValueError:
+                    continue
+                version = glb_version(os.path.join(folder, name))
+                if version is not None:
+                    frames.setdefault(frame, {})[layer] = version
+    return frames
+
+@app.route('/organoid/<int:organoid_id>/frames', methods=['GET'])
+def get_organoid_frames(organoid_id):
+    """Klatki gotowe do podglądu w trakcie przetwarzania (nowe ogłasza zdarzenie 'frame_available');
+    frame - indeks T w stosie od 0, ten sam w adresie /frames/<frame>/<warstwa> i w zdarzeniu.
+    versions / models - wartości ?v= dla GLB klatek i opublikowanych animacji (cache immutable)"""
+    organoid = db.session.get(Organoid, organoid_id)
+    if not organoid or not organoid.filename:
+        return abort(404, description="No organoid for selected ID")
+
+    frames = organoid_frames(organoid)
+    return jsonify({
+        'organoid_id': organoid.id,
+        'stage': organoid.stage,
+        'frames': [{'frame': frame, 'layers': sorted(frames[frame]), 'versions': frames[frame]}
+                   for frame in sorted(frames)],
+        # Wersje opublikowanych animacji (poziomy LOD zapisywane są razem z pełnym plikiem)
+        'models': {layer: glb_version(os.path.join(GLB_FOLDER, layer, organoid.filename + '.glb'))
+                   for layer in ('inner', 'outer')}
+    })
+
+@app.route('/organoid/<int:organoid_id>/frames/<int:frame>/<string:layer_type>', methods=['GET'])
+def get_frame_glb(organoid_id, frame, layer_type):
+    if layer_type not in ['inner', 'outer']:
+        return abort(400, description="Type must be 'inner' or 'outer'")
+
+    organoid = db.session.get(Organoid, organoid_id)
+    if not organoid or not organoid.filename:
+        return abort(404, description="No organoid for selected ID")
+
+    glb_path = os.path.join(FRAME_GLB_FOLDER, organoid.filename, layer_type, f"frame_{frame:04d}.glb")
+    if not os.path.isfile(glb_path):
+        return abort(404, description="Frame not available yet")
+    return send_glb(glb_path)
+
+@app.route('/organoid/<int:organoid_id>/compression', methods=['GET'])
+def get_glb_compression_report(organoid_id):
+    """Raport etapu kompresji GLB (rozmiary, czasy kodowania/dekodowania) dla inner/outer"""
+    organoid = db.session.get(Organoid, organoid_id)
+    if not organoid or not organoid.filename:
+        return abort(404, description="No organoid for selected ID")
+
+    report_path = os.path.join(GLB_FOLDER, organoid.filename + '.compression.json')
+    if not os.path.isfile(report_path):
+        return jsonify({})
+    with open(report_path) as f:
+        return jsonify(json.load(f))
+
+@app.route('/organoid/<int:organoid_id>/tracks', methods=['GET'])
+def get_organoid_tracks(organoid_id):
+    """Ścieżki jąder: bez parametrów podsumowanie (jeden wiersz na ścieżkę),
+    ?track=<id> albo ?frame=<klatka> - wiersze tabeli (centroid w wokselach stosu)"""
+    organoid = db.session.get(Organoid, organoid_id)
+    if not organoid or not organoid.filename:
+        return abort(404, description="No organoid for selected ID")
+
+    from tracking import TRACKS_EXT, read_tracks, track_summary
+    tracks_file = os.path.join(TRACKS_FOLDER, organoid.filename + TRACKS_EXT)
+    if not os.path.isfile(tracks_file):
+        return jsonify({'organoid_id': organoid.id, 'tracks': []})
+    tracks = read_tracks(tracks_file)
+
+    track = request.args.get('track', type=int)
+    frame = request.args.get('frame', type=int)
+    if track is None and frame is None:
+        return jsonify({'organoid_id': organoid.id, 'tracks': track_summary(tracks)})
+
+    selected = np.ones(len(tracks), dtype=bool)
+    if track is not None:
+        selected &= tracks['track'] == track
+    if frame is not None:
+        selected &= tracks['frame'] == frame
+    rows = tracks[selected]
+    return jsonify({'organoid_id': organoid.id, 'rows': [
+        {'track': int(row['track']), 'frame': int(row['frame']), 'label': int(row['label']),
+         'x': float(row['centroid'][2]), 'y': float(row['centroid'][1]), 'z': float(row['centroid'][0]),
+         'volume': int(row['volume'])}
+        for row in rows
+    ]})
+
+@app.route('/organoid/<int:organoid_id>/morphometrics', methods=['GET'])
+def get_organoid_morphometrics(organoid_id):
+    """Cechy jąder kolumnami: ?columns=volume,sphericity,... ?frame_from=&frame_to= ?track=
+    ?offset=&limit= (limit do MORPHOMETRICS_PAGE_MAX, łączna liczba wierszy w X-Total-Count).
+    Czytane są tylko pasujące row groupy / wycinki kolumn, nie cała tabela."""
+    organoid = db.session.get(Organoid, organoid_id)
+    if not organoid or not organoid.filename:
+        return abort(404, description="No organoid for selected ID")
+
+    from morphometrics import COLUMNS, read_morphometrics
+    columns = [name.strip() for name in request.args.get('columns', '').split(',') if name.strip()] or list(COLUMNS)
+    if any(name not in COLUMNS for name in columns):
+        return jsonify({'error': f"Dozwolone kolumny: {', '.join(COLUMNS)}"}), 400
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', MORPHOMETRICS_PAGE_MAX, type=int)
+    if offset < 0 or not 0 < limit <= MORPHOMETRICS_PAGE_MAX:
+        return jsonify({'error': f"offset >= 0, limit od 1 do {MORPHOMETRICS_PAGE_MAX}"}), 400
+
+    result = read_morphometrics(os.path.join(MORPHOMETRICS_FOLDER, organoid.filename), columns,
+                                request.args.get('frame_from', type=int), request.args.get('frame_to', type=int),
+                                request.args.get('track', type=int), offset, limit)
+    total, data = result if result is not None else (0, {name: [] for name in columns})
+    response = jsonify({
+        'organoid_id': organoid.id,
+        'total': total,
+        'offset': offset,
+        'columns': columns,
+        'data': {name: np.asarray(values).tolist() for name, values in data.items()}
+    })
+    response.headers['X-Total-Count'] = str(total)
+    return response
+
+SLICE_SOURCES = None
+
+def slice_source(organoid):
+    """SliceSource stosu organoidu z LRU; otwierany od nowa po zmianie pliku albo gdy piramida została
+    dokończona po otwarciu (do tego czasu kafle liczone w locie z memmapu). None = brak pliku."""
+    global SLICE_SOURCES
+    from formermatlabfunc import HyperstackReader
+    from slices import LruCache, SliceSource, source_signature, load_pyramid_meta
+    if SLICE_SOURCES is None:
+        SLICE_SOURCES = LruCache(SLICE_SOURCE_CACHE_SIZE)
+    tiff_path = os.path.join(app.config['UPLOAD_FOLDER'], organoid.filename + '.tif')
+    if organoid.stage == 'uploading' or not os.path.isfile(tiff_path):
+        return None
+    pyramid_folder = os.path.join(SLICE_PYRAMID_FOLDER, organoid.filename)
+    source = SLICE_SOURCES.get(organoid.filename)
+    # Starego czytnika nie zamykamy - może z niego jeszcze renderować wątek tpool; zamknie go GC
+    if source is not None and (source.signature != source_signature(tiff_path)
+                               or (source.pyramid is None and load_pyramid_meta(pyramid_folder) is not None)):
+        source = None
+    if source is None:
+        source = SLICE_SOURCES.put(organoid.filename, SliceSource(HyperstackReader(tiff_path), tiff_path,
+                                                                  pyramid_folder, SLICE_TILE_CACHE_SIZE))
+    return source
+
+@app.route('/organoid/<int:organoid_id>/slices', methods=['GET'])
+def get_organoid_slices(organoid_id):
+    """Wymiary stosu i siatki kafli przekrojów (poziomy, rozmiar kafla, formaty, czy piramida jest gotowa)"""
+    organoid = db.session.get(Organoid, organoid_id)
+    if not organoid or not organoid.filename:
+        return abort(404, description="No organoid for selected ID")
+    source = slice_source(organoid)
+    if source is None:
+        return abort(404, description="No TIFF file for selected organoid")
+    return jsonify(dict(source.info(), organoid_id=organoid.id))
+
+@app.route('/organoid/<int:organoid_id>/slices/<string:view>/<int:frame>/<int:channel>/<int:level>/<int:tx>/<int:ty>',
+           methods=['GET'])
+def get_organoid_slice_tile(organoid_id, view, frame, channel, level, tx, ty):
+    """Kafel przekroju view (xy/xz/yz): ?index= płaszczyzna Z / wiersz Y / kolumna X w pełnej rozdzielczości,
+    ?mip=1 - projekcja maksimum wzdłuż osi widoku (index pomijany), ?format=png|webp,
+    ?min=&max= okno intensywności (domyślnie percentyle klatki). Obrazy 8-bit w skali szarości."""
+    organoid = db.session.get(Organoid, organoid_id)
+    if not organoid or not organoid.filename:
+        return abort(404, description="No organoid for selected ID")
+    source = slice_source(organoid)
+    if source is None:
+        return abort(404, description="No TIFF file for selected organoid")
+
+    from slices import FORMATS
+    fmt = request.args.get('format', 'png')
+    mip = request.args.get('mip', '0') in ('1', 'true')
+    index = request.args.get('index', 0, type=int)
+    try:
+        # Odczyt memmapu i kodowanie PNG blokują - w wątku systemowym, nie w pętli eventlet
+        data = tpool.execute(source.render_tile, view, frame, channel, index, level, tx, ty, mip, fmt,
+                             request.args.get('min', type=float), request.args.get('max', type=float))
+    except ValueError as e:
+        return jsonify({'error': f"Nieprawidłowy kafel: {e}"}), 400
+
+    response = Response(data, mimetype=FORMATS[fmt][1])
+    response.set_etag(hashlib.sha1(data).hexdigest())
+    # Adres nie zmienia się razem z plikiem - przeglądarka rewaliduje po ETag
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def send_glb(glb_path):
+    """GLB z ETag/Last-Modified, Range (werkzeug, conditional=True) i prekompresowanym wariantem .br/.gz."""
+    send_path, encoding = glb_path, None
+    glb_mtime = os.path.getmtime(glb_path)
+    for name, suffix in GLB_ENCODINGS:
+        candidate = glb_path + suffix
+        if name in request.accept_encodings and os.path.isfile(candidate) and os.path.getmtime(candidate) >= glb_mtime:
+            send_path, encoding = candidate, name
+            break
+
+    # Z ?v= adres zmienia się razem z plikiem -> cache na rok; bez wersji send_file ustawia
+    # 'no-cache': przeglądarka trzyma plik, ale rewaliduje go (tanie 304 po ETag)
+    versioned = bool(request.args.get('v'))
+    response = send_file(send_path, mimetype='model/gltf-binary', conditional=True, etag=True,
+                         last_modified=glb_mtime, max_age=GLB_IMMUTABLE_MAX_AGE if versioned else None)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    if versioned:
+        response.cache_control.immutable = True
+    return response
+
 @socketio.on('connect')
 def handle_connect():
     emit('server_state', SERVER_STATE)
@@ -256,11 +1624,20 @@ def process_file():
         print(f"DEBUG: Szukałem pliku tutaj: {full_path}")
         return jsonify({"error": f"File not found: {file_path}"}), 404
 
-    thread = threading.Thread(target=process_pipeline, args=(full_path, INTERNAL_DATA_FOLDER))
-    thread.start()
+    try:
+        profile, params = resolve_job_params(data.get('profile'), data.get('params'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    job = submit_job(full_path, priority=data.get('priority', 0), workers=data.get('workers'),
+                     profile=profile, params=params)
 
-    return jsonify({"message": "Processing started", "file": file_path})
+    return jsonify({"message": "Processing queued", "file": file_path, "job": job.to_dict()}), 202
     
 if __name__ == '__main__':
     app.debug = True
+    # Przy reloaderze scheduler ma działać tylko w procesie potomnym
+    if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        socketio.start_background_task(scheduler_loop)
+        socketio.start_background_task(retention_loop)
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,311 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import numpy as np
+import tifffile
+
+from formermatlabfunc import process_pipeline, package_glbs, tracks_path, PIPELINE_VERSION
+from tracking import read_tracks
+from profiling import StageTimer
+
+
+# Benchmark przepustowości pipeline'u na syntetycznym stosie ImageJ (TZCYX, uint16) - bez prawdziwych danych.
+#   python benchmark.py run --t 6 --z 40 --y 512 --x 512 --nuclei 80 -o wynik.json
+#   python benchmark.py compare stary.json nowy.json --threshold 0.1
+BENCHMARK_VERSION = 3
+
+# Syntetyczne jądra: najmniejszy promień (kula > MIN_NUCLEUS_VOL = 500 wokseli) i odstęp między
+# powierzchniami (rozmycie SMOOTH_SIGMA nie skleja sąsiadów w progu Otsu)
+NUCLEUS_MIN_RADIUS = 5.5
+NUCLEUS_GAP = 4.0
+
+# Tło kanałów: niskie, bo otoczka liczona jest z sumy kanałów z progiem COAT_THRESH_FACTOR * maksimum (~150);
+# przy tle 100 na kanał suma tła przekraczała próg i marching cubes szedł po szumie zamiast po elipsoidzie
+BACKGROUND = 10.0
+COAT_SIGNAL = 500.0
+NUCLEUS_SIGNAL = 1000.0
+
+# Metryki porównywane w trybie compare: (klucz, True = większa wartość jest lepsza)
+COMPARED_METRICS = (
+    ('frames_per_second', True),
+    ('pipeline_seconds', False),
+    ('package_seconds', False),
+    ('peak_rss_mb', False),
+    ('output_bytes', False),
+)
+
+
+def place_nuclei(rng, t, z, y, x, nuclei, velocities_sigma=0.5, attempts=1000):
+    """Losowanie z odrzucaniem: w każdej klatce (z dryfem) jądra są rozdzielone o NUCLEUS_GAP wokseli
+    i mieszczą się w stosie (także w Z). Zwraca (pozycje, prędkości, promienie); za gęsto -> ValueError."""
+    center, radii = coat_ellipsoid(z, y, x)
+    # Promień z rozmiaru stosu, ograniczony grubością w Z (kilka warstw jąder)
+    max_r = max(min(0.07 * min(y, x), 0.15 * z), NUCLEUS_MIN_RADIUS)
+    if z < 2 * (NUCLEUS_MIN_RADIUS + NUCLEUS_GAP) + 1:
+        raise ValueError(f"Stack too thin for nuclei: z={z}, need at least {int(2 * (NUCLEUS_MIN_RADIUS + NUCLEUS_GAP)) + 1}")
+    low = np.array([0.0, 0.0, 0.0])
+    high = np.array([z - 1.0, y - 1.0, x - 1.0])
+    steps = np.arange(t)[:, None]
+
+    positions, velocities, nucleus_r = [], [], []
+    for _ in range(nuclei):
+        for _ in range(attempts):
+            r = max(rng.uniform(0.6, 1.0) * max_r, NUCLEUS_MIN_RADIUS)
+            # Jądra w środku otoczki (współrzędne względne elipsoidy)
+            direction = rng.normal(size=3)
+            position = center + direction / np.linalg.norm(direction) * rng.uniform(0.0, 0.9) * radii
+            # Dryf w Z mniejszy - stos jest w Z kilka razy płytszy niż w Y/X
+            velocity = rng.normal(0.0, velocities_sigma, 3) * np.array([0.25, 1.0, 1.0])
+            track = position + velocity * steps
+            if np.any(track - r - NUCLEUS_GAP < low) or np.any(track + r + NUCLEUS_GAP > high):
+                continue
+            if positions:
+                others = np.array(positions)[None] + np.array(velocities)[None] * steps[:, :, None]
+                distance = np.linalg.norm(others - track[:, None], axis=2)
+                if np.any(distance < np.array(nucleus_r) + r + NUCLEUS_GAP):
+                    continue
+            positions.append(position)
+            velocities.append(velocity)
+            nucleus_r.append(r)
+            break
+        else:
+            raise ValueError(f"Cannot place {nuclei} separated nuclei in a {z}x{y}x{x} stack "
+                             f"(placed {len(positions)}), lower --nuclei or enlarge the stack")
+    return np.array(positions).reshape(-1, 3), np.array(velocities).reshape(-1, 3), np.array(nucleus_r)
+
+
+def coat_ellipsoid(z, y, x):
+    """Środek i półosie (Z, Y, X) elipsoidy otoczki w stosie z make_hyperstack."""
+    return np.array([z, y, x]) / 2.0, np.array([z * 0.4, y * 0.35, x * 0.35])
+
+
+def make_hyperstack(path, t=4, z=24, c=2, y=128, x=128, nuclei=12, noise=30.0, seed=0):
+    """Syntetyczny organoid: elipsoida otoczki w kanale 0 i kuliste jądra (z dryfem w czasie) w kanale 1.
+    Jądra się nie stykają, więc segmentacja powinna znaleźć ich dokładnie `nuclei` w każdej klatce.
+    Zapis płaszczyzna po płaszczyźnie, więc rozmiar stosu nie jest ograniczony pamięcią."""
+    rng = np.random.default_rng(seed)
+    center, radii = coat_ellipsoid(z, y, x)
+    positions, velocities, nucleus_r = place_nuclei(rng, t, z, y, x, nuclei)
+
+    yy, xx = np.mgrid[:y, :x]
+
+    def planes():
+        for ti in range(t):
+            frame_positions = positions + velocities * ti
+            for zi in range(z):
+                for ci in range(c):
+                    plane = rng.normal(BACKGROUND, noise, (y, x)) if noise else np.full((y, x), BACKGROUND)
+                    if ci == 0:
+                        inside = (((zi - center[0]) / radii[0]) ** 2 + ((yy - center[1]) / radii[1]) ** 2
+                                  + ((xx - center[2]) / radii[2]) ** 2) < 1.0
+                        plane[inside] += COAT_SIGNAL
+                    elif ci == 1:
+                        # Suma masek, nie intensywności - woksel jądra jest jasny raz, nawet przy styku
+                        nucleus = np.zeros((y, x), dtype=bool)
+                        for (pz, py, px), r in zip(frame_positions, nucleus_r):
+                            dz2 = (zi - pz) ** 2
+                            if dz2 >= r * r:
+                                continue
+                            nucleus |= ((yy - py) ** 2 + (xx - px) ** 2) < r * r - dz2
+                        plane[nucleus] += NUCLEUS_SIGNAL
+                    yield np.clip(plane, 0, 65535).astype(np.uint16)
+
+    tifffile.imwrite(path, planes(), shape=(t, z, c, y, x), dtype=np.uint16, imagej=True,
+                     metadata={'axes': 'TZCYX'})
+    return path
+
+
+def folder_bytes(folder):
+    total = 0
+    for root, _, files in os.walk(folder):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def peak_rss_mb():
+    # Proces główny i najcięższy proces potomny (pula workerów); Linux: kB
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0
+    return max(own, children), own, children
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_once(input_path, work_folder, workers, compression):
+    output_folder = os.path.join(work_folder, 'output')
+    glb_folder = os.path.join(work_folder, 'glbs')
+    shutil.rmtree(output_folder, ignore_errors=True)
+    shutil.rmtree(glb_folder, ignore_errors=True)
+    exp_name = os.path.splitext(os.path.basename(input_path))[0]
+
+    timer = StageTimer()
+    start = time.perf_counter()
+    process_pipeline(input_path, output_folder, workers=workers, use_cache=False, timer=timer)
+    pipeline_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    package_glbs(output_folder, exp_name, glb_folder, compression, timer=timer)
+    package_seconds = time.perf_counter() - start
+
+    # Jądra znalezione w każdej klatce - powinno być tyle, ile wygenerowano (--nuclei)
+    tracks = read_tracks(tracks_path(output_folder, exp_name))
+    _, nuclei_per_frame = np.unique(tracks['frame'], return_counts=True)
+
+    summary = timer.summary()
+    frames = summary.get('frame', {}).get('count', 0)
+    frames_seconds = summary.get('frames', {}).get('total_seconds', pipeline_seconds)
+    peak, own, children = peak_rss_mb()
+    return {
+        'frames': frames,
+        'frames_per_second': frames / frames_seconds if frames_seconds else None,
+        'pipeline_seconds': pipeline_seconds,
+        'package_seconds': package_seconds,
+        'peak_rss_mb': peak,
+        'peak_rss_mb_main': own,
+        'peak_rss_mb_workers': children,
+        'nuclei_per_frame': nuclei_per_frame.tolist(),
+        'output_bytes': folder_bytes(output_folder) + folder_bytes(glb_folder),
+        'mesh_bytes': folder_bytes(os.path.join(output_folder, 'output-OBJ-coat'))
+                      + folder_bytes(os.path.join(output_folder, 'output-OBJ-final')),
+        'glb_bytes': {layer: folder_bytes(os.path.join(glb_folder, layer)) for layer in ('outer', 'inner')},
+        'stages': summary
+    }
+
+
+def run_benchmark(args):
+    work_folder = args.work_folder or tempfile.mkdtemp(prefix='organoid-bench-')
+    os.makedirs(work_folder, exist_ok=True)
+    input_path = os.path.join(work_folder, 'bench.tif')
+    config = {key: getattr(args, key) for key in ('t', 'z', 'c', 'y', 'x', 'nuclei', 'noise', 'seed', 'workers',
+                                                   'compression', 'repeat')}
+    try:
+        print(f"Generating synthetic stack T={args.t} Z={args.z} C={args.c} Y={args.y} X={args.x}, "
+              f"{args.nuclei} nuclei...")
+        start = time.perf_counter()
+        make_hyperstack(input_path, args.t, args.z, args.c, args.y, args.x, args.nuclei, args.noise, args.seed)
+        generate_seconds = time.perf_counter() - start
+
+        runs = []
+        for i in range(args.repeat):
+            print(f"--- Benchmark run {i + 1}/{args.repeat} ---")
+            runs.append(run_once(input_path, work_folder, args.workers, args.compression))
+            print(f"Run {i + 1}: {runs[-1]['frames_per_second']:.3f} frames/s, "
+                  f"pipeline {runs[-1]['pipeline_seconds']:.2f} s, package {runs[-1]['package_seconds']:.2f} s")
+            if runs[-1]['nuclei_per_frame'] != [args.nuclei] * runs[-1]['frames']:
+                print(f"Warning: segmented {runs[-1]['nuclei_per_frame']} nuclei per frame, generated {args.nuclei}")
+    finally:
+        if not args.work_folder:
+            shutil.rmtree(work_folder, ignore_errors=True)
+
+    # Mediana powtórzeń dla metryk czasowych; rozmiary wyjścia są deterministyczne
+    result = {key: statistics.median(run[key] for run in runs if run[key] is not None)
+              for key, _ in COMPARED_METRICS}
+    result['stage_seconds'] = {stage: statistics.median(run['stages'][stage]['total_seconds'] for run in runs
+                                                        if stage in run['stages'])
+                               for stage in runs[0]['stages']}
+    report = {
+        'benchmark_version': BENCHMARK_VERSION,
+        'pipeline_version': PIPELINE_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_revision': git_revision(),
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                        'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+        'config': config,
+        'generate_seconds': generate_seconds,
+        'result': result,
+        'runs': runs
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+        print(f"Saved benchmark results: {args.output}")
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+    return report
+
+
+def compare_reports(base, new, threshold=0.1, min_seconds=0.05):
+    """Lista (metryka, stara, nowa, zmiana względna, czy regresja); zmiana > threshold na gorsze = regresja.
+    Etapy krótsze niż min_seconds są pomijane - przy nich szum pomiaru jest większy niż próg."""
+    rows = []
+
+    def check(name, old, current, higher_is_better):
+        if old is None or current is None or old == 0:
+            return
+        change = (current - old) / old
+        worse = -change if higher_is_better else change
+        rows.append((name, old, current, change, worse > threshold))
+
+    for key, higher_is_better in COMPARED_METRICS:
+        check(key, base['result'].get(key), new['result'].get(key), higher_is_better)
+    for stage, seconds in sorted(base['result'].get('stage_seconds', {}).items()):
+        if seconds < min_seconds:
+            continue
+        check(f"stage:{stage}", seconds, new['result'].get('stage_seconds', {}).get(stage), False)
+    return rows
+
+
+def run_compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    if base.get('config') != new.get('config'):
+        print("Warning: benchmark configs differ, comparison may be meaningless")
+    rows = compare_reports(base, new, args.threshold, args.min_seconds)
+    regressions = [row for row in rows if row[4]]
+    for name, old, current, change, regressed in rows:
+        flag = 'REGRESSION' if regressed else ''
+        print(f"{name:32s} {old:14.4f} {current:14.4f} {change * 100:+8.1f}% {flag}")
+    print(f"{len(regressions)} regression(s) above {args.threshold * 100:.0f}%")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark pipeline'u na syntetycznych stosach ImageJ")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Wygeneruj stos, uruchom pipeline i pakowanie GLB")
+    run_parser.add_argument('--t', type=int, default=4)
+    run_parser.add_argument('--z', type=int, default=24)
+    run_parser.add_argument('--c', type=int, default=2)
+    run_parser.add_argument('--y', type=int, default=128)
+    run_parser.add_argument('--x', type=int, default=128)
+    run_parser.add_argument('--nuclei', type=int, default=12)
+    run_parser.add_argument('--noise', type=float, default=30.0, help="Odchylenie szumu gaussowskiego")
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--workers', type=int, default=1)
+    run_parser.add_argument('--compression', choices=['quantize', 'meshopt'], default=None)
+    run_parser.add_argument('--repeat', type=int, default=1, help="Powtórzenia (wynik = mediana)")
+    run_parser.add_argument('--work-folder', default=None, help="Folder roboczy (domyślnie tymczasowy, usuwany)")
+    run_parser.add_argument('-o', '--output', default=None, help="Plik JSON z wynikami (domyślnie stdout)")
+
+    compare_parser = subparsers.add_parser('compare', help="Porównaj dwa wyniki i wskaż regresje")
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help="Próg regresji (0.1 = 10%%)")
+    compare_parser.add_argument('--min-seconds', type=float, default=0.05,
+                                help="Pomijaj etapy krótsze niż tyle sekund w bazowym wyniku")
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run_benchmark(args)
+    else:
+        raise SystemExit(run_compare(args))
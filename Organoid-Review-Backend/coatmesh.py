@@ -0,0 +1,70 @@
+import numpy as np
+from scipy import ndimage
+from skimage import measure
+
+
+class CoatMesher:
+    """Meshowanie otoczki z buforami wielokrotnego użytku - jeden obiekt na proces roboczy.
+    Suma kanałów i wolumen po rozmyciu żyją między klatkami (ten sam kształt = zero nowych alokacji),
+    a zamiana osi, centrowanie i skala idą w miejscu na wierzchołkach z marching cubes."""
+
+    def __init__(self):
+        self._sum = None
+        self._smooth = None
+        self._column = np.empty(0, dtype=np.float32)
+
+    def _volume(self, name, shape):
+        buffer = getattr(self, name)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.float32)
+            setattr(self, name, buffer)
+        return buffer
+
+    def _scratch_column(self, n):
+        # Rośnie z zapasem, żeby kolejne klatki z nieco większą siatką nie alokowały od nowa
+        if len(self._column) < n:
+            self._column = np.empty(int(n * 1.5), dtype=np.float32)
+        return self._column[:n]
+
+    def smooth(self, vol_ch1, vol_ch2, sigma=1.0):
+        """gaussian_filter(vol_ch1 + vol_ch2) do bufora procesu; wynik ważny do następnego wywołania."""
+        total = self._volume('_sum', vol_ch1.shape)
+        np.copyto(total, vol_ch1)
+        total += vol_ch2
+        return ndimage.gaussian_filter(total, sigma=sigma, output=self._volume('_smooth', vol_ch1.shape))
+
+    @staticmethod
+    def max_value(volume, step=1):
+        """Maksimum do wyznaczenia izopoziomu; step > 1 liczy je na podpróbkowanym widoku (bez kopii)."""
+        if step > 1:
+            volume = volume[::step, ::step, ::step]
+        return float(np.max(volume))
+
+    def marching_cubes(self, volume, level, global_center, scale):
+        verts, faces, _, _ = measure.marching_cubes(volume, level)
+        return self.to_scene(verts, faces, global_center, scale)
+
+    def to_scene(self, verts, faces, global_center, scale):
+        """(Z, Y, X) -> (X, Y, Z), (v - global_center) * scale w miejscu; ściany jako uint32 bez kopii (int32)."""
+        verts = np.asarray(verts, dtype=np.float32)
+        column = self._scratch_column(len(verts))
+        np.copyto(column, verts[:, 0])
+        verts[:, 0] = verts[:, 2]
+        verts[:, 2] = column
+        verts -= np.asarray(global_center, dtype=np.float32)
+        verts *= np.float32(scale)
+
+        faces = np.asarray(faces)
+        if faces.dtype == np.int32 or faces.dtype == np.uint32:
+            faces = faces.view(np.uint32)
+        else:
+            faces = faces.astype(np.uint32)
+        return verts, faces
+
+
+def write_obj(path, name, vertices, faces):
+    """Otoczka do OBJ (jeden obiekt) bez budowania trimesh.Trimesh."""
+    with open(path, 'w') as f:
+        f.write(f"o {name}\n")
+        np.savetxt(f, vertices, fmt='v %.8f %.8f %.8f')
+        np.savetxt(f, faces.astype(np.int64) + 1, fmt='f %d %d %d')
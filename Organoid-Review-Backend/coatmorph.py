@@ -0,0 +1,100 @@
+import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+from glbwriter import vertex_normals, orient_outward
+
+
+class CoatMorphFit:
+    """Otoczka na wspólnej topologii: siatka bazowa (pierwsza klatka) i pozycje jej wierzchołków w każdej klatce.
+    error - o ile 95. percentyl odległości powierzchni klatki od dopasowanej siatki przekracza ten sam pomiar
+    dla bazy w pierwszej klatce (rozstaw wierzchołków bazy się znosi), najgorsza klatka, jednostki sceny."""
+
+    def __init__(self, faces, positions, error):
+        self.faces = faces
+        self.positions = positions
+        self.error = error
+
+    @property
+    def base(self):
+        return self.positions[0]
+
+
+def _smoothing_operator(faces, n):
+    # Uśrednianie po sąsiadach (Laplace jednorodny) jako macierz rzadka - jedno mnożenie na krok
+    edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]).astype(np.int64)
+    edges = np.concatenate([edges, edges[:, ::-1]])
+    adjacency = sparse.csr_matrix((np.ones(len(edges), dtype=np.float32), (edges[:, 0], edges[:, 1])), shape=(n, n))
+    adjacency.data[:] = 1.0
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    return sparse.diags(1.0 / np.maximum(degree, 1.0)) @ adjacency
+
+
+def _coverage(points, target_vertices):
+    # Jak daleko powierzchnia klatki jest od siatki (np. nowe uwypuklenie, którego baza nie pokrywa)
+    distance, _ = cKDTree(points).query(target_vertices)
+    return float(np.percentile(distance, 95))
+
+
+def _project(points, tree, target_vertices, target_normals):
+    """Rzut na powierzchnię klatki: najbliższy wierzchołek z KD-drzewa i płaszczyzna styczna w nim
+    (siatka z marching cubes ma wierzchołki co ~1 woksel, więc to dobre przybliżenie najbliższego punktu)."""
+    _, nearest = tree.query(points)
+    normals = target_normals[nearest]
+    offset = np.einsum('ij,ij->i', points - target_vertices[nearest], normals)
+    return points - offset[:, None] * normals
+
+
+class CoatMorpher:
+    """Dopasowanie siatek bazowych (po jednej na poziom LOD) do kolejnych klatek otoczki.
+    Klatka startuje z pozycji poprzedniej (spójność w czasie), potem iterations razy: rzut na powierzchnię
+    i wygładzenie Laplace'a (zapobiega zbijaniu się wierzchołków), na końcu rzut."""
+
+    def __init__(self, bases, iterations=2, smoothing=0.5):
+        self.iterations = iterations
+        self.smoothing = smoothing
+        self.faces = {}
+        self.positions = {}
+        self.errors = {}
+        self._reference = {}
+        self._smooth = {}
+        for key, (vertices, faces) in bases.items():
+            vertices = np.asarray(vertices, dtype=np.float32)
+            faces = orient_outward(vertices, np.asarray(faces))
+            self.faces[key] = faces
+            self.positions[key] = [vertices]
+            self.errors[key] = 0.0
+            self._reference[key] = 0.0
+            self._smooth[key] = _smoothing_operator(faces, len(vertices))
+
+    def set_reference(self, target_vertices):
+        """Pełna siatka pierwszej klatki - punkt odniesienia błędu dla baz zdecymowanych z niej."""
+        for key, positions in self.positions.items():
+            self._reference[key] = _coverage(positions[0], np.asarray(target_vertices, dtype=np.float32))
+
+    def add_frame(self, target_vertices, target_faces):
+        """Kolejna klatka (pełna siatka otoczki) - jedno KD-drzewo dla wszystkich siatek bazowych."""
+        target_vertices = np.asarray(target_vertices, dtype=np.float32)
+        target_normals = vertex_normals(target_vertices, np.asarray(target_faces))
+        tree = cKDTree(target_vertices)
+        for key, positions in self.positions.items():
+            points = positions[-1].astype(np.float64)
+            for _ in range(self.iterations):
+                points = _project(points, tree, target_vertices, target_normals)
+                points = (1.0 - self.smoothing) * points + self.smoothing * (self._smooth[key] @ points)
+            points = _project(points, tree, target_vertices, target_normals).astype(np.float32)
+            positions.append(points)
+            self.errors[key] = max(self.errors[key], _coverage(points, target_vertices) - self._reference[key])
+
+    def result(self, key):
+        return CoatMorphFit(self.faces[key], self.positions[key], self.errors[key])
+
+
+def fit_coat_sequence(frames, bases, iterations=2, smoothing=0.5):
+    """frames: pełne siatki otoczki (vertices, faces) kolejnych klatek; bases: {klucz: (vertices, faces)}
+    siatek bazowych z pierwszej klatki (np. poziomy LOD). Zwraca {klucz: CoatMorphFit}."""
+    morpher = CoatMorpher(bases, iterations, smoothing)
+    morpher.set_reference(frames[0][0])
+    for vertices, faces in frames[1:]:
+        morpher.add_frame(vertices, faces)
+    return {key: morpher.result(key) for key in bases}
@@ -1,10 +1,27 @@
 import os
 import re
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 import tifffile
 from scipy import ndimage
-from skimage import measure, segmentation, filters, feature
+from skimage import segmentation, filters, feature
 import trimesh
+from nucleimesh import NucleiBatch, mesh_nuclei, write_obj as write_nuclei_obj, read_obj as read_nuclei_obj
+from glbwriter import write_animated_glb, write_morph_glb, write_precompressed
+from glbcompress import compress_glb, write_report
+from framemesh import write_frame_mesh, read_frame_mesh, EXTENSION as FRAME_MESH_EXT
+from meshlod import decimate, decimate_objects, lod_suffix
+from coatmesh import CoatMesher, write_obj as write_coat_obj
+from coatmorph import fit_coat_sequence
+from morphometrics import morphometrics_path, write_morphometrics
+from tracking import (REGION_DTYPE, REGIONS_EXT, TRACKS_EXT, to_full_resolution, write_regions, read_regions,
+                      build_tracks, write_tracks, read_tracks, nucleus_names)
+import tiled
+from profiling import StageTimer
+from slices import build_pyramid
 
 
 def parse_imagej_metadata(tif):
@@ -24,7 +41,627 @@ def parse_imagej_metadata(tif):
     return metadata
 
 
-def process_pipeline(input_file_path, output_folder):
+# Parametry
+DEFAULT_PARAMS = {
+    'CH_SEG': 0,
+    'CH_ADD': 1,
+    'COAT_THRESH_FACTOR': 0.10,
+    # Izopoziom otoczki z maksimum co N-tego woksela rozmytego wolumenu (1 = dokładnie jak dotąd)
+    'COAT_ISO_STEP': 1,
+    # Animacja otoczki w GLB: 'morph' - jedna siatka bazowa dopasowana do każdej klatki (morph targety, płynne
+    # przejścia), 'visibility' - pełna siatka na klatkę i przełączanie widoczności jak w ObjsToGlbCoat.py
+    'COAT_ANIMATION': 'morph',
+    'COAT_MORPH_MAX_FACES': 60000,
+    # Powyżej tego błędu dopasowania (woksele, 95. percentyl) poziom wraca do siatek na klatkę
+    'COAT_MORPH_MAX_ERROR': 3.0,
+
+    'TARGET_CH': 1,
+    'MIN_NUCLEUS_VOL': 500,
+    'NUCLEI_THRESH_FACTOR': 0.10,
+    'NUCLEI_MIN_DISTANCE': 4,
+    'SMOOTH_SIGMA': 1.5,
+    'SMOOTH_MESH_SIGMA': 0.6,
+    # Śledzenie jąder (tracking.py): maks. przesunięcie centroidu między kolejnymi klatkami, woksele pełnej rozdzielczości
+    'TRACK_MAX_DISTANCE': 15.0,
+
+    'BLENDER_SCALE': 0.02,
+
+    # Piramida LOD: ułamek ścian pełnej siatki marching cubes na poziom (poziom 0 = pliki bez sufiksu)
+    # Zastępuje stałe COAT_REDUCTION / NUCLEI_REDUCTION = 0.2
+    'LOD_LEVELS': [1.0, 0.25, 0.05],
+
+    # Tryb kafelkowy (tiled.py): True / False / 'auto' (gdy segmentacja klatki przekroczy TILE_MEMORY_MB)
+    'TILED': 'auto',
+    'TILE_MEMORY_MB': 2048,
+    'TILE_HALO': 0,            # 0 = z SMOOTH_SIGMA i NUCLEI_MIN_DISTANCE
+    'TILE_SCRATCH_DIR': None,  # None = katalog tymczasowy systemu
+
+    # 'orgm' - binarny kontener framemesh (memmap), 'obj' - tekstowy OBJ dla skryptów Blendera
+    'MESH_FORMAT': 'orgm',
+
+    # Podgląd: uśrednianie BINNING x BINNING pikseli w Y/X (progi w wokselach dotyczą wolumenu po binningu)
+    # i co FRAME_STRIDE-ta klatka
+    'BINNING': 1,
+    'FRAME_STRIDE': 1,
+}
+
+
+def resolve_params(overrides=None):
+    """DEFAULT_PARAMS + nadpisania (profil parametrów z bazy albo --params); zły klucz / typ -> ValueError."""
+    params = dict(DEFAULT_PARAMS)
+    for key, value in (overrides or {}).items():
+        if key not in DEFAULT_PARAMS:
+            raise ValueError(f"Unknown pipeline parameter: {key}")
+        default = DEFAULT_PARAMS[key]
+        if isinstance(default, (int, float)) and not isinstance(default, bool):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"Pipeline parameter {key} must be a number")
+        params[key] = value
+
+    levels = params['LOD_LEVELS']
+    if not isinstance(levels, list) or not levels or not all(isinstance(f, (int, float)) and 0 < f <= 1 for f in levels):
+        raise ValueError("LOD_LEVELS must be a non-empty list of fractions in (0, 1]")
+    for key in ('BINNING', 'FRAME_STRIDE', 'COAT_ISO_STEP'):
+        if int(params[key]) != params[key] or params[key] < 1:
+            raise ValueError(f"{key} must be a positive integer")
+    if params['COAT_ANIMATION'] not in ('morph', 'visibility'):
+        raise ValueError("COAT_ANIMATION must be 'morph' or 'visibility'")
+    if params['TRACK_MAX_DISTANCE'] <= 0:
+        raise ValueError("TRACK_MAX_DISTANCE must be positive")
+    return params
+
+
+def load_params_arg(value):
+    """--params: JSON z nadpisaniami albo @ścieżka do pliku JSON."""
+    if value.startswith('@'):
+        with open(value[1:]) as f:
+            return json.load(f)
+    return json.loads(value)
+
+
+def scene_transform(global_center, params):
+    """(środek, skala) w osiach (X, Y, Z) dla wierzchołków w wokselach wolumenu po binningu -
+    model ma ten sam rozmiar i położenie co z pełnej rozdzielczości."""
+    binning = params['BINNING']
+    if binning == 1:
+        return global_center, params['BLENDER_SCALE']
+    # Woksel po binningu i ma środek w binning * i + (binning - 1) / 2 oryginalnych wokseli
+    factor = np.array([binning, binning, 1], dtype=np.float64)
+    center = (np.asarray(global_center, dtype=np.float64) - (factor - 1) / 2.0) / factor
+    return center, (params['BLENDER_SCALE'] * factor).astype(np.float32)
+
+
+def bin_planes(volume, binning):
+    """Średnia z bloków binning x binning w Y/X (brzegi niepełnych bloków są obcinane), float32."""
+    z, y, x = volume.shape
+    y, x = y // binning * binning, x // binning * binning
+    blocks = np.asarray(volume[:, :y, :x], dtype=np.float32).reshape(z, y // binning, binning, x // binning, binning)
+    return blocks.mean(axis=(2, 4), dtype=np.float32)
+
+# Zmienić przy każdej zmianie algorytmu, która zmienia wynik - unieważnia cache klatek
+PIPELINE_VERSION = 7
+
+# Linia stdout ogłaszająca gotowy GLB klatki: "FRAME_GLB <t> outer,inner" (czyta ją runner zadań w app.py)
+FRAME_GLB_MARKER = 'FRAME_GLB'
+
+# Czytnik stosu w procesie roboczym, ustawiany w initializerze puli
+_WORKER_READER = None
+# Bufory otoczki procesu (tworzone przy pierwszej klatce, potem wielokrotnie używane)
+_COAT_MESHER = None
+
+
+def coat_mesher():
+    global _COAT_MESHER
+    if _COAT_MESHER is None:
+        _COAT_MESHER = CoatMesher()
+    return _COAT_MESHER
+
+
+class HyperstackReader:
+    """Leniwy czytnik stosu ImageJ (TZCYX) - czyta tylko plany jednej klatki i jednego kanału."""
+
+    def __init__(self, path):
+        self.path = path
+        self._tif = tifffile.TiffFile(path)
+        self.meta = parse_imagej_metadata(self._tif)
+        self.num_t = self.meta['frames']
+        self.num_z = self.meta['slices']
+        self.num_ch = self.meta['channels']
+        self.dim_y, self.dim_x = self._tif.pages[0].shape[-2:]
+        self.dtype = self._tif.pages[0].dtype
+
+        # Plik ciągły (typowy zapis ImageJ) -> memmap; skompresowany -> czytanie strona po stronie
+        try:
+            self._flat = tifffile.memmap(path, mode='r').reshape(-1, self.dim_y, self.dim_x)
+        except ValueError:
+            self._flat = None
+
+    @property
+    def memmapped(self):
+        return self._flat is not None
+
+    def channel_planes(self, t, channel):
+        """Plany (Z, Y, X) kanału `channel` w klatce `t`; przy memmapie to widok z krokiem num_ch."""
+        base = t * self.num_z * self.num_ch + channel
+        stop = base + self.num_z * self.num_ch
+        if self._flat is not None:
+            return self._flat[base:stop:self.num_ch]
+        return np.stack([self._tif.pages[idx].asarray() for idx in range(base, stop, self.num_ch)])
+
+    def frame_shape(self, params):
+        """Kształt (Z, Y, X) wolumenu klatki po binningu."""
+        binning = params['BINNING']
+        return self.num_z, self.dim_y // binning, self.dim_x // binning
+
+    def frame_volumes(self, t, params):
+        """Zwraca (vol_ch1, vol_ch2) w float32 - jedyna kopia danych to jedna klatka."""
+        binning = params['BINNING']
+        if binning > 1:
+            vol_ch1 = bin_planes(self.channel_planes(t, params['CH_SEG']), binning)
+        else:
+            vol_ch1 = self.channel_planes(t, params['CH_SEG']).astype(np.float32)
+        if self.num_ch > 1:
+            if binning > 1:
+                vol_ch2 = bin_planes(self.channel_planes(t, params['CH_ADD']), binning)
+            else:
+                vol_ch2 = self.channel_planes(t, params['CH_ADD']).astype(np.float32)
+        else:
+            vol_ch2 = np.zeros_like(vol_ch1)
+        return vol_ch1, vol_ch2
+
+    def frame_planes(self, t, params):
+        """Jak frame_volumes, ale bez kopii float32 (tryb kafelkowy): widoki memmap w typie surowym.
+        Przy binningu wolumen jest i tak BINNING^2 razy mniejszy - wtedy zwykłe frame_volumes."""
+        if params['BINNING'] > 1:
+            return self.frame_volumes(t, params)
+        vol_ch1 = self.channel_planes(t, params['CH_SEG'])
+        if self.num_ch > 1:
+            vol_ch2 = self.channel_planes(t, params['CH_ADD'])
+        else:
+            vol_ch2 = np.broadcast_to(np.zeros((), dtype=vol_ch1.dtype), vol_ch1.shape)
+        return vol_ch1, vol_ch2
+
+    def frame_digest(self, t, params):
+        """Hash surowych planów klatki `t` (oba kanały) - część klucza cache klatki."""
+        digest = hashlib.sha256()
+        channels = [params['CH_SEG']] + ([params['CH_ADD']] if self.num_ch > 1 else [])
+        for channel in channels:
+            for plane in self.channel_planes(t, channel):
+                digest.update(np.ascontiguousarray(plane).data)
+        return digest.hexdigest()
+
+    def close(self):
+        self._flat = None
+        self._tif.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _open_worker_reader(input_file_path):
+    # Każdy worker otwiera plik sam (memmap / strony) - wolumen nie jest pickle'owany
+    global _WORKER_READER
+    _WORKER_READER = HyperstackReader(input_file_path)
+
+
+def frame_cache_key(raw_digest, global_center, params):
+    payload = json.dumps({
+        'version': PIPELINE_VERSION,
+        'raw': raw_digest,
+        'center': [float(c) for c in global_center],
+        'params': params
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def load_manifest(manifest_path):
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'frames': {}}
+
+
+def save_manifest(manifest_path, manifest):
+    # Zapis atomowy - przerwany run nie zostawi uszkodzonego manifestu
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def _outputs_exist(entry, output_coat, output_nuclei):
+    outputs = entry.get('outputs', {})
+    folders = {'coat': output_coat, 'nuclei': output_nuclei, 'regions': output_nuclei}
+    return all(os.path.exists(os.path.join(folders[output_layer(kind)], name)) for kind, name in outputs.items())
+
+
+def output_layer(kind):
+    # Klucze wyników: 'coat', 'nuclei' (poziom 0), 'coat.lod1', 'nuclei.lod2', ... oraz 'regions' (tabela jąder)
+    return kind.split('.')[0]
+
+
+def _write_coat(output_coat, coat_name, level, vertices, faces, frame_idx, params):
+    if params['MESH_FORMAT'] == 'obj':
+        coat_filename = coat_name + lod_suffix(level) + '.obj'
+        write_coat_obj(os.path.join(output_coat, coat_filename), coat_name, vertices, faces)
+    else:
+        coat_filename = coat_name + lod_suffix(level) + FRAME_MESH_EXT
+        write_frame_mesh(os.path.join(output_coat, coat_filename), vertices, faces,
+                         names=[coat_name], meta={'kind': 'coat', 'frame': frame_idx, 'lod': level})
+    return coat_filename
+
+
+def _write_nuclei(output_nuclei, nuclei_name, level, nuclei, frame_idx, params):
+    if params['MESH_FORMAT'] == 'obj':
+        nuclei_filename = nuclei_name + lod_suffix(level) + '.obj'
+        write_nuclei_obj(os.path.join(output_nuclei, nuclei_filename), nuclei)
+    else:
+        nuclei_filename = nuclei_name + lod_suffix(level) + FRAME_MESH_EXT
+        write_frame_mesh(os.path.join(output_nuclei, nuclei_filename), nuclei.vertices, nuclei.faces,
+                         nuclei.vertex_offsets, nuclei.face_offsets, names=nuclei.names(),
+                         labels=nuclei.labels, meta={'kind': 'nuclei', 'frame': frame_idx, 'lod': level})
+    return nuclei_filename
+
+
+def process_frame(vol_ch1, vol_ch2, frame_idx, exp_name, output_coat, output_nuclei, global_center, params,
+                  timer=None):
+    """Zwraca (outputs, meshes): nazwy zapisanych plików i siatki w pamięci dla etapu GLB.
+    W trybie kafelkowym vol_ch1 / vol_ch2 to widoki memmap, a wolumeny pośrednie idą na dysk (tiled.py).
+    timer (profiling.StageTimer) dostaje czas i pamięć każdego etapu klatki."""
+    if timer is None:
+        timer = StageTimer()
+    if tiled.use_tiling(vol_ch1.shape, params):
+        with tiled.TileScratch(params) as scratch:
+            return _process_frame(vol_ch1, vol_ch2, frame_idx, exp_name, output_coat, output_nuclei, global_center,
+                                  params, timer, scratch)
+    return _process_frame(vol_ch1, vol_ch2, frame_idx, exp_name, output_coat, output_nuclei, global_center, params,
+                          timer)
+
+
+def _process_frame(vol_ch1, vol_ch2, frame_idx, exp_name, output_coat, output_nuclei, global_center, params, timer,
+                   scratch=None):
+    outputs = {}
+    meshes = {}
+    budget = tiled.memory_budget(params)
+    mesher = coat_mesher()
+    scene_center, scene_scale = scene_transform(global_center, params)
+
+    # ==========================================
+    # CZĘŚĆ A: COAT (Otoczka) -> Pojedynczy plik OBJ
+    # ==========================================
+    with timer.stage('coat_blur', frame_idx):
+        if scratch is not None:
+            vol_coat_smooth = tiled.smooth_blockwise([vol_ch1, vol_ch2], 1.0,
+                                                     scratch.array('coat', vol_ch1.shape, np.float32), budget)
+            max_val_coat = tiled.blockwise_range(vol_coat_smooth, budget)[1]
+        else:
+            vol_coat_smooth = mesher.smooth(vol_ch1, vol_ch2, sigma=1.0)
+            max_val_coat = mesher.max_value(vol_coat_smooth, params['COAT_ISO_STEP'])
+
+    if max_val_coat > 0:
+        iso_level = max_val_coat * params['COAT_THRESH_FACTOR']
+        try:
+            # Konwersja (Z, Y, X) -> (X, Y, Z) i transformacje w miejscu (CoatMesher.to_scene)
+            with timer.stage('coat_marching_cubes', frame_idx):
+                if scratch is not None:
+                    verts, faces = tiled.marching_cubes_blockwise(vol_coat_smooth, iso_level, budget)
+                    coat_vertices, coat_faces = mesher.to_scene(verts, faces, scene_center, scene_scale)
+                else:
+                    coat_vertices, coat_faces = mesher.marching_cubes(vol_coat_smooth, iso_level, scene_center,
+                                                                      scene_scale)
+            full_faces = len(coat_faces)
+
+            # Piramida LOD - każdy poziom decymowany z poprzedniego (taniej niż z pełnej siatki)
+            # Nazwa: np. Tile_1..._Frame_T005.orgm, Tile_1..._Frame_T005.lod1.orgm
+            coat_name = f"{exp_name}_Frame_T{frame_idx:03d}"
+            for level, fraction in enumerate(params['LOD_LEVELS']):
+                with timer.stage('coat_decimate', frame_idx):
+                    coat_vertices, coat_faces = decimate(coat_vertices, coat_faces, int(full_faces * fraction))
+                kind = 'coat' + lod_suffix(level)
+                with timer.stage('coat_export', frame_idx):
+                    outputs[kind] = _write_coat(output_coat, coat_name, level, coat_vertices, coat_faces, frame_idx,
+                                                params)
+                meshes[kind] = (coat_vertices, coat_faces)
+
+        except Exception as e:
+            print(f"    Error Coat: {e}")
+
+    # ==========================================
+    # CZĘŚĆ B: NUCLEI (Jądra) -> Jeden OBJ na klatkę (z wieloma obiektami w środku)
+    # ==========================================
+    vol_nuclei_raw = vol_ch2
+
+    try:
+        if scratch is not None:
+            with timer.stage('nuclei_blur', frame_idx):
+                vol_nuc_smooth = tiled.smooth_blockwise([vol_nuclei_raw], params['SMOOTH_SIGMA'],
+                                                        scratch.array('nuclei', vol_ch2.shape, np.float32), budget)
+            with timer.stage('nuclei_threshold', frame_idx):
+                thresh_val = tiled.otsu_blockwise(vol_nuc_smooth, budget)
+            # EDT, piki i watershed są przeplatane blokami - jeden etap
+            with timer.stage('nuclei_watershed', frame_idx):
+                labels, areas = tiled.segment_nuclei_blockwise(vol_nuc_smooth, thresh_val, params, scratch, budget)
+        else:
+            with timer.stage('nuclei_blur', frame_idx):
+                vol_nuc_smooth = ndimage.gaussian_filter(vol_nuclei_raw, sigma=params['SMOOTH_SIGMA'])
+            with timer.stage('nuclei_threshold', frame_idx):
+                thresh_val = filters.threshold_otsu(vol_nuc_smooth)
+                bw = vol_nuc_smooth > thresh_val
+            with timer.stage('nuclei_distance', frame_idx):
+                distance = ndimage.distance_transform_edt(bw)
+            with timer.stage('nuclei_peaks', frame_idx):
+                coords = feature.peak_local_max(distance, min_distance=params['NUCLEI_MIN_DISTANCE'], labels=bw)
+                mask = np.zeros(distance.shape, dtype=bool)
+                mask[tuple(coords.T)] = True
+                markers, _ = ndimage.label(mask)
+            with timer.stage('nuclei_watershed', frame_idx):
+                labels = segmentation.watershed(-distance, markers, mask=bw)
+            areas = None
+
+        # Wszystkie jądra klatki w jednym przebiegu (paczki boxów + jedno marching cubes)
+        with timer.stage('nuclei_mesh', frame_idx):
+            nuclei = mesh_nuclei(labels, vol_nuclei_raw, scene_center, params, areas=areas, scale=scene_scale)
+        nuclei_in_frame = len(nuclei)
+
+        # Tabela regionów do śledzenia - zapisywana także pusta (klatka bez jąder przerywa ścieżki)
+        regions = nuclei.regions if nuclei.regions is not None else np.zeros(0, dtype=REGION_DTYPE)
+        outputs['regions'] = f"{exp_name}_Frame_T{frame_idx:03d}{REGIONS_EXT}"
+        write_regions(os.path.join(output_nuclei, outputs['regions']), to_full_resolution(regions, params['BINNING']))
+
+        # ZAPIS DO PLIKU (.orgm albo OBJ) - jeden plik na poziom LOD
+        if nuclei_in_frame > 0:
+            nuclei_name = f"{exp_name}_Frame_T{frame_idx:03d}"
+            previous = 1.0
+            for level, fraction in enumerate(params['LOD_LEVELS']):
+                if fraction < previous:
+                    with timer.stage('nuclei_decimate', frame_idx):
+                        nuclei = NucleiBatch(nuclei.labels, *decimate_objects(
+                            nuclei.vertices, nuclei.faces, nuclei.vertex_offsets, nuclei.face_offsets,
+                            fraction / previous))
+                    previous = fraction
+                kind = 'nuclei' + lod_suffix(level)
+                with timer.stage('nuclei_export', frame_idx):
+                    outputs[kind] = _write_nuclei(output_nuclei, nuclei_name, level, nuclei, frame_idx, params)
+                meshes[kind] = nuclei
+            print(f"    Saved {nuclei_in_frame} nuclei to {outputs['nuclei']} ({len(params['LOD_LEVELS'])} LOD levels)")
+        else:
+            print("    No nuclei found.")
+
+    except Exception as e:
+        print(f"    Error processing nuclei seg: {e}")
+
+    return outputs, meshes
+
+
+def _frame_worker(t, exp_name, output_coat, output_nuclei, global_center, params, cached_entry=None, keep_meshes=False):
+    """Zwraca (t, klucz cache, outputs, czy z cache, siatki, rekordy czasów etapów)."""
+    frame_idx = t + 1
+    print(f"  Frame T={frame_idx}...", flush=True)
+    timer = StageTimer()
+
+    with timer.stage('digest', frame_idx):
+        key = frame_cache_key(_WORKER_READER.frame_digest(t, params), global_center, params)
+    if cached_entry and cached_entry.get('key') == key and _outputs_exist(cached_entry, output_coat, output_nuclei):
+        print("    Unchanged, reusing cached outputs.", flush=True)
+        return t, key, cached_entry.get('outputs', {}), True, None, timer.records
+
+    with timer.stage('load', frame_idx):
+        if tiled.use_tiling(_WORKER_READER.frame_shape(params), params):
+            vol_ch1, vol_ch2 = _WORKER_READER.frame_planes(t, params)
+        else:
+            vol_ch1, vol_ch2 = _WORKER_READER.frame_volumes(t, params)
+    if np.max(vol_ch1) == 0 and np.max(vol_ch2) == 0:
+        print("    Skipping empty frame.", flush=True)
+        return t, key, {}, False, None, timer.records
+
+    with timer.stage('frame', frame_idx):
+        outputs, meshes = process_frame(vol_ch1, vol_ch2, frame_idx, exp_name, output_coat, output_nuclei,
+                                        global_center, params, timer)
+    return t, key, outputs, False, meshes if keep_meshes else None, timer.records
+
+
+def _load_frame_meshes(outputs, output_coat, output_nuclei):
+    # Klatki z cache nie mają siatek w pamięci - wczytujemy zapisane pliki (.orgm przez memmap)
+    meshes = {}
+    for kind, name in outputs.items():
+        if output_layer(kind) == 'coat':
+            path = os.path.join(output_coat, name)
+            if path.endswith(FRAME_MESH_EXT):
+                meshes[kind] = read_frame_mesh(path).mesh(0)
+            else:
+                mesh = trimesh.load(path, force='mesh', process=False)
+                meshes[kind] = (np.asarray(mesh.vertices, dtype=np.float32), np.asarray(mesh.faces, dtype=np.uint32))
+        elif output_layer(kind) == 'nuclei':
+            path = os.path.join(output_nuclei, name)
+            if path.endswith(FRAME_MESH_EXT):
+                meshes[kind] = read_frame_mesh(path)
+            else:
+                meshes[kind] = read_nuclei_obj(path)
+    return meshes
+
+
+def _frame_layer_meshes(meshes, t, exp_name, suffix='', tracks=None):
+    """Siatki jednej klatki dla warstw GLB: {'outer': [(nazwa, v, f)], 'inner': [...]} (tylko obecne).
+    tracks: tabela ścieżek - jądra nazwane po ID ścieżki zamiast etykiety watershed z tej klatki."""
+    layers = {}
+    if 'coat' + suffix in meshes:
+        layers['outer'] = [(f"{exp_name}_Frame_T{t + 1:03d}", *meshes['coat' + suffix])]
+    if 'nuclei' + suffix in meshes:
+        nuclei = meshes['nuclei' + suffix]
+        names = nuclei.names() if tracks is None else nucleus_names(tracks, t, nuclei.labels)
+        layers['inner'] = [(name, *nuclei.mesh(i)) for i, name in enumerate(names)]
+    return layers
+
+
+def frame_glb_path(frame_glb_folder, exp_name, layer, t):
+    # t - indeks klatki w stosie od 0, jak w FRAME_GLB_MARKER, /frames, ścieżkach i morfometrii
+    # (frame_idx = t + 1 tylko w logach)
+    return os.path.join(frame_glb_folder, exp_name, layer, f"frame_{t:04d}.glb")
+
+
+def write_frame_glbs(meshes, t, exp_name, frame_glb_folder):
+    """Statyczny GLB pełnej siatki jednej klatki na warstwę - podgląd, zanim powstanie cała animacja.
+    Bez prekompresji (brotli q11 kosztuje więcej niż sama klatka). Zwraca zapisane warstwy."""
+    layers = _frame_layer_meshes(meshes, t, exp_name)
+    for layer, outward in (('outer', True), ('inner', False)):
+        path = frame_glb_path(frame_glb_folder, exp_name, layer, t)
+        if layer not in layers:
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_animated_glb(path, [layers[layer]], outward_normals=outward)
+    return sorted(layers)
+
+
+def fit_coat_morphs(frame_meshes, levels, params):
+    """{poziom LOD: CoatMorphFit} - baza z pierwszej klatki (poziom LOD, najwyżej COAT_MORPH_MAX_FACES ścian)
+    dopasowana do pełnej siatki otoczki każdej klatki. Poziomy z za dużym błędem są pomijane."""
+    frames = [t for t in sorted(frame_meshes) if 'coat' in frame_meshes[t]]
+    if len(frames) < 2:
+        return {}
+    first = frame_meshes[frames[0]]
+    bases = {}
+    for level in levels:
+        kind = 'coat' + lod_suffix(level)
+        if kind in first:
+            vertices, faces = first[kind]
+            if len(faces) > params['COAT_MORPH_MAX_FACES']:
+                vertices, faces = decimate(vertices, faces, params['COAT_MORPH_MAX_FACES'])
+            bases[level] = (vertices, faces)
+
+    fits = fit_coat_sequence([frame_meshes[t]['coat'] for t in frames], bases)
+    max_error = params['COAT_MORPH_MAX_ERROR'] * params['BLENDER_SCALE']
+    for level in list(fits):
+        if fits[level].error > max_error:
+            print(f"Coat morph{lod_suffix(level)}: fit error {fits[level].error:.4f} > {max_error:.4f}, "
+                  f"using per-frame meshes")
+            del fits[level]
+    return fits
+
+
+def write_glbs(frame_meshes, exp_name, glb_folder, compression=None, tracks=None, params=None):
+    """Zastępuje ObjsToGlbCoat.py (outer) i ObjsToGlbNuclei.py (inner) - bez Blendera.
+    Jeden GLB na poziom LOD: <exp>.glb (pełny), <exp>.lod1.glb, ...
+    compression: None, 'quantize' albo 'meshopt' (patrz glbcompress); tracks: tabela ścieżek jąder;
+    params: parametry przebiegu (COAT_ANIMATION i pokrewne), domyślnie DEFAULT_PARAMS."""
+    params = params if params is not None else DEFAULT_PARAMS
+    levels = sorted({int(kind.split('.lod')[1]) if '.lod' in kind else 0
+                     for meshes in frame_meshes.values() for kind in meshes})
+    coat_morphs = fit_coat_morphs(frame_meshes, levels, params) if params['COAT_ANIMATION'] == 'morph' else {}
+
+    reports = {}
+    for level in levels:
+        suffix = lod_suffix(level)
+        coat_frames, nuclei_frames = [], []
+        for t in sorted(frame_meshes):
+            layers = _frame_layer_meshes(frame_meshes[t], t, exp_name, suffix, tracks)
+            if 'outer' in layers:
+                coat_frames.append(layers['outer'])
+            if 'inner' in layers:
+                nuclei_frames.append(layers['inner'])
+
+        for layer, frames, outward in (('outer', coat_frames, True), ('inner', nuclei_frames, False)):
+            if not frames:
+                print(f"No {layer} frames, GLB not written.")
+                continue
+            os.makedirs(os.path.join(glb_folder, layer), exist_ok=True)
+            glb_path = os.path.join(glb_folder, layer, exp_name + suffix + '.glb')
+            if layer == 'outer' and level in coat_morphs:
+                fit = coat_morphs[level]
+                write_morph_glb(glb_path, f"{exp_name}_Coat", fit.faces, fit.positions)
+                print(f"Saved {layer} GLB ({len(fit.positions)} frames as morph targets of {len(fit.base)} vertices, "
+                      f"fit error {fit.error:.4f}): {glb_path}")
+            else:
+                write_animated_glb(glb_path, frames, outward_normals=outward)
+                print(f"Saved {layer} GLB ({len(frames)} frames): {glb_path}")
+
+            if compression:
+                try:
+                    report = compress_glb(glb_path, compression)
+                    reports[layer + suffix] = report
+                    print(f"Compressed {layer} GLB ({compression}): {report['raw_bytes']} -> {report['compressed_bytes']} bytes "
+                          f"(x{report['ratio']}), encode {report['encode_ms']} ms, decode {report['decode_ms']} ms "
+                          f"vs {report['raw_decode_ms']} ms")
+                    continue
+                except Exception as e:
+                    print(f"Error compressing {layer} GLB: {e}")
+            write_precompressed(glb_path)
+
+    # Raport tylko z bieżącego przebiegu - po przebiegu bez kompresji stary raport opisywałby nieistniejące pliki
+    report_path = os.path.join(glb_folder, exp_name + '.compression.json')
+    if reports:
+        write_report(report_path, reports)
+    elif os.path.exists(report_path):
+        os.remove(report_path)
+
+    # Poziomy LOD z poprzedniego przebiegu (np. inny profil parametrów) nie mogą zostać obok nowej animacji
+    for layer in ('outer', 'inner'):
+        folder = os.path.join(glb_folder, layer)
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            match = re.fullmatch(re.escape(exp_name) + r'\.lod(\d+)\.glb(\.gz|\.br)?', name)
+            if match and int(match.group(1)) not in levels:
+                os.remove(os.path.join(folder, name))
+
+
+def tracks_path(output_folder, exp_name):
+    return os.path.join(output_folder, 'output-tracks', exp_name + TRACKS_EXT)
+
+
+def load_frame_regions(manifest, frames, output_nuclei):
+    """{t: tabela regionów} klatek przebiegu zapisanych w manifeście (klatki bez tabeli są pomijane)."""
+    frame_regions = {}
+    for t in frames:
+        name = manifest['frames'].get(str(t), {}).get('outputs', {}).get('regions')
+        if name and os.path.exists(os.path.join(output_nuclei, name)):
+            frame_regions[t] = read_regions(os.path.join(output_nuclei, name))
+    return frame_regions
+
+
+def link_nuclei(frame_regions, output_folder, exp_name, params):
+    """Etap śledzenia po segmentacji wszystkich klatek: tabele regionów -> tabela ścieżek na dysku."""
+    tracks = build_tracks(frame_regions, params['TRACK_MAX_DISTANCE'])
+    path = tracks_path(output_folder, exp_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_tracks(path, tracks)
+    print(f"Tracked {len(tracks)} nuclei in {len(frame_regions)} frames: {len(set(tracks['track'].tolist()))} tracks")
+    return tracks
+
+
+def package_glbs(output_folder, exp_name, glb_folder, compression=None, timer=None):
+    """Sam etap GLB: składa animacje z plików klatek zapisanych w manifeście (bez ponownej segmentacji)."""
+    output_coat = os.path.join(output_folder, 'output-OBJ-coat', exp_name)
+    output_nuclei = os.path.join(output_folder, 'output-OBJ-final', exp_name)
+    manifest = load_manifest(os.path.join(output_folder, 'pipeline-cache', exp_name + '.json'))
+    path = tracks_path(output_folder, exp_name)
+    tracks = read_tracks(path) if os.path.exists(path) else None
+    # Parametry, z którymi powstały klatki (manifest), a nie bieżące domyślne
+    params = dict(DEFAULT_PARAMS, **manifest.get('params', {}))
+
+    timer = timer if timer is not None else StageTimer()
+    frame_meshes = {}
+    with timer.stage('load_meshes'):
+        for t, entry in manifest['frames'].items():
+            if entry.get('outputs'):
+                frame_meshes[int(t)] = _load_frame_meshes(entry['outputs'], output_coat, output_nuclei)
+    with timer.stage('glb'):
+        write_glbs(frame_meshes, exp_name, glb_folder, compression, tracks, params)
+
+
+def process_pipeline(input_file_path, output_folder, workers=1, use_cache=True, glb_folder=None, compression=None,
+                     timer=None, frame_glb_folder=None, params=None, profile=None, slice_pyramid_folder=None):
+    """timer (profiling.StageTimer) zbiera czasy etapów wszystkich klatek (także z procesów puli) i etapów przebiegu.
+    frame_glb_folder: GLB każdej klatki zapisywany zaraz po niej i ogłaszany linią FRAME_GLB_MARKER.
+    params: nadpisania DEFAULT_PARAMS (profil), zapisywane razem z nazwą profilu w manifeście wyników.
+    slice_pyramid_folder: piramida kafli przekrojów surowego stosu (<folder>/<exp>, slices.build_pyramid)."""
+    global _WORKER_READER
+    timer = timer if timer is not None else StageTimer()
     filename = os.path.basename(input_file_path)
     exp_name = os.path.splitext(filename)[0]
 
@@ -40,33 +677,25 @@ def process_pipeline(input_file_path, output_folder):
     print(f"Output Coat: {output_coat}")
     print(f"Output Nuclei: {output_nuclei}")
 
-    # Parametry
-    CH_SEG = 0
-    CH_ADD = 1
-    COAT_THRESH_FACTOR = 0.10
-    COAT_REDUCTION = 0.2
-
-    TARGET_CH = 1
-    MIN_NUCLEUS_VOL = 500
-    NUCLEI_THRESH_FACTOR = 0.10
-    NUCLEI_REDUCTION = 0.2
-    SMOOTH_SIGMA = 1.5
-    SMOOTH_MESH_SIGMA = 0.6
-
-    BLENDER_SCALE = 0.02
-
-    with tifffile.TiffFile(input_file_path) as tif:
-        meta = parse_imagej_metadata(tif)
-        volume_data = tif.asarray()
-
-    dims = volume_data.shape
-    num_t = meta['frames']
-    num_z = meta['slices']
-    num_ch = meta['channels']
-    dim_y = dims[-2]
-    dim_x = dims[-1]
-
-    flat_data = volume_data.reshape(-1, dim_y, dim_x)
+    # Manifest cache: klucz klatki = hash surowych planów + wszystkie parametry
+    cache_folder = os.path.join(output_folder, 'pipeline-cache')
+    os.makedirs(cache_folder, exist_ok=True)
+    manifest_path = os.path.join(cache_folder, exp_name + '.json')
+    manifest = load_manifest(manifest_path) if use_cache else {'frames': {}}
+
+    params = resolve_params(params)
+    print(f"Parameter profile: {profile or 'default'}")
+    if not workers:
+        workers = os.cpu_count() or 1
+
+    with timer.stage('open'):
+        reader = HyperstackReader(input_file_path)
+    num_t = reader.num_t
+    num_z = reader.num_z
+    num_ch = reader.num_ch
+    dim_y = reader.dim_y
+    dim_x = reader.dim_x
+
     global_center = np.array([dim_x, dim_y, num_z]) / 2.0
 
     begin_t = 1
@@ -75,149 +704,143 @@ def process_pipeline(input_file_path, output_folder):
         begin_t = 0
         end_t = num_t
 
-    print(f"Dimensions: T={num_t}, Z={num_z}, CH={num_ch}, Y={dim_y}, X={dim_x}")
-    print(f"Processing Frames: {begin_t + 1} to {end_t} (1-based)")
-
-    # --- GŁÓWNA PĘTLA PO CZASIE ---
-    for t in range(begin_t, end_t):
-        frame_idx = t + 1
-        print(f"  Frame T={frame_idx}...")
-
-        vol_ch1 = np.zeros((num_z, dim_y, dim_x), dtype=np.float32)
-        vol_ch2 = np.zeros((num_z, dim_y, dim_x), dtype=np.float32)
-
-        for z in range(num_z):
-            idx1 = t * num_z * num_ch + z * num_ch + CH_SEG
-            idx2 = t * num_z * num_ch + z * num_ch + CH_ADD
-            vol_ch1[z, :, :] = flat_data[idx1]
-            if num_ch > 1:
-                vol_ch2[z, :, :] = flat_data[idx2]
-
-        if np.max(vol_ch1) == 0 and np.max(vol_ch2) == 0:
-            print("    Skipping empty frame.")
-            continue
-
-        # ==========================================
-        # CZĘŚĆ A: COAT (Otoczka) -> Pojedynczy plik OBJ
-        # ==========================================
-        vol_coat = vol_ch1 + vol_ch2
-        vol_coat_smooth = ndimage.gaussian_filter(vol_coat, sigma=1.0)
-        max_val_coat = np.max(vol_coat_smooth)
-
-        if max_val_coat > 0:
-            iso_level = max_val_coat * COAT_THRESH_FACTOR
-            try:
-                verts, faces, normals, values = measure.marching_cubes(vol_coat_smooth, iso_level)
-
-                # Konwersja (Z, Y, X) -> (X, Y, Z)
-                verts_xyz = np.zeros_like(verts)
-                verts_xyz[:, 0] = verts[:, 2]  # X
-                verts_xyz[:, 1] = verts[:, 1]  # Y
-                verts_xyz[:, 2] = verts[:, 0]  # Z
-
-                mesh = trimesh.Trimesh(vertices=verts_xyz, faces=faces)
-
-                # Redukcja
-                if COAT_REDUCTION < 1.0:
-                    try:
-                        target_faces = int(len(mesh.faces) * COAT_REDUCTION)
-                        mesh = mesh.simplify_quadratic_decimation(target_faces)
-                    except Exception:
-                        pass
-
-                        # Transformacje
-                mesh.vertices -= global_center
-                mesh.vertices *= BLENDER_SCALE
-
-                # ZAPIS DO PLIKU OBJ (Dla skryptu objstoglbcoat.py)
-                # Nazwa: np. Tile_1..._Frame_T005.obj
-                coat_filename = f"{exp_name}_Frame_T{frame_idx:03d}.obj"
-                mesh.export(os.path.join(output_coat, coat_filename))
-
-            except Exception as e:
-                print(f"    Error Coat: {e}")
-
-        # ==========================================
-        # CZĘŚĆ B: NUCLEI (Jądra) -> Jeden OBJ na klatkę (z wieloma obiektami w środku)
-        # ==========================================
-        vol_nuclei_raw = vol_ch2
-        vol_nuc_smooth = ndimage.gaussian_filter(vol_nuclei_raw, sigma=SMOOTH_SIGMA)
+    frames = range(begin_t, end_t, params['FRAME_STRIDE'])
 
+    print(f"Dimensions: T={num_t}, Z={num_z}, CH={num_ch}, Y={dim_y}, X={dim_x}")
+    print(f"Processing Frames: {begin_t + 1} to {end_t} (1-based), every {params['FRAME_STRIDE']}, "
+          f"binning {params['BINNING']}")
+    frame_args = (exp_name, output_coat, output_nuclei, global_center, params)
+    folders = {'coat': output_coat, 'nuclei': output_nuclei, 'regions': output_nuclei}
+    keep_meshes = glb_folder is not None or frame_glb_folder is not None
+    frame_meshes = {}
+    reused = 0
+
+    def record_frame(t, key, outputs, cached, meshes, records):
+        nonlocal reused
+        reused += cached
+        timer.extend(records)
+        if frame_glb_folder is not None:
+            # Klatka z cache z gotowymi GLB - tylko ogłoszenie, bez wczytywania siatek
+            layers = [layer for layer in ('inner', 'outer')
+                      if os.path.exists(frame_glb_path(frame_glb_folder, exp_name, layer, t))]
+            if not (cached and layers):
+                if outputs and meshes is None:
+                    meshes = _load_frame_meshes(outputs, output_coat, output_nuclei)
+                with timer.stage('frame_glb', t + 1):
+                    layers = write_frame_glbs(meshes or {}, t, exp_name, frame_glb_folder)
+            if layers:
+                print(f"{FRAME_GLB_MARKER} {t} {','.join(layers)}", flush=True)
+        if glb_folder is not None and outputs:
+            frame_meshes[t] = meshes if meshes is not None else _load_frame_meshes(outputs, output_coat, output_nuclei)
+        previous = manifest['frames'].get(str(t), {})
+        # Usuwamy stare wyniki, których nowy przebieg już nie wygenerował
+        for kind, name in previous.get('outputs', {}).items():
+            path = os.path.join(folders[output_layer(kind)], name)
+            if outputs.get(kind) != name and os.path.exists(path):
+                os.remove(path)
+        manifest['frames'][str(t)] = {'key': key, 'outputs': outputs}
+        save_manifest(manifest_path, manifest)
+
+    # Z jakimi parametrami powstały wyniki; klatki spoza bieżącego przebiegu (np. po podglądzie
+    # z FRAME_STRIDE) wypadają z manifestu, żeby pakowanie GLB nie mieszało profili
+    manifest['profile'] = profile or 'default'
+    manifest['params'] = params
+    manifest['pipeline_version'] = PIPELINE_VERSION
+    for t in [t for t in manifest['frames'] if int(t) not in frames]:
+        for kind, name in manifest['frames'].pop(t).get('outputs', {}).items():
+            path = os.path.join(folders[output_layer(kind)], name)
+            if os.path.exists(path):
+                os.remove(path)
+        if frame_glb_folder is not None:
+            write_frame_glbs({}, int(t), exp_name, frame_glb_folder)
+    save_manifest(manifest_path, manifest)
+
+    with timer.stage('frames'):
         try:
-            thresh_val = filters.threshold_otsu(vol_nuc_smooth)
-            bw = vol_nuc_smooth > thresh_val
-            distance = ndimage.distance_transform_edt(bw)
-            coords = feature.peak_local_max(distance, min_distance=4, labels=bw)
-            mask = np.zeros(distance.shape, dtype=bool)
-            mask[tuple(coords.T)] = True
-            markers, _ = ndimage.label(mask)
-            labels = segmentation.watershed(-distance, markers, mask=bw)
-            regions = measure.regionprops(labels)
-
-            # Tworzymy scenę TYLKO dla tej klatki
-            frame_scene = trimesh.Scene()
-            nuclei_in_frame = 0
-
-            for region in regions:
-                if region.area < MIN_NUCLEUS_VOL:
-                    continue
-
-                min_z, min_y, min_x = region.bbox[0], region.bbox[1], region.bbox[2]
-                max_z, max_y, max_x = region.bbox[3], region.bbox[4], region.bbox[5]
-
-                crop_vol = vol_nuclei_raw[min_z:max_z, min_y:max_y, min_x:max_x]
-                nucleus_vol = crop_vol * region.image
-                nucleus_vol_smooth = ndimage.gaussian_filter(nucleus_vol, sigma=SMOOTH_MESH_SIGMA)
-
-                max_n_val = np.max(nucleus_vol_smooth)
-                if max_n_val == 0: continue
-
-                iso_lev_nuc = max_n_val * NUCLEI_THRESH_FACTOR
-
-                try:
-                    v_n, f_n, _, _ = measure.marching_cubes(nucleus_vol_smooth, iso_lev_nuc)
-
-                    v_xyz = np.zeros_like(v_n)
-                    v_xyz[:, 0] = v_n[:, 2]
-                    v_xyz[:, 1] = v_n[:, 1]
-                    v_xyz[:, 2] = v_n[:, 0]
-
-                    v_xyz[:, 0] += min_x
-                    v_xyz[:, 1] += min_y
-                    v_xyz[:, 2] += min_z
-
-                    n_mesh = trimesh.Trimesh(vertices=v_xyz, faces=f_n)
-
-                    if NUCLEI_REDUCTION < 1.0:
+            if workers <= 1:
+                # --- GŁÓWNA PĘTLA PO CZASIE ---
+                _WORKER_READER = reader
+                for t in frames:
+                    record_frame(*_frame_worker(t, *frame_args, cached_entry=manifest['frames'].get(str(t)),
+                                               keep_meshes=keep_meshes))
+            else:
+                # --- RÓWNOLEGLE: jedna klatka na proces ---
+                print(f"Workers: {workers}")
+                with ProcessPoolExecutor(max_workers=workers, initializer=_open_worker_reader,
+                                         initargs=(input_file_path,)) as pool:
+                    futures = [pool.submit(_frame_worker, t, *frame_args, cached_entry=manifest['frames'].get(str(t)),
+                                           keep_meshes=keep_meshes)
+                               for t in frames]
+                    for future in as_completed(futures):
                         try:
-                            target_f = int(len(n_mesh.faces) * NUCLEI_REDUCTION)
-                            if target_f > 10:
-                                n_mesh = n_mesh.simplify_quadratic_decimation(target_f)
-                        except Exception:
-                            pass
-
-                    n_mesh.vertices -= global_center
-                    n_mesh.vertices *= BLENDER_SCALE
-
-                    # Dodajemy do sceny klatki.
-                    # WAŻNE: W OBJ nazwa obiektu to node_name
-                    n_node_name = f"Nucleus_{region.label}"
-                    frame_scene.add_geometry(n_mesh, node_name=n_node_name)
-
-                    nuclei_in_frame += 1
-
-                except Exception:
-                    pass
-
-            # ZAPIS DO PLIKU OBJ (Dla skryptu objstoglbnuclei.py)
-            if nuclei_in_frame > 0:
-                nuclei_filename = f"{exp_name}_Frame_T{frame_idx:03d}.obj"
-                frame_scene.export(os.path.join(output_nuclei, nuclei_filename))
-                print(f"    Saved {nuclei_in_frame} nuclei to {nuclei_filename}")
+                            record_frame(*future.result())
+                        except Exception as e:
+                            print(f"    Error in frame worker: {e}")
+        finally:
+            _WORKER_READER = None
+            reader.close()
+
+    print(f"Cache: reused {reused} of {len(frames)} frames")
+
+    # --- ŚLEDZENIE: stałe ID jąder między klatkami (tabela zawsze liczona od nowa - tania) ---
+    frame_regions = load_frame_regions(manifest, frames, output_nuclei)
+    with timer.stage('tracking'):
+        tracks = link_nuclei(frame_regions, output_folder, exp_name, params)
+    # --- MORFOMETRIA: cechy jąder z tabel regionów (bez ponownej segmentacji) ---
+    with timer.stage('morphometrics'):
+        rows = write_morphometrics(morphometrics_path(output_folder, exp_name), frame_regions, tracks)
+    print(f"Saved morphometrics of {rows} nuclei: {morphometrics_path(output_folder, exp_name)}")
+
+    # --- PIRAMIDA PRZEKROJÓW dla widoku recenzji (pomijana, jeśli plik się nie zmienił) ---
+    if slice_pyramid_folder is not None:
+        with timer.stage('slice_pyramid'):
+            with HyperstackReader(input_file_path) as pyramid_reader:
+                build_pyramid(pyramid_reader, input_file_path, os.path.join(slice_pyramid_folder, exp_name))
+
+    # --- GLB (zamiast OBJ -> Blender -> GLB) ---
+    if glb_folder is not None:
+        with timer.stage('glb'):
+            write_glbs(frame_meshes, exp_name, glb_folder, compression, tracks, params)
+
+    print("--- Finished ---")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Segmentacja i meshowanie stosu ImageJ (TZCYX) do plików OBJ")
+    parser.add_argument('input_file_path')
+    parser.add_argument('output_folder')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('PIPELINE_WORKERS', 1)),
+                        help="Liczba procesów (0 = wszystkie rdzenie)")
+    parser.add_argument('--no-cache', action='store_true', help="Przelicz wszystkie klatki, ignorując manifest")
+    parser.add_argument('--glb-folder', default=None, help="Folder glbs/ - zapisuje <folder>/outer i <folder>/inner")
+    parser.add_argument('--compression', choices=['quantize', 'meshopt'], default=os.environ.get('GLB_COMPRESSION') or None,
+                        help="Kompresja opublikowanych GLB (domyślnie brak)")
+    parser.add_argument('--frame-glb-folder', default=None,
+                        help="Zapisuj GLB każdej klatki od razu po niej (<folder>/<exp>/<warstwa>/frame_NNNN.glb)")
+    parser.add_argument('--package-only', action='store_true',
+                        help="Tylko etap GLB z już zapisanych klatek (wymaga --glb-folder)")
+    parser.add_argument('--slice-pyramid-folder', default=None,
+                        help="Piramida kafli przekrojów XY/XZ/YZ i MIP surowego stosu (<folder>/<exp>)")
+    parser.add_argument('--params', default=None,
+                        help="Nadpisania DEFAULT_PARAMS jako JSON albo @plik.json (profil parametrów)")
+    parser.add_argument('--profile', default=None, help="Nazwa profilu parametrów (zapisywana z wynikami)")
+    parser.add_argument('--metrics-file', default=None,
+                        help="JSON z czasami i pamięcią etapów (per klatka), zapisywany także po błędzie")
+    args = parser.parse_args()
+    exp_name = os.path.splitext(os.path.basename(args.input_file_path))[0]
+    timer = StageTimer()
+    try:
+        with timer.stage('total'):
+            if args.package_only:
+                package_glbs(args.output_folder, exp_name, args.glb_folder, args.compression, timer=timer)
             else:
-                print("    No nuclei found.")
-
-        except Exception as e:
-            print(f"    Error processing nuclei seg: {e}")
-
-    print("--- Finished ---")
\ No newline at end of file
+                process_pipeline(args.input_file_path, args.output_folder, workers=args.workers,
+                                 use_cache=not args.no_cache, glb_folder=args.glb_folder,
+                                 compression=args.compression, timer=timer,
+                                 frame_glb_folder=args.frame_glb_folder,
+                                 params=load_params_arg(args.params) if args.params else None, profile=args.profile,
+                                 slice_pyramid_folder=args.slice_pyramid_folder)
+    finally:
+        if args.metrics_file:
+            timer.write(args.metrics_file, exp_name=exp_name, package_only=args.package_only,
+                        workers=args.workers, pipeline_version=PIPELINE_VERSION, profile=args.profile)
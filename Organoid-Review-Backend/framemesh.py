@@ -0,0 +1,119 @@
+import json
+import struct
+import numpy as np
+
+
+# Binarny kontener siatek jednej klatki (zamiast tekstowego OBJ):
+#   MAGIC | uint32 długość nagłówka | nagłówek JSON | sekcje danych wyrównane do 16 bajtów
+# Sekcje: vertices float32 (N, 3), faces uint32 (M, 3), vertex_offsets / face_offsets int64 (K + 1), labels int64 (K).
+MAGIC = b'ORGMESH\x01'
+EXTENSION = '.orgm'
+ALIGNMENT = 16
+
+SECTIONS = (
+    ('vertices', np.float32, 3),
+    ('faces', np.uint32, 3),
+    ('vertex_offsets', np.int64, 1),
+    ('face_offsets', np.int64, 1),
+    ('labels', np.int64, 1),
+)
+
+
+class FrameMesh:
+    """Siatki jednej klatki we wspólnym buforze; obiekt i to zakres vertex_offsets[i]..vertex_offsets[i + 1]."""
+
+    def __init__(self, vertices, faces, vertex_offsets, face_offsets, names, labels=None, meta=None):
+        self.vertices = vertices
+        self.faces = faces
+        self.vertex_offsets = vertex_offsets
+        self.face_offsets = face_offsets
+        self._names = list(names)
+        self.labels = labels if labels is not None else np.arange(len(self._names), dtype=np.int64)
+        self.meta = meta or {}
+
+    def __len__(self):
+        return len(self._names)
+
+    def names(self):
+        return list(self._names)
+
+    def mesh(self, i):
+        """(vertices, faces) obiektu i z lokalnymi indeksami ścian."""
+        v0, v1 = self.vertex_offsets[i], self.vertex_offsets[i + 1]
+        f0, f1 = self.face_offsets[i], self.face_offsets[i + 1]
+        return self.vertices[v0:v1], self.faces[f0:f1] - np.uint32(v0)
+
+
+def _align(offset):
+    return offset + (-offset) % ALIGNMENT
+
+
+def write_frame_mesh(path, vertices, faces, vertex_offsets=None, face_offsets=None, names=None, labels=None, meta=None):
+    """Zapis klatki; bez offsetów cały bufor to jeden obiekt."""
+    vertices = np.ascontiguousarray(vertices, dtype=np.float32).reshape(-1, 3)
+    faces = np.ascontiguousarray(faces, dtype=np.uint32).reshape(-1, 3)
+    if vertex_offsets is None:
+        vertex_offsets = [0, len(vertices)]
+        face_offsets = [0, len(faces)]
+    names = list(names) if names is not None else [f"Object_{i}" for i in range(len(vertex_offsets) - 1)]
+    if labels is None:
+        labels = np.arange(len(names))
+
+    arrays = {
+        'vertices': vertices,
+        'faces': faces,
+        'vertex_offsets': np.ascontiguousarray(vertex_offsets, dtype=np.int64),
+        'face_offsets': np.ascontiguousarray(face_offsets, dtype=np.int64),
+        'labels': np.ascontiguousarray(labels, dtype=np.int64),
+    }
+
+    # Offsety sekcji liczone względem początku danych (za nagłówkiem)
+    sections = {}
+    offset = 0
+    for key, dtype, width in SECTIONS:
+        offset = _align(offset)
+        sections[key] = {'offset': offset, 'rows': int(len(arrays[key]))}
+        offset += arrays[key].nbytes
+
+    header = json.dumps({'names': names, 'meta': meta or {}, 'sections': sections}).encode('utf-8')
+    data_start = _align(len(MAGIC) + 4 + len(header))
+    header += b' ' * (data_start - len(MAGIC) - 4 - len(header))
+
+    parts = [MAGIC, struct.pack('<I', len(header)), header]
+    position = 0
+    for key, _, _ in SECTIONS:
+        padding = sections[key]['offset'] - position
+        parts.append(b'\x00' * padding)
+        parts.append(arrays[key].tobytes())
+        position = sections[key]['offset'] + arrays[key].nbytes
+
+    with open(path, 'wb') as f:
+        f.write(b''.join(parts))
+
+
+def read_frame_mesh(path, mmap=True):
+    """Odczyt klatki; przy mmap=True tablice są widokami np.memmap na plik (bez kopiowania)."""
+    with open(path, 'rb') as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            raise ValueError(f"Not an {EXTENSION} file: {path}")
+        header_len, = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_len).decode('utf-8'))
+        data_start = len(MAGIC) + 4 + header_len
+        if not mmap:
+            data = f.read()
+
+    arrays = {}
+    for key, dtype, width in SECTIONS:
+        section = header['sections'][key]
+        shape = (section['rows'], width) if width > 1 else (section['rows'],)
+        if section['rows'] == 0:
+            arrays[key] = np.zeros(shape, dtype=dtype)
+        elif mmap:
+            arrays[key] = np.memmap(path, dtype=dtype, mode='r', offset=data_start + section['offset'], shape=shape)
+        else:
+            arrays[key] = np.frombuffer(data, dtype=dtype, count=int(np.prod(shape)),
+                                        offset=section['offset']).reshape(shape)
+
+    return FrameMesh(arrays['vertices'], arrays['faces'], arrays['vertex_offsets'], arrays['face_offsets'],
+                     header['names'], labels=arrays['labels'], meta=header['meta'])
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import shutil
+import struct
+import subprocess
+import numpy as np
+
+from glbwriter import (GlbBuilder, GLB_MAGIC, CHUNK_JSON, CHUNK_BIN, BYTE, UNSIGNED_SHORT, FLOAT,
+                       ARRAY_BUFFER, write_precompressed)
+
+
+# 'quantize' - KHR_mesh_quantization (pozycje uint16 + transformacja węzła, normalne int8), bez zależności
+# 'meshopt'  - gltfpack (-cc): kwantyzacja + EXT_meshopt_compression; useGLTF z drei dekoduje to sam
+METHODS = ('quantize', 'meshopt')
+GLTFPACK_BIN = os.environ.get('GLTFPACK_BIN', 'gltfpack')
+
+COMPONENT_DTYPES = {5120: np.int8, 5121: np.uint8, 5122: np.int16, 5123: np.uint16, 5125: np.uint32, 5126: np.float32}
+TYPE_WIDTHS = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4, 'MAT4': 16}
+
+
+def read_glb(path):
+    """Zwraca (gltf JSON, bajty chunku BIN)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, _ = struct.unpack_from('<III', data, 0)
+    if magic != GLB_MAGIC or version != 2:
+        raise ValueError(f"Not a glTF 2.0 binary: {path}")
+    json_len, chunk_type = struct.unpack_from('<II', data, 12)
+    if chunk_type != CHUNK_JSON:
+        raise ValueError(f"Missing JSON chunk: {path}")
+    gltf = json.loads(data[20:20 + json_len])
+    binary = b''
+    offset = 20 + json_len
+    if offset < len(data):
+        bin_len, chunk_type = struct.unpack_from('<II', data, offset)
+        if chunk_type == CHUNK_BIN:
+            binary = data[offset + 8:offset + 8 + bin_len]
+    return gltf, binary
+
+
+def accessor_array(gltf, binary, index):
+    """Dane accessora jako tablica numpy (uwzględnia byteStride i normalizację)."""
+    accessor = gltf['accessors'][index]
+    view = gltf['bufferViews'][accessor['bufferView']]
+    dtype = np.dtype(COMPONENT_DTYPES[accessor['componentType']])
+    width = TYPE_WIDTHS[accessor['type']]
+    count = accessor['count']
+    start = view.get('byteOffset', 0) + accessor.get('byteOffset', 0)
+    stride = view.get('byteStride', dtype.itemsize * width)
+
+    raw = np.frombuffer(binary, dtype=np.uint8, count=stride * (count - 1) + dtype.itemsize * width, offset=start)
+    array = np.lib.stride_tricks.as_strided(raw, shape=(count, dtype.itemsize * width), strides=(stride, 1))
+    array = np.ascontiguousarray(array).view(dtype).reshape(count, width)
+    if accessor.get('normalized'):
+        array = array.astype(np.float32) / np.iinfo(dtype).max
+    return array if width > 1 else array[:, 0]
+
+
+def _quantize_positions(vertices):
+    # Siatka 16-bit na bbox siatki; dekwantyzacja przez translation/scale węzła. Krok jednakowy dla osi
+    # (najdłuższy bok / 65535): przy niejednorodnej skali three.js przepuszcza normalne przez odwrotność
+    # transpozycji skali i cieniowanie się przekrzywia
+    low = vertices.min(axis=0)
+    extent = float((vertices.max(axis=0) - low).max())
+    step = np.full(3, extent / 65535.0 if extent > 0 else 1.0)
+    quantized = np.zeros((len(vertices), 4), dtype=np.uint16)
+    quantized[:, :3] = np.rint((vertices - low) / step)
+    return quantized, low, step
+
+
+def _quantize_normals(normals):
+    quantized = np.zeros((len(normals), 4), dtype=np.int8)
+    quantized[:, :3] = np.rint(np.clip(normals, -1.0, 1.0) * 127.0)
+    return quantized
+
+
+def quantize_glb(src_path, dst_path):
+    """Przepisuje GLB z glbwriter na KHR_mesh_quantization; węzły i animacje bez zmian."""
+    gltf, binary = read_glb(src_path)
+    builder = GlbBuilder()
+    builder.gltf['scenes'] = gltf['scenes']
+    builder.gltf['scene'] = gltf.get('scene', 0)
+
+    accessor_map = {}
+
+    def copy_accessor(index):
+        if index not in accessor_map:
+            accessor = gltf['accessors'][index]
+            extra = {key: accessor[key] for key in ('min', 'max', 'normalized') if key in accessor}
+            target = gltf['bufferViews'][accessor['bufferView']].get('target')
+            accessor_map[index] = builder.add_accessor(accessor_array(gltf, binary, index), accessor['componentType'],
+                                                       accessor['type'], target, **extra)
+        return accessor_map[index]
+
+    dequantize = {}
+    for mesh_index, mesh in enumerate(gltf.get('meshes', [])):
+        primitives = []
+        for primitive in mesh['primitives']:
+            attributes = dict(primitive['attributes'])
+            vertices = accessor_array(gltf, binary, attributes['POSITION'])
+            quantized, low, step = _quantize_positions(vertices)
+            attributes['POSITION'] = builder.add_accessor(
+                quantized, UNSIGNED_SHORT, 'VEC3', ARRAY_BUFFER, byte_stride=8,
+                min=quantized[:, :3].min(axis=0).tolist(), max=quantized[:, :3].max(axis=0).tolist())
+            if 'NORMAL' in attributes:
+                normals = accessor_array(gltf, binary, attributes['NORMAL'])
+                attributes['NORMAL'] = builder.add_accessor(_quantize_normals(normals), BYTE, 'VEC3', ARRAY_BUFFER,
+                                                            byte_stride=4, normalized=True)
+            for key in attributes:
+                if key not in ('POSITION', 'NORMAL'):
+                    attributes[key] = copy_accessor(attributes[key])
+            new_primitive = dict(primitive, attributes=attributes)
+            if 'indices' in primitive:
+                new_primitive['indices'] = copy_accessor(primitive['indices'])
+            if 'targets' in primitive:
+                # Delty morph targetów (otoczka CoatMorph) w jednostkach siatki kwantyzacji - skala węzła działa
+                # także na nie; float32 jest dozwolony obok KHR_mesh_quantization. Delty normalnych zostają
+                # bez zmian - jednorodna skala nie zmienia ich kierunku
+                targets = []
+                for target in primitive['targets']:
+                    target = dict(target)
+                    deltas = (accessor_array(gltf, binary, target['POSITION']) / step).astype(np.float32)
+                    target['POSITION'] = builder.add_accessor(deltas, FLOAT, 'VEC3', ARRAY_BUFFER, with_bounds=True)
+                    for key in target:
+                        if key != 'POSITION':
+                            target[key] = copy_accessor(target[key])
+                    targets.append(target)
+                new_primitive['targets'] = targets
+            primitives.append(new_primitive)
+            # glTF: jedna transformacja na węzeł, więc siatka ma jeden prymityw (tak pisze glbwriter)
+            dequantize[mesh_index] = (low, step)
+        builder.gltf['meshes'].append(dict(mesh, primitives=primitives))
+
+    for node in gltf['nodes']:
+        node = dict(node)
+        if 'mesh' in node and node['mesh'] in dequantize:
+            low, step = dequantize[node['mesh']]
+            node['translation'] = [float(c) for c in low]
+            node['scale'] = [float(c) for c in step]
+        builder.gltf['nodes'].append(node)
+
+    animations = []
+    for animation in gltf.get('animations', []):
+        samplers = [dict(sampler, input=copy_accessor(sampler['input']), output=copy_accessor(sampler['output']))
+                    for sampler in animation['samplers']]
+        animations.append(dict(animation, samplers=samplers))
+    if animations:
+        builder.gltf['animations'] = animations
+
+    builder.gltf['extensionsUsed'] = ['KHR_mesh_quantization']
+    builder.gltf['extensionsRequired'] = ['KHR_mesh_quantization']
+    builder.write(dst_path)
+
+
+def meshopt_glb(src_path, dst_path):
+    """gltfpack: kwantyzacja + EXT_meshopt_compression, z zachowaniem nazw węzłów (Frame_*, Nucleus_*)."""
+    binary = shutil.which(GLTFPACK_BIN)
+    if binary is None:
+        raise RuntimeError(f"gltfpack not found ({GLTFPACK_BIN}), set GLTFPACK_BIN or use 'quantize'")
+    subprocess.run([binary, '-i', src_path, '-o', dst_path, '-cc', '-kn', '-km'],
+                   check=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+
+def _python_decode_ms(path):
+    # Przybliżony koszt dekodowania: parsowanie GLB + odczyt (i dekwantyzacja) wszystkich pozycji
+    start = time.perf_counter()
+    gltf, binary = read_glb(path)
+    nodes_by_mesh = {node['mesh']: node for node in gltf['nodes'] if 'mesh' in node}
+    for mesh_index, mesh in enumerate(gltf.get('meshes', [])):
+        for primitive in mesh['primitives']:
+            positions = accessor_array(gltf, binary, primitive['attributes']['POSITION']).astype(np.float32)
+            node = nodes_by_mesh.get(mesh_index, {})
+            if 'scale' in node:
+                positions = positions * node['scale'] + node.get('translation', 0.0)
+    return (time.perf_counter() - start) * 1000.0
+
+
+def compress_glb(glb_path, method='quantize'):
+    """Podmienia opublikowany GLB na skompresowany i zwraca raport rozmiaru / czasu."""
+    if method not in METHODS:
+        raise ValueError(f"Unknown GLB compression method: {method}")
+
+    tmp_path = glb_path + '.compressed.tmp'
+    raw_bytes = os.path.getsize(glb_path)
+    raw_decode_ms = _python_decode_ms(glb_path)
+
+    start = time.perf_counter()
+    if method == 'quantize':
+        quantize_glb(glb_path, tmp_path)
+    else:
+        meshopt_glb(glb_path, tmp_path)
+    encode_ms = (time.perf_counter() - start) * 1000.0
+
+    report = {
+        'method': method,
+        'raw_bytes': raw_bytes,
+        'compressed_bytes': os.path.getsize(tmp_path),
+        'encode_ms': round(encode_ms, 1),
+        'raw_decode_ms': round(raw_decode_ms, 1),
+        # meshopt dekoduje WASM w przeglądarce - w Pythonie nie da się tego zmierzyć
+        'decode_ms': round(_python_decode_ms(tmp_path), 1) if method == 'quantize' else None
+    }
+    report['ratio'] = round(report['compressed_bytes'] / raw_bytes, 4) if raw_bytes else None
+
+    os.replace(tmp_path, glb_path)
+    write_precompressed(glb_path)
+    report['gzip_bytes'] = os.path.getsize(glb_path + '.gz')
+    if os.path.exists(glb_path + '.br'):
+        report['brotli_bytes'] = os.path.getsize(glb_path + '.br')
+    return report
+
+
+def write_report(report_path, reports):
+    tmp_path = report_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(reports, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, report_path)
@@ -0,0 +1,259 @@
+import os
+import gzip
+import json
+import shutil
+import struct
+import numpy as np
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+FPS = 10
+
+# Pozycje kontenerów klatek (glTF jest Y-up: "pod ziemią" w Blenderze to -Y)
+VISIBLE_LOC = (0.0, 0.0, 0.0)
+HIDDEN_LOC = (0.0, -10000.0, 0.0)
+
+GLB_MAGIC = 0x46546C67
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+
+BYTE = 5120
+FLOAT = 5126
+UNSIGNED_SHORT = 5123
+UNSIGNED_INT = 5125
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+
+def vertex_normals(vertices, faces):
+    """Normalne wierzchołków ważone polem ścian (to samo co 'Shade Smooth' w Blenderze)."""
+    tris = vertices[faces]
+    face_normals = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+    normals = np.zeros_like(vertices)
+    for k in range(3):
+        np.add.at(normals, faces[:, k], face_normals)
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals /= np.where(lengths > 0, lengths, 1.0)
+    return normals.astype(np.float32)
+
+
+def orient_outward(vertices, faces):
+    """Odpowiednik normals_make_consistent(inside=False): odwraca ściany, gdy objętość ze znakiem jest ujemna."""
+    tris = vertices[faces].astype(np.float64)
+    signed_volume = np.einsum('ij,ij->i', tris[:, 0], np.cross(tris[:, 1], tris[:, 2])).sum()
+    if signed_volume < 0:
+        return faces[:, ::-1].copy()
+    return faces
+
+
+class GlbBuilder:
+    """Składa JSON glTF i jeden bufor binarny; plik zapisywany jest jednym write()."""
+
+    def __init__(self):
+        self.gltf = {
+            'asset': {'version': '2.0', 'generator': 'Organoid Review glbwriter'},
+            'scene': 0,
+            'scenes': [{'nodes': []}],
+            'nodes': [],
+            'meshes': [],
+            'accessors': [],
+            'bufferViews': [],
+            'buffers': []
+        }
+        self._chunks = []
+        self._length = 0
+
+    def add_buffer_view(self, data, target=None, byte_stride=None):
+        data = np.ascontiguousarray(data)
+        view = {'buffer': 0, 'byteOffset': self._length, 'byteLength': data.nbytes}
+        if target is not None:
+            view['target'] = target
+        if byte_stride is not None:
+            view['byteStride'] = byte_stride
+        self._chunks.append(data.tobytes())
+        self._length += data.nbytes
+        padding = (-self._length) % 4
+        if padding:
+            self._chunks.append(b'\x00' * padding)
+            self._length += padding
+        self.gltf['bufferViews'].append(view)
+        return len(self.gltf['bufferViews']) - 1
+
+    def add_accessor(self, data, component_type, accessor_type, target=None, with_bounds=False, byte_stride=None,
+                     **extra):
+        view = self.add_buffer_view(data, target, byte_stride)
+        accessor = {
+            'bufferView': view,
+            'componentType': component_type,
+            'count': int(len(data)),
+            'type': accessor_type
+        }
+        if with_bounds:
+            accessor['min'] = np.asarray(data).min(axis=0).tolist()
+            accessor['max'] = np.asarray(data).max(axis=0).tolist()
+        accessor.update(extra)
+        self.gltf['accessors'].append(accessor)
+        return len(self.gltf['accessors']) - 1
+
+    def add_mesh(self, name, vertices, faces, normals=None):
+        vertices = np.asarray(vertices, dtype=np.float32)
+        faces = np.asarray(faces)
+        if normals is None:
+            normals = vertex_normals(vertices, faces)
+        if len(vertices) < 65536:
+            indices, index_type = faces.astype(np.uint16).ravel(), UNSIGNED_SHORT
+        else:
+            indices, index_type = faces.astype(np.uint32).ravel(), UNSIGNED_INT
+
+        primitive = {
+            'attributes': {
+                'POSITION': self.add_accessor(vertices, FLOAT, 'VEC3', ARRAY_BUFFER, with_bounds=True),
+                'NORMAL': self.add_accessor(normals, FLOAT, 'VEC3', ARRAY_BUFFER)
+            },
+            'indices': self.add_accessor(indices, index_type, 'SCALAR', ELEMENT_ARRAY_BUFFER),
+            'mode': 4
+        }
+        self.gltf['meshes'].append({'name': name, 'primitives': [primitive]})
+        return len(self.gltf['meshes']) - 1
+
+    def add_node(self, node, root=False):
+        self.gltf['nodes'].append(node)
+        index = len(self.gltf['nodes']) - 1
+        if root:
+            self.gltf['scenes'][0]['nodes'].append(index)
+        return index
+
+    def to_bytes(self):
+        self.gltf['buffers'] = [{'byteLength': self._length}] if self._length else []
+        for key in ('meshes', 'accessors', 'bufferViews', 'buffers', 'animations'):
+            if key in self.gltf and not self.gltf[key]:
+                del self.gltf[key]
+
+        json_bytes = json.dumps(self.gltf, separators=(',', ':')).encode('utf-8')
+        json_bytes += b' ' * ((-len(json_bytes)) % 4)
+        total = 12 + 8 + len(json_bytes) + (8 + self._length if self._length else 0)
+
+        parts = [struct.pack('<III', GLB_MAGIC, 2, total), struct.pack('<II', len(json_bytes), CHUNK_JSON), json_bytes]
+        if self._length:
+            parts.append(struct.pack('<II', self._length, CHUNK_BIN))
+            parts.extend(self._chunks)
+        return b''.join(parts)
+
+    def write(self, path):
+        # Podmiana atomowa - serwer nigdy nie wyśle połowy pliku
+        with open(path + '.tmp', 'wb') as f:
+            f.write(self.to_bytes())
+        os.replace(path + '.tmp', path)
+
+
+def write_animated_glb(path, frames, fps=FPS, visibility='translation', outward_normals=False):
+    """Animacja "teleportacji" jak w ObjsToGlbCoat/ObjsToGlbNuclei:
+    frames to lista klatek, klatka to lista (name, vertices, faces).
+    Każda klatka to kontener Frame_<i> z siatkami jako dziećmi; w klatce t widoczny jest tylko Frame_t
+    (ścieżka translation albo scale, interpolacja STEP, jedna animacja 'VisTrack')."""
+    builder = GlbBuilder()
+    total_frames = len(frames)
+
+    containers = []
+    for i, meshes in enumerate(frames):
+        children = []
+        for name, vertices, faces in meshes:
+            if len(faces) == 0:
+                continue
+            vertices = np.asarray(vertices, dtype=np.float32)
+            if outward_normals:
+                faces = orient_outward(vertices, np.asarray(faces))
+            mesh_index = builder.add_mesh(name, vertices, faces)
+            children.append(builder.add_node({'name': name, 'mesh': mesh_index}))
+
+        container = {'name': f"Frame_{i}", 'children': children}
+        if visibility == 'scale':
+            container['scale'] = [1.0, 1.0, 1.0] if i == 0 else [0.0, 0.0, 0.0]
+        else:
+            container['translation'] = list(VISIBLE_LOC if i == 0 else HIDDEN_LOC)
+        if not children:
+            del container['children']
+        containers.append(builder.add_node(container, root=True))
+
+    if total_frames > 1:
+        times = np.arange(total_frames, dtype=np.float32) / fps
+        time_accessor = builder.add_accessor(times, FLOAT, 'SCALAR', min=[float(times[0])], max=[float(times[-1])])
+        if visibility == 'scale':
+            path_name, shown, hidden = 'scale', (1.0, 1.0, 1.0), (0.0, 0.0, 0.0)
+        else:
+            path_name, shown, hidden = 'translation', VISIBLE_LOC, HIDDEN_LOC
+
+        samplers, channels = [], []
+        for i, node in enumerate(containers):
+            values = np.tile(np.asarray(hidden, dtype=np.float32), (total_frames, 1))
+            values[i] = shown
+            samplers.append({
+                'input': time_accessor,
+                'output': builder.add_accessor(values, FLOAT, 'VEC3'),
+                'interpolation': 'STEP'
+            })
+            channels.append({'sampler': i, 'target': {'node': node, 'path': path_name}})
+        builder.gltf['animations'] = [{'name': 'VisTrack', 'samplers': samplers, 'channels': channels}]
+
+    builder.write(path)
+
+
+def write_morph_glb(path, name, faces, positions, fps=FPS):
+    """Otoczka jako jedna siatka z morph targetami: baza = positions[0], target i = przesunięcia
+    (pozycje i normalne) klatki i + 1 względem bazy. Animacja 'CoatMorph' kanałem 'weights'
+    z interpolacją LINEAR - między klatkami kształt przechodzi płynnie zamiast przeskakiwać.
+    Rozmiar rośnie o delty wierzchołków na klatkę, bez ścian i bez osobnych siatek."""
+    builder = GlbBuilder()
+    base = np.asarray(positions[0], dtype=np.float32)
+    base_normals = vertex_normals(base, faces)
+    mesh_index = builder.add_mesh(name, base, faces, base_normals)
+
+    targets = []
+    for vertices in positions[1:]:
+        vertices = np.asarray(vertices, dtype=np.float32)
+        targets.append({
+            'POSITION': builder.add_accessor(vertices - base, FLOAT, 'VEC3', ARRAY_BUFFER, with_bounds=True),
+            'NORMAL': builder.add_accessor(vertex_normals(vertices, faces) - base_normals, FLOAT, 'VEC3',
+                                           ARRAY_BUFFER)
+        })
+    mesh = builder.gltf['meshes'][mesh_index]
+    node = builder.add_node({'name': name, 'mesh': mesh_index}, root=True)
+
+    if targets:
+        mesh['primitives'][0]['targets'] = targets
+        mesh['weights'] = [0.0] * len(targets)
+        mesh['extras'] = {'targetNames': [f"Frame_{i}" for i in range(1, len(positions))]}
+        # Klatka 0 = same zera, klatka i = 1.0 na targecie i - 1
+        times = np.arange(len(positions), dtype=np.float32) / fps
+        weights = np.zeros((len(positions), len(targets)), dtype=np.float32)
+        weights[np.arange(1, len(positions)), np.arange(len(targets))] = 1.0
+        sampler = {
+            'input': builder.add_accessor(times, FLOAT, 'SCALAR', min=[float(times[0])], max=[float(times[-1])]),
+            'output': builder.add_accessor(weights.ravel(), FLOAT, 'SCALAR'),
+            'interpolation': 'LINEAR'
+        }
+        builder.gltf['animations'] = [{'name': 'CoatMorph', 'samplers': [sampler],
+                                       'channels': [{'sampler': 0, 'target': {'node': node, 'path': 'weights'}}]}]
+
+    builder.write(path)
+
+
+def write_precompressed(path):
+    """Warianty .glb.gz i .glb.br (jeśli jest moduł brotli) serwowane przez /organoid/<id>/<layer_type>."""
+    with open(path, 'rb') as src, gzip.open(path + '.gz.tmp', 'wb', compresslevel=9) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(path + '.gz.tmp', path + '.gz')
+
+    if brotli is not None:
+        with open(path, 'rb') as src:
+            data = brotli.compress(src.read(), quality=11)
+        with open(path + '.br.tmp', 'wb') as dst:
+            dst.write(data)
+        os.replace(path + '.br.tmp', path + '.br')
+    elif os.path.exists(path + '.br'):
+        # Stary wariant .br nie może przeżyć nowego pliku .glb
+        os.remove(path + '.br')
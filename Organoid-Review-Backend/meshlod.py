@@ -0,0 +1,44 @@
+import numpy as np
+import trimesh
+
+
+def decimate(vertices, faces, target_faces):
+    """Quadric decimation do ~target_faces ścian; gdy się nie da, zwraca siatkę bez zmian."""
+    if target_faces >= len(faces) or target_faces <= 10:
+        return vertices, faces
+    mesh = trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
+    try:
+        # trimesh >= 4 (backend fast-simplification)
+        reduced = mesh.simplify_quadric_decimation(face_count=target_faces)
+    except Exception:
+        try:
+            reduced = mesh.simplify_quadratic_decimation(target_faces)
+        except Exception:
+            return vertices, faces
+    return np.asarray(reduced.vertices, dtype=np.float32), np.asarray(reduced.faces, dtype=np.uint32)
+
+
+def decimate_objects(vertices, faces, vertex_offsets, face_offsets, fraction):
+    """Decymacja każdego obiektu wspólnego bufora osobno; zwraca nowy bufor z offsetami."""
+    count = len(vertex_offsets) - 1
+    out_vertices, out_faces = [], []
+    v_counts = np.zeros(count, dtype=np.int64)
+    f_counts = np.zeros(count, dtype=np.int64)
+    offset = 0
+    for i in range(count):
+        v0, v1 = vertex_offsets[i], vertex_offsets[i + 1]
+        f0, f1 = face_offsets[i], face_offsets[i + 1]
+        v, f = decimate(vertices[v0:v1], faces[f0:f1].astype(np.int64) - v0, int((f1 - f0) * fraction))
+        out_vertices.append(np.asarray(v, dtype=np.float32))
+        out_faces.append(np.asarray(f, dtype=np.int64) + offset)
+        v_counts[i], f_counts[i] = len(v), len(f)
+        offset += len(v)
+    if not count:
+        return vertices, faces, vertex_offsets, face_offsets
+    return (np.concatenate(out_vertices), np.concatenate(out_faces).astype(np.uint32),
+            np.concatenate([[0], np.cumsum(v_counts)]), np.concatenate([[0], np.cumsum(f_counts)]))
+
+
+def lod_suffix(level):
+    """Poziom 0 to pełna siatka bez sufiksu (stare nazwy plików), dalej '.lod1', '.lod2', ..."""
+    return f".lod{level}" if level else ''
@@ -0,0 +1,148 @@
+import os
+import shutil
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from tracking import frame_track_ids
+
+
+# Tabela cech jąder organoidu: wiersz = jądro w klatce, posortowana po (frame, label).
+# Jednostki: woksele pełnej rozdzielczości (objętość, centroid, bbox, pole powierzchni); intensywność kanału jąder.
+COLUMNS = {
+    'frame': np.int32,
+    'label': np.int64,
+    'track': np.int32,
+    'volume': np.int64,
+    'centroid_x': np.float32,
+    'centroid_y': np.float32,
+    'centroid_z': np.float32,
+    'bbox_x0': np.int32,
+    'bbox_y0': np.int32,
+    'bbox_z0': np.int32,
+    'bbox_x1': np.int32,
+    'bbox_y1': np.int32,
+    'bbox_z1': np.int32,
+    'mean_intensity': np.float32,
+    'surface_area': np.float32,
+    'sphericity': np.float32,
+}
+
+# Parquet (pyarrow) albo, bez pyarrow, katalog <exp>/ z jedną kolumną .npy na plik (czytany przez memmap)
+PARQUET_EXT = '.parquet'
+# Wiersze na row group Parquet - filtr po klatce / ścieżce czyta tylko grupy pasujące wg statystyk min/max
+BATCH_ROWS = 65536
+
+
+def morphometrics_path(output_folder, exp_name):
+    """Ścieżka bez rozszerzenia: <...>.parquet albo katalog kolumn .npy."""
+    return os.path.join(output_folder, 'output-morphometrics', exp_name)
+
+
+def frame_columns(t, regions, tracks=None):
+    """Kolumny jednej klatki z tabeli regionów (tracking.REGION_DTYPE), posortowane po etykiecie."""
+    regions = np.sort(regions, order='label')
+    centroid, bbox = regions['centroid'], regions['bbox']
+    columns = {
+        'frame': np.full(len(regions), t),
+        'label': regions['label'],
+        'track': frame_track_ids(tracks, t, regions['label']) if tracks is not None else np.zeros(len(regions)),
+        'volume': regions['volume'],
+        # (Z, Y, X) -> x, y, z
+        'centroid_x': centroid[:, 2], 'centroid_y': centroid[:, 1], 'centroid_z': centroid[:, 0],
+        'bbox_x0': bbox[:, 2], 'bbox_y0': bbox[:, 1], 'bbox_z0': bbox[:, 0],
+        'bbox_x1': bbox[:, 5], 'bbox_y1': bbox[:, 4], 'bbox_z1': bbox[:, 3],
+        'mean_intensity': regions['mean_intensity'],
+        'surface_area': regions['surface_area'],
+        'sphericity': regions['sphericity'],
+    }
+    return {name: np.asarray(columns[name], dtype=dtype) for name, dtype in COLUMNS.items()}
+
+
+def _replace(tmp_path, path):
+    # Stary wynik (także w drugim formacie) znika dopiero, gdy nowy jest kompletny
+    for old in (path, path + PARQUET_EXT):
+        if os.path.isdir(old):
+            shutil.rmtree(old)
+        elif os.path.exists(old):
+            os.remove(old)
+    os.replace(tmp_path, path + PARQUET_EXT if pq is not None else path)
+
+
+def write_morphometrics(path, frame_regions, tracks=None):
+    """Zapis porcjami klatek: row group Parquet co BATCH_ROWS wierszy, a bez pyarrow klatka po klatce
+    do kolumn .npy otwartych jako memmap (liczba wierszy jest znana z tabel regionów). Zwraca liczbę wierszy."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    frames = sorted(frame_regions)
+    total = sum(len(frame_regions[t]) for t in frames)
+    tmp_path = path + '.tmp'
+    if os.path.isdir(tmp_path):
+        shutil.rmtree(tmp_path)
+
+    if pq is not None:
+        schema = pa.schema([(name, pa.from_numpy_dtype(dtype)) for name, dtype in COLUMNS.items()])
+        batch = []
+        with pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer:
+            for i, t in enumerate(frames):
+                batch.append(frame_columns(t, frame_regions[t], tracks))
+                if sum(len(part['frame']) for part in batch) >= BATCH_ROWS or i == len(frames) - 1:
+                    writer.write_table(pa.table({name: np.concatenate([part[name] for part in batch])
+                                                 for name in COLUMNS}, schema=schema))
+                    batch = []
+    else:
+        os.makedirs(tmp_path)
+        arrays = {name: np.lib.format.open_memmap(os.path.join(tmp_path, name + '.npy'), mode='w+', dtype=dtype,
+                                                  shape=(total,))
+                  for name, dtype in COLUMNS.items()}
+        row = 0
+        for t in frames:
+            columns = frame_columns(t, frame_regions[t], tracks)
+            n = len(columns['frame'])
+            for name, array in arrays.items():
+                array[row:row + n] = columns[name]
+            row += n
+        for array in arrays.values():
+            array.flush()
+        del arrays
+
+    _replace(tmp_path, path)
+    return total
+
+
+def read_morphometrics(path, columns=None, frame_from=None, frame_to=None, track=None, offset=0, limit=None):
+    """Wycinek tabeli bez wczytywania całości: (liczba pasujących wierszy, {kolumna: tablica}).
+    Parquet - filtr na row groupach i tylko wybrane kolumny; kolumny .npy - memmap i wyszukiwanie binarne
+    po posortowanej kolumnie frame. None = brak tabeli."""
+    columns = list(columns or COLUMNS)
+    if pq is not None and os.path.isfile(path + PARQUET_EXT):
+        filters = []
+        if frame_from is not None:
+            filters.append(('frame', '>=', frame_from))
+        if frame_to is not None:
+            filters.append(('frame', '<=', frame_to))
+        if track is not None:
+            filters.append(('track', '==', track))
+        table = pq.read_table(path + PARQUET_EXT, columns=columns, filters=filters or None)
+        total = table.num_rows
+        table = table.slice(offset, limit)
+        return total, {name: table.column(name).to_numpy() for name in columns}
+
+    if not os.path.isdir(path):
+        return None
+    frame = np.load(os.path.join(path, 'frame.npy'), mmap_mode='r')
+    start = int(np.searchsorted(frame, frame_from, 'left')) if frame_from is not None else 0
+    stop = int(np.searchsorted(frame, frame_to, 'right')) if frame_to is not None else len(frame)
+    stop = max(start, stop)
+    if track is not None:
+        rows = start + np.flatnonzero(np.load(os.path.join(path, 'track.npy'), mmap_mode='r')[start:stop] == track)
+        total = len(rows)
+        rows = rows[offset:offset + limit if limit is not None else None]
+    else:
+        total = stop - start
+        rows = slice(start + offset, min(stop, start + offset + limit) if limit is not None else stop)
+    return total, {name: np.asarray(np.load(os.path.join(path, name + '.npy'), mmap_mode='r')[rows])
+                   for name in columns}
@@ -0,0 +1,229 @@
+import numpy as np
+from scipy import ndimage
+from skimage import measure
+from tracking import REGION_DTYPE
+
+
+# Ile wokseli (float32) może mieć jedna paczka boxów jąder przed marching cubes
+BATCH_VOXELS = 32 * 1024 * 1024
+
+
+class NucleiBatch:
+    """Wszystkie jądra klatki w jednym buforze: jądro i ma wierzchołki
+    vertices[vertex_offsets[i]:vertex_offsets[i + 1]] i ściany faces[face_offsets[i]:face_offsets[i + 1]]
+    (indeksy ścian są globalne w obrębie bufora).
+    regions: tabela tracking.REGION_DTYPE (centroid, objętość, bbox w wokselach wolumenu) - tylko z mesh_nuclei."""
+
+    def __init__(self, labels, vertices, faces, vertex_offsets, face_offsets, regions=None):
+        self.labels = labels
+        self.vertices = vertices
+        self.faces = faces
+        self.vertex_offsets = vertex_offsets
+        self.face_offsets = face_offsets
+        self.regions = regions
+
+    def __len__(self):
+        return len(self.labels)
+
+    def names(self):
+        return [f"Nucleus_{label}" for label in self.labels]
+
+    def mesh(self, i):
+        """(vertices, faces) jednego jądra z lokalnymi indeksami ścian."""
+        v0, v1 = self.vertex_offsets[i], self.vertex_offsets[i + 1]
+        f0, f1 = self.face_offsets[i], self.face_offsets[i + 1]
+        return self.vertices[v0:v1], self.faces[f0:f1] - v0
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros(0, dtype=np.int64), np.zeros((0, 3), dtype=np.float32),
+                   np.zeros((0, 3), dtype=np.uint32), np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64))
+
+
+def _gather_ranges(starts, counts):
+    # Indeksy [s0..s0+c0) + [s1..s1+c1) + ... bez pętli w Pythonie
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    shifts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    return np.arange(total, dtype=np.int64) + shifts
+
+
+def _mesh_batch(labels, vol_raw, batch, slices, pad, sigma, thresh_factor):
+    """Pakuje boxy jąder w jeden wolumen (n, sz, sy, sx), wygładza i robi JEDNO marching cubes.
+    Przy okazji maski liczy centroidy jąder (Z, Y, X), liczby wokseli i średnią intensywność do tabeli regionów."""
+    n = len(batch)
+    shapes = np.array([[s.stop - s.start for s in slices[lab - 1]] for lab in batch])
+    slot_shape = tuple(int(d) for d in shapes.max(axis=0) + 2 * pad)
+    origins = np.array([[s.start for s in slices[lab - 1]] for lab in batch], dtype=np.float32)
+
+    atlas = np.zeros((n,) + slot_shape, dtype=np.float32)
+    centroids = np.zeros((n, 3), dtype=np.float64)
+    volumes = np.zeros(n, dtype=np.int64)
+    intensities = np.zeros(n, dtype=np.float64)
+    for i, lab in enumerate(batch):
+        sl = slices[lab - 1]
+        dz, dy, dx = shapes[i]
+        view = atlas[i, pad:pad + dz, pad:pad + dy, pad:pad + dx]
+        mask = labels[sl] == lab
+        raw = vol_raw[sl]
+        np.copyto(view, raw, where=mask)
+        # Centroid z rzutów maski na osie - bez np.nonzero na całym boxie
+        volumes[i] = count = max(int(mask.sum()), 1)
+        intensities[i] = np.sum(raw, where=mask, dtype=np.float64) / count
+        for axis, other in enumerate(((1, 2), (0, 2), (0, 1))):
+            centroids[i, axis] = np.dot(mask.sum(axis=other), np.arange(shapes[i][axis])) / count
+    centroids += origins
+
+    # Rozmycie tylko w osiach przestrzennych - boxy nie przeciekają do siebie
+    atlas = ndimage.gaussian_filter(atlas, sigma=(0, sigma, sigma, sigma), mode='constant')
+
+    # Normalizacja do max=1 w każdym boxie -> wspólny próg = NUCLEI_THRESH_FACTOR
+    maxima = atlas.reshape(n, -1).max(axis=1)
+    atlas /= np.where(maxima > 0, maxima, 1.0)[:, None, None, None]
+
+    stack = atlas.reshape(n * slot_shape[0], slot_shape[1], slot_shape[2])
+    try:
+        verts, faces, _, _ = measure.marching_cubes(stack, thresh_factor)
+    except (ValueError, RuntimeError):
+        return None
+
+    slot = (verts[:, 0] // slot_shape[0]).astype(np.int64)
+    face_slot = slot[faces[:, 0]]
+
+    # Grupowanie wierzchołków i ścian po boxie
+    v_order = np.argsort(slot, kind='stable')
+    inverse = np.empty_like(v_order)
+    inverse[v_order] = np.arange(len(v_order))
+    verts = verts[v_order]
+    slot = slot[v_order]
+    f_order = np.argsort(face_slot, kind='stable')
+    faces = inverse[faces[f_order]]
+
+    # Współrzędne lokalne boxu -> globalne (Z, Y, X)
+    verts[:, 0] -= slot * slot_shape[0]
+    verts += origins[slot] - pad
+
+    v_counts = np.bincount(slot, minlength=n)
+    f_counts = np.bincount(face_slot, minlength=n)
+    return np.asarray(batch), verts, faces, v_counts, f_counts, centroids, volumes, intensities
+
+
+def mesh_nuclei(labels, vol_raw, global_center, params, batch_voxels=BATCH_VOXELS, areas=None, scale=None):
+    """Siatki wszystkich jąder klatki (odpowiednik pętli po regionprops) jako NucleiBatch.
+    labels / vol_raw mogą być memmapami (tryb kafelkowy) - czytane są tylko boxy jąder;
+    areas (woksele na etykietę) podaje wtedy wywołujący, żeby nie liczyć bincount na całym wolumenie.
+    scale: skala (X, Y, Z) zamiast BLENDER_SCALE (binning - patrz formermatlabfunc.scene_transform)."""
+    sigma = params['SMOOTH_MESH_SIGMA']
+    pad = int(4.0 * sigma + 0.5) + 1
+
+    slices = ndimage.find_objects(labels)
+    if areas is None:
+        areas = np.bincount(labels.ravel(), minlength=len(slices) + 1)
+    candidates = [lab for lab in range(1, len(slices) + 1)
+                  if slices[lab - 1] is not None and areas[lab] >= params['MIN_NUCLEUS_VOL']]
+    if not candidates:
+        return NucleiBatch.empty()
+
+    # Paczki boxów o podobnym rozmiarze, żeby padding do wspólnego kształtu był mały
+    box_dims = {lab: [s.stop - s.start + 2 * pad for s in slices[lab - 1]] for lab in candidates}
+    candidates.sort(key=lambda lab: int(np.prod(box_dims[lab])))
+
+    results = []
+    batch, batch_max = [], np.zeros(3, dtype=np.int64)
+    for lab in candidates:
+        new_max = np.maximum(batch_max, box_dims[lab])
+        if batch and (len(batch) + 1) * int(np.prod(new_max)) > batch_voxels:
+            results.append(_mesh_batch(labels, vol_raw, batch, slices, pad, sigma, params['NUCLEI_THRESH_FACTOR']))
+            batch, new_max = [], np.array(box_dims[lab])
+        batch.append(lab)
+        batch_max = new_max
+    results.append(_mesh_batch(labels, vol_raw, batch, slices, pad, sigma, params['NUCLEI_THRESH_FACTOR']))
+    results = [r for r in results if r is not None]
+    if not results:
+        return NucleiBatch.empty()
+
+    # Złączenie paczek i sortowanie jąder po etykiecie
+    all_labels = np.concatenate([r[0] for r in results])
+    v_counts = np.concatenate([r[3] for r in results])
+    f_counts = np.concatenate([r[4] for r in results])
+    v_shift = np.cumsum([0] + [len(r[1]) for r in results[:-1]])
+    verts = np.concatenate([r[1] for r in results])
+    faces = np.concatenate([r[2] + shift for r, shift in zip(results, v_shift)])
+
+    order = np.argsort(all_labels, kind='stable')
+    order = order[f_counts[order] > 0]
+    v_starts = np.concatenate([[0], np.cumsum(v_counts)[:-1]])
+    f_starts = np.concatenate([[0], np.cumsum(f_counts)[:-1]])
+    v_index = _gather_ranges(v_starts[order], v_counts[order])
+    f_index = _gather_ranges(f_starts[order], f_counts[order])
+    remap = np.empty(len(verts), dtype=np.int64)
+    remap[v_index] = np.arange(len(v_index))
+    verts = verts[v_index]
+    faces = remap[faces[f_index]]
+    all_labels = all_labels[order]
+    v_counts = v_counts[order]
+    f_counts = f_counts[order]
+
+    # (Z, Y, X) -> (X, Y, Z), centrowanie i skala dla całego bufora naraz
+    verts = verts[:, ::-1].astype(np.float32)
+    verts -= global_center.astype(np.float32)
+    verts *= params['BLENDER_SCALE'] if scale is None else scale
+
+    vertex_offsets = np.concatenate([[0], np.cumsum(v_counts)])
+    face_offsets = np.concatenate([[0], np.cumsum(f_counts)])
+
+    # Tabela regionów dla śledzenia jąder (tracking.py) - te same jądra i kolejność co siatki
+    regions = np.zeros(len(all_labels), dtype=REGION_DTYPE)
+    regions['label'] = all_labels
+    regions['centroid'] = np.concatenate([r[5] for r in results])[order]
+    regions['volume'] = np.concatenate([r[6] for r in results])[order]
+    regions['bbox'] = [[s.start for s in slices[lab - 1]] + [s.stop for s in slices[lab - 1]] for lab in all_labels]
+    regions['mean_intensity'] = np.concatenate([r[7] for r in results])[order]
+    regions['surface_area'], regions['sphericity'] = surface_metrics(verts, faces, face_offsets, params['BLENDER_SCALE'])
+    # Pełna rozdzielczość - decymacja (piramida LOD) jest w formermatlabfunc / meshlod
+    return NucleiBatch(all_labels, verts, faces.astype(np.uint32), vertex_offsets, face_offsets, regions=regions)
+
+
+def surface_metrics(vertices, faces, face_offsets, unit):
+    """Pole powierzchni (woksele^2) i sferyczność pi^(1/3) (6V)^(2/3) / A siatek jąder; V z twierdzenia
+    o dywergencji na tej samej siatce, więc sferyczność <= 1. unit - skala sceny na woksel (BLENDER_SCALE)."""
+    tris = vertices[faces].astype(np.float64) / unit
+    cross = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+    starts = face_offsets[:-1]
+    area = np.add.reduceat(0.5 * np.linalg.norm(cross, axis=1), starts)
+    volume = np.abs(np.add.reduceat(np.einsum('ij,ij->i', tris[:, 0], cross), starts)) / 6.0
+    sphericity = np.pi ** (1.0 / 3.0) * (6.0 * volume) ** (2.0 / 3.0) / np.maximum(area, 1e-12)
+    return area.astype(np.float32), sphericity.astype(np.float32)
+
+
+def write_obj(path, nuclei):
+    """Zapis bufora do OBJ z obiektem `o Nucleus_<label>` na jądro (tak jak eksport trimesh.Scene)."""
+    with open(path, 'w') as f:
+        for i, name in enumerate(nuclei.names()):
+            v, faces = nuclei.mesh(i)
+            f.write(f"o {name}\n")
+            np.savetxt(f, v, fmt='v %.8f %.8f %.8f')
+            np.savetxt(f, faces.astype(np.int64) + nuclei.vertex_offsets[i] + 1, fmt='f %d %d %d')
+
+
+def read_obj(path):
+    """Odczyt OBJ zapisanego przez write_obj z powrotem do NucleiBatch."""
+    labels, vertices, faces, v_counts, f_counts = [], [], [], [], []
+    with open(path) as f:
+        for line in f:
+            if line.startswith('o '):
+                labels.append(int(line.split('_')[-1]))
+                v_counts.append(0)
+                f_counts.append(0)
+            elif line.startswith('v '):
+                vertices.append(line.split()[1:4])
+                v_counts[-1] += 1
+            elif line.startswith('f '):
+                faces.append([int(token.split('/')[0]) - 1 for token in line.split()[1:4]])
+                f_counts[-1] += 1
+    if not labels:
+        return NucleiBatch.empty()
+    return NucleiBatch(np.array(labels, dtype=np.int64), np.array(vertices, dtype=np.float32),
+                       np.array(faces, dtype=np.uint32).reshape(-1, 3),
+                       np.concatenate([[0], np.cumsum(v_counts)]), np.concatenate([[0], np.cumsum(f_counts)]))
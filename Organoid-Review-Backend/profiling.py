@@ -0,0 +1,68 @@
+import os
+import json
+import time
+import resource
+from contextlib import contextmanager
+
+
+def max_rss_mb():
+    """Szczytowe RSS procesu od startu (Linux: ru_maxrss w kB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024.0 * 1024.0)
+    except (OSError, ValueError):
+        return None
+
+
+class StageTimer:
+    """Czasy etapów pipeline'u: rekord = (klatka, etap, sekundy, RSS po etapie, szczytowe RSS procesu).
+    Klatka None oznacza etap całego przebiegu (np. GLB)."""
+
+    def __init__(self):
+        self.records = []
+
+    @contextmanager
+    def stage(self, name, frame=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.records.append({
+                'frame': frame,
+                'stage': name,
+                'seconds': round(time.perf_counter() - start, 6),
+                'rss_mb': current_rss_mb(),
+                'max_rss_mb': max_rss_mb(),
+                'pid': os.getpid()
+            })
+
+    def extend(self, records):
+        self.records.extend(records or [])
+
+    def summary(self):
+        """Suma / liczba / maksimum czasu i szczytowe RSS dla każdego etapu."""
+        stages = {}
+        for record in self.records:
+            entry = stages.setdefault(record['stage'], {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                                                        'max_rss_mb': 0.0})
+            entry['count'] += 1
+            entry['total_seconds'] += record['seconds']
+            entry['max_seconds'] = max(entry['max_seconds'], record['seconds'])
+            entry['max_rss_mb'] = max(entry['max_rss_mb'], record['max_rss_mb'] or 0.0)
+        return stages
+
+    def write(self, path, **info):
+        # Zapis atomowy - runner zadań czyta plik po zakończeniu procesu
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(dict(info, records=self.records, summary=self.summary()), f, indent=1)
+        os.replace(path + '.tmp', path)
+
+
+def load_metrics(path):
+    with open(path) as f:
+        return json.load(f)
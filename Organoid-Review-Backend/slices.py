@@ -0,0 +1,302 @@
+import io
+import os
+import sys
+import json
+import shutil
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image, features
+
+# Kafle renderuje app.py w wątkach eventlet.tpool - po monkey_patch threading.Lock jest zielony,
+# więc bierzemy oryginalną blokadę systemową (pipeline eventletu nie importuje)
+if 'eventlet' in sys.modules:
+    from eventlet.patcher import original
+    OsLock = original('threading').Lock
+else:
+    OsLock = threading.Lock
+
+
+# Przekroje XY / XZ / YZ i MIP surowego stosu jako kafle PNG/WebP dla widoku recenzji.
+# Piramida (budowana przez zadanie mesh): <folder>/<exp>/level<L>.npy (T, C, Z, Y >> L, X >> L) dla L >= 1
+# i mip<L>.npy (T, C, Y >> L, X >> L) dla L >= 0 - uśrednianie 2x2 w Y/X, typ surowy; meta.json zapisywany na końcu.
+TILE_SIZE = 256
+VIEWS = ('xy', 'xz', 'yz')
+FORMATS = {'png': ('PNG', 'image/png'), 'webp': ('WEBP', 'image/webp')}
+# Okno intensywności z percentyli podpróbki klatki, gdy klient nie poda min / max
+AUTO_PERCENTILES = (0.5, 99.8)
+
+
+def pyramid_levels(dim_y, dim_x, tile_size=TILE_SIZE):
+    """Liczba poziomów ponad pełną rozdzielczością - najgrubszy mieści się w jednym kaflu."""
+    levels = 0
+    while max(dim_y >> levels, dim_x >> levels) > tile_size:
+        levels += 1
+    return levels
+
+
+def halve(image):
+    """Średnia 2x2 w dwóch ostatnich osiach (niepełne brzegi obcinane), float32."""
+    y, x = image.shape[-2] // 2 * 2, image.shape[-1] // 2 * 2
+    image = np.asarray(image[..., :y, :x], dtype=np.float32)
+    return image.reshape(image.shape[:-2] + (y // 2, 2, x // 2, 2)).mean(axis=(-3, -1), dtype=np.float32)
+
+
+def _to_dtype(image, dtype):
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        return np.clip(np.rint(image), info.min, info.max).astype(dtype)
+    return image.astype(dtype)
+
+
+def source_signature(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def load_pyramid_meta(folder):
+    try:
+        with open(os.path.join(folder, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get('complete') else None
+
+
+def build_pyramid(reader, input_path, folder):
+    """Piramida dla wszystkich klatek i kanałów, płaszczyzna po płaszczyźnie (w pamięci jedna płaszczyzna
+    i jej poziomy). Aktualna piramida (ten sam rozmiar i mtime pliku) nie jest przeliczana. Zwraca meta."""
+    signature = source_signature(input_path)
+    meta = load_pyramid_meta(folder)
+    if meta is not None and meta.get('source') == signature:
+        print(f"Slice pyramid up to date: {folder}")
+        return meta
+
+    levels = pyramid_levels(reader.dim_y, reader.dim_x)
+    shapes = [(reader.dim_y, reader.dim_x)]
+    for _ in range(levels):
+        shapes.append((shapes[-1][0] // 2, shapes[-1][1] // 2))
+
+    tmp_folder = folder + '.tmp'
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+    dtype = np.dtype(reader.dtype)
+    t_c = (reader.num_t, reader.num_ch)
+    volumes = {level: np.lib.format.open_memmap(os.path.join(tmp_folder, f"level{level}.npy"), mode='w+', dtype=dtype,
+                                                shape=t_c + (reader.num_z,) + shapes[level])
+               for level in range(1, levels + 1)}
+    mips = {level: np.lib.format.open_memmap(os.path.join(tmp_folder, f"mip{level}.npy"), mode='w+', dtype=dtype,
+                                             shape=t_c + shapes[level])
+            for level in range(levels + 1)}
+
+    for t in range(reader.num_t):
+        for channel in range(reader.num_ch):
+            planes = reader.channel_planes(t, channel)
+            mip = None
+            for z in range(reader.num_z):
+                plane = np.asarray(planes[z])
+                mip = plane.copy() if mip is None else np.maximum(mip, plane, out=mip)
+                image = plane
+                for level in range(1, levels + 1):
+                    image = halve(image)
+                    volumes[level][t, channel, z] = _to_dtype(image, dtype)
+            image = mip
+            mips[0][t, channel] = mip
+            for level in range(1, levels + 1):
+                image = halve(image)
+                mips[level][t, channel] = _to_dtype(image, dtype)
+        print(f"  Slice pyramid T={t + 1}/{reader.num_t}", flush=True)
+
+    for array in list(volumes.values()) + list(mips.values()):
+        array.flush()
+    del volumes, mips
+    meta = {'source': signature, 'levels': levels, 'tile_size': TILE_SIZE, 'dtype': dtype.str,
+            'shape': [reader.num_t, reader.num_ch, reader.num_z, reader.dim_y, reader.dim_x], 'complete': True}
+    with open(os.path.join(tmp_folder, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    # Czytelnicy ze starymi memmapami zachowują usunięte pliki do zamknięcia
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(tmp_folder, folder)
+    print(f"Saved slice pyramid ({levels} levels): {folder}")
+    return meta
+
+
+class Downsampled:
+    """Leniwy widok 2D uśredniany blokami (fr, fc): wycinek czyta tylko odpowiadający mu obszar źródła."""
+
+    def __init__(self, base, factors):
+        self.base = base
+        self.factors = factors
+        self.shape = (base.shape[0] // factors[0], base.shape[1] // factors[1])
+
+    def __getitem__(self, key):
+        (fr, fc), (rows, cols) = self.factors, key
+        r0, r1, _ = rows.indices(self.shape[0])
+        c0, c1, _ = cols.indices(self.shape[1])
+        block = np.asarray(self.base[r0 * fr:r1 * fr, c0 * fc:c1 * fc], dtype=np.float32)
+        return block.reshape(r1 - r0, fr, c1 - c0, fc).mean(axis=(1, 3), dtype=np.float32)
+
+
+class LruCache:
+    """LRU z blokadą - kafle renderowane są w wątkach (eventlet.tpool)."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = OsLock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+
+class SliceSource:
+    """Kafle jednego stosu: piramida, jeśli jest kompletna i aktualna, w przeciwnym razie surowy memmap
+    z uśrednianiem w locie. reader - formermatlabfunc.HyperstackReader (leniwy, memmap)."""
+
+    def __init__(self, reader, input_path, pyramid_folder, cache_size=512):
+        self.reader = reader
+        self.signature = source_signature(input_path)
+        meta = load_pyramid_meta(pyramid_folder)
+        self.pyramid = None
+        if meta is not None and meta.get('source') == self.signature:
+            self.pyramid = {name[:-4]: np.load(os.path.join(pyramid_folder, name), mmap_mode='r')
+                            for name in os.listdir(pyramid_folder) if name.endswith('.npy')}
+        self.levels = pyramid_levels(reader.dim_y, reader.dim_x)
+        self.tiles = LruCache(cache_size)
+        # Pełne obrazy MIP / zakresy intensywności bez piramidy kosztują odczyt całej klatki - osobny mały cache
+        self._frames = LruCache(16)
+        # TIFF bez memmapu (skompresowany) czyta strony przez jeden uchwyt pliku - odczyty po kolei
+        self._read_lock = OsLock() if not reader.memmapped else None
+
+    def info(self):
+        return {'frames': self.reader.num_t, 'channels': self.reader.num_ch, 'slices': self.reader.num_z,
+                'height': int(self.reader.dim_y), 'width': int(self.reader.dim_x), 'levels': self.levels,
+                'tile_size': TILE_SIZE, 'views': list(VIEWS), 'pyramid': self.pyramid is not None,
+                'formats': [name for name in FORMATS if name != 'webp' or features.check('webp')]}
+
+    def view_shape(self, view, level):
+        """(wiersze, kolumny) obrazu widoku na poziomie - wiersze XZ / YZ to oś Z."""
+        z, y, x = self.reader.num_z, self.reader.dim_y, self.reader.dim_x
+        for _ in range(level):
+            z, y, x = z // 2, y // 2, x // 2
+        return {'xy': (y, x), 'xz': (z, x), 'yz': (z, y)}[view]
+
+    def _level_volume(self, t, channel, level):
+        # (Z, Y >> L, X >> L) z piramidy albo None
+        if level == 0:
+            return self.reader.channel_planes(t, channel)
+        if self.pyramid is not None and f"level{level}" in self.pyramid:
+            return self.pyramid[f"level{level}"][t, channel]
+        return None
+
+    def _mip(self, t, channel, view, level):
+        """MIP widoku na poziomie - zawsze maksimum w pełnej rozdzielczości uśredniane blokami 2^L x 2^L
+        (jak mip<L> w piramidzie), więc kafle z piramidą i bez niej są takie same."""
+        if view == 'xy' and self.pyramid is not None:
+            return self.pyramid[f"mip{level}"][t, channel]
+        key = ('mip', t, channel, view, level)
+        image = self._frames.get(key)
+        if image is not None:
+            return image
+        axis = {'xy': 0, 'xz': 1, 'yz': 2}[view]
+        image = np.asarray(self.reader.channel_planes(t, channel)).max(axis=axis)
+        if level:
+            image = Downsampled(image, (1 << level, 1 << level))[:, :]
+        return self._frames.put(key, image)
+
+    def image(self, view, t, channel, index, level, mip=False):
+        """Leniwy obraz 2D (wiersze, kolumny) widoku na poziomie; index - płaszczyzna Z (xy), wiersz Y (xz)
+        albo kolumna X (yz) w pełnej rozdzielczości."""
+        if mip:
+            return self._mip(t, channel, view, level)
+        volume = self._level_volume(t, channel, level)
+        factor = 1
+        if volume is None:
+            volume, factor = self.reader.channel_planes(t, channel), 1 << level
+        if view == 'xy':
+            image = volume[index]
+            return Downsampled(image, (factor, factor)) if factor > 1 else image
+        # Piramida jest zmniejszona tylko w Y/X - oś Z (wiersze) uśredniamy w locie
+        y, x = self.view_shape('xy', level)
+        scaled = min(index >> level, (y if view == 'xz' else x) - 1)
+        if factor == 1:
+            image = volume[:, scaled, :] if view == 'xz' else volume[:, :, scaled]
+        else:
+            # Bez piramidy: pas `factor` wierszy / kolumn uśredniony tak jak w piramidzie
+            band = slice(scaled * factor, (scaled + 1) * factor)
+            image = (volume[:, band, :].mean(axis=1, dtype=np.float32) if view == 'xz'
+                     else volume[:, :, band].mean(axis=2, dtype=np.float32))
+        return Downsampled(image, (1 << level, factor)) if level else image
+
+    def _read_tile(self, view, t, channel, index, level, tx, ty, mip):
+        image = self.image(view, t, channel, index, level, mip)
+        return np.asarray(image[ty * TILE_SIZE:(ty + 1) * TILE_SIZE, tx * TILE_SIZE:(tx + 1) * TILE_SIZE],
+                          dtype=np.float32)
+
+    def _locked(self, read, *args):
+        # Skompresowany stos czyta się przez jeden uchwyt TiffFile - wątki tpool nie mogą go dzielić naraz
+        if self._read_lock is None:
+            return read(*args)
+        with self._read_lock:
+            return read(*args)
+
+    def _raw_sample(self, t, channel):
+        planes = self.reader.channel_planes(t, channel)
+        return np.asarray(planes[::max(1, len(planes) // 8), ::8, ::8])
+
+    def intensity_range(self, t, channel):
+        key = ('range', t, channel)
+        window = self._frames.get(key)
+        if window is None:
+            if self.pyramid is not None and self.levels:
+                sample = self.pyramid[f"level{self.levels}"][t, channel]
+            else:
+                sample = self._locked(self._raw_sample, t, channel)
+            low, high = np.percentile(np.asarray(sample, dtype=np.float32), AUTO_PERCENTILES)
+            window = self._frames.put(key, (float(low), float(high)))
+        return window
+
+    def render_tile(self, view, t, channel, index, level, tx, ty, mip=False, fmt='png', low=None, high=None):
+        """Kafel TILE_SIZE x TILE_SIZE (brzegowe mniejsze) jako bajty PNG/WebP, z LRU. ValueError = zły argument."""
+        if view not in VIEWS:
+            raise ValueError(f"View must be one of {', '.join(VIEWS)}")
+        if fmt not in FORMATS or (fmt == 'webp' and not features.check('webp')):
+            raise ValueError(f"Unsupported tile format: {fmt}")
+        if not (0 <= t < self.reader.num_t and 0 <= channel < self.reader.num_ch and 0 <= level <= self.levels):
+            raise ValueError("Frame, channel or level out of range")
+        if not mip:
+            limit = {'xy': self.reader.num_z, 'xz': self.reader.dim_y, 'yz': self.reader.dim_x}[view]
+            if not 0 <= index < limit:
+                raise ValueError(f"Slice index out of range (0..{limit - 1})")
+        rows, cols = self.view_shape(view, level)
+        if not (0 <= ty * TILE_SIZE < rows and 0 <= tx * TILE_SIZE < cols):
+            raise ValueError("Tile out of range")
+
+        if low is None or high is None:
+            auto_low, auto_high = self.intensity_range(t, channel)
+            low = auto_low if low is None else low
+            high = auto_high if high is None else high
+        key = (view, t, channel, None if mip else index, level, tx, ty, mip, fmt, low, high)
+        data = self.tiles.get(key)
+        if data is not None:
+            return data
+
+        tile = self._locked(self._read_tile, view, t, channel, index, level, tx, ty, mip)
+        scale = 255.0 / (high - low) if high > low else 0.0
+        pixels = np.clip((tile - low) * scale, 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        name = FORMATS[fmt][0]
+        Image.fromarray(pixels, mode='L').save(buffer, name, **({'lossless': True} if name == 'WEBP' else {}))
+        return self.tiles.put(key, buffer.getvalue())
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import tifffile
+from skimage import measure
+
+from benchmark import coat_ellipsoid, make_hyperstack, place_nuclei, NUCLEUS_GAP
+from coatmesh import CoatMesher
+from formermatlabfunc import DEFAULT_PARAMS, process_pipeline, tracks_path
+from tracking import read_tracks
+
+
+def test_nuclei_are_separated_in_every_frame():
+    t = 5
+    positions, velocities, radii = place_nuclei(np.random.default_rng(1), t, 40, 256, 256, 40)
+    assert len(positions) == 40
+    for ti in range(t):
+        frame = positions + velocities * ti
+        distance = np.linalg.norm(frame[:, None] - frame[None], axis=2)
+        limit = radii[:, None] + radii[None] + NUCLEUS_GAP
+        np.fill_diagonal(distance, np.inf)
+        assert np.all(distance >= limit)
+        assert np.all(frame[:, 0] - radii >= 0) and np.all(frame[:, 0] + radii <= 39)
+
+
+def test_segmented_count_matches_generated(tmp_path):
+    nuclei = 8
+    input_path = make_hyperstack(str(tmp_path / 'bench.tif'), t=3, z=24, y=128, x=128, nuclei=nuclei)
+    output_folder = str(tmp_path / 'output')
+    process_pipeline(input_path, output_folder, use_cache=False)
+
+    tracks = read_tracks(tracks_path(output_folder, 'bench'))
+    frames, counts = np.unique(tracks['frame'], return_counts=True)
+    assert len(frames) and counts.tolist() == [nuclei] * len(frames)
+
+
+@pytest.mark.parametrize('noise', [0.0, 30.0])
+def test_coat_mesh_matches_generated_ellipsoid(tmp_path, noise):
+    z, y, x = 24, 128, 128
+    input_path = make_hyperstack(str(tmp_path / 'bench.tif'), t=3, z=z, y=y, x=x, nuclei=8, noise=noise)
+    stack = tifffile.imread(input_path)[1]
+
+    # Ten sam izopoziom co _process_frame: COAT_THRESH_FACTOR * maksimum sumy kanałów po rozmyciu
+    mesher = CoatMesher()
+    volume = mesher.smooth(stack[:, 0], stack[:, 1], sigma=1.0)
+    level = mesher.max_value(volume) * DEFAULT_PARAMS['COAT_THRESH_FACTOR']
+    verts, _, _, _ = measure.marching_cubes(volume, level)
+
+    center, radii = coat_ellipsoid(z, y, x)
+    assert np.allclose(verts.min(axis=0), center - radii, atol=1.5)
+    assert np.allclose(verts.max(axis=0), center + radii, atol=1.5)
@@ -0,0 +1,42 @@
+import numpy as np
+from skimage import measure
+
+from coatmesh import CoatMesher
+from formermatlabfunc import DEFAULT_PARAMS, decimate, fit_coat_morphs
+
+SHAPE = (40, 96, 96)
+
+
+def coat_mesh(radii, centre):
+    # Otoczka jak w _process_frame: marching cubes, potem (Z, Y, X) -> (X, Y, Z) i skala sceny
+    grid = np.indices(SHAPE, dtype=np.float32)
+    distance = sum(((grid[i] - centre[i]) / radii[i]) ** 2 for i in range(3))
+    verts, faces, _, _ = measure.marching_cubes(distance, 1.0)
+    scene_center = np.array(SHAPE[::-1], dtype=np.float64) / 2.0
+    return CoatMesher().to_scene(verts, faces, scene_center, DEFAULT_PARAMS['BLENDER_SCALE'])
+
+
+def deforming_coat(frames=5):
+    # Elipsoida, która rośnie, spłaszcza się i dryfuje - jak otoczka organoidu w kolejnych klatkach
+    frame_meshes = {}
+    for t in range(frames):
+        radii = (12.0 + 0.5 * t, 30.0 + 1.5 * t, 34.0 - 1.0 * t)
+        centre = (19.5, 47.5 + 0.5 * t, 47.5)
+        vertices, faces = coat_mesh(radii, centre)
+        lod1 = decimate(vertices, faces, len(faces) // 4)
+        frame_meshes[t] = {'coat': (vertices, faces), 'coat.lod1': lod1}
+    return frame_meshes
+
+
+def test_deforming_coat_fits_as_morph_targets():
+    frame_meshes = deforming_coat()
+    # Poziomy z błędem ponad tolerancję są usuwane - write_glbs wróciłby wtedy do siatek na klatkę
+    fits = fit_coat_morphs(frame_meshes, [0, 1], DEFAULT_PARAMS)
+
+    max_error = DEFAULT_PARAMS['COAT_MORPH_MAX_ERROR'] * DEFAULT_PARAMS['BLENDER_SCALE']
+    assert sorted(fits) == [0, 1]
+    for level, fit in fits.items():
+        assert fit.error < max_error
+        assert len(fit.positions) == len(frame_meshes)
+        assert all(p.shape == fit.base.shape for p in fit.positions)
+
@@ -0,0 +1,92 @@
+import json
+
+import numpy as np
+from skimage import measure
+
+from formermatlabfunc import DEFAULT_PARAMS, write_glbs
+from glbcompress import quantize_glb, read_glb, accessor_array
+from glbwriter import write_animated_glb, write_morph_glb, vertex_normals
+
+# Zniekształcenie cieniowania niewidoczne dla oka
+MAX_NORMAL_ERROR_DEG = 1.0
+
+
+def ellipsoid_mesh(radii, shape=(40, 64, 96)):
+    # Wydłużona bryła - rozpiętości osi różne, jak otoczka organoidu (Z płytsze niż Y/X)
+    grid = np.indices(shape, dtype=np.float32)
+    centre = (np.array(shape, dtype=np.float32) - 1) / 2
+    distance = sum(((grid[i] - centre[i]) / radii[i]) ** 2 for i in range(3))
+    vertices, faces, _, _ = measure.marching_cubes(distance, 1.0)
+    return vertices.astype(np.float32), faces
+
+
+def rendered_normals(normals, scale):
+    # Jak three.js: macierz normalnych = odwrotność transpozycji macierzy modelu (tu diagonalna skala)
+    normals = np.asarray(normals, dtype=np.float64) / np.asarray(scale, dtype=np.float64)
+    return normals / np.linalg.norm(normals, axis=1, keepdims=True)
+
+
+def angle_deg(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.degrees(np.arccos(np.clip(np.einsum('ij,ij->i', a, b), -1.0, 1.0)))
+
+
+def quantized_mesh(path):
+    gltf, binary = read_glb(path)
+    node = next(node for node in gltf['nodes'] if 'mesh' in node)
+    primitive = gltf['meshes'][node['mesh']]['primitives'][0]
+    return gltf, binary, node, primitive
+
+
+def test_quantized_positions_and_normals(tmp_path):
+    vertices, faces = ellipsoid_mesh((15.0, 28.0, 45.0))
+    src, dst = str(tmp_path / 'coat.glb'), str(tmp_path / 'coat.q.glb')
+    write_animated_glb(src, [[('Coat', vertices, faces)]], outward_normals=True)
+    quantize_glb(src, dst)
+
+    gltf_src, binary_src = read_glb(src)
+    primitive_src = gltf_src['meshes'][0]['primitives'][0]
+    normals = accessor_array(gltf_src, binary_src, primitive_src['attributes']['NORMAL'])
+
+    gltf, binary, node, primitive = quantized_mesh(dst)
+    scale = np.asarray(node['scale'])
+    positions = accessor_array(gltf, binary, primitive['attributes']['POSITION'])[:, :3] * scale + node['translation']
+    assert np.abs(positions - vertices).max() <= scale.max()
+
+    packed = accessor_array(gltf, binary, primitive['attributes']['NORMAL'])[:, :3]
+    assert angle_deg(rendered_normals(packed, scale), normals).max() < MAX_NORMAL_ERROR_DEG
+
+
+def test_quantized_morph_targets(tmp_path):
+    vertices, faces = ellipsoid_mesh((15.0, 28.0, 45.0))
+    # Druga klatka: bryła rozciągnięta w X - delty pozycji i normalnych niezerowe
+    centre = vertices.mean(axis=0)
+    moved = centre + (vertices - centre) * np.array([1.0, 1.05, 1.2], dtype=np.float32)
+    src, dst = str(tmp_path / 'morph.glb'), str(tmp_path / 'morph.q.glb')
+    write_morph_glb(src, 'Coat', faces, [vertices, moved])
+    quantize_glb(src, dst)
+
+    gltf, binary, node, primitive = quantized_mesh(dst)
+    scale = np.asarray(node['scale'])
+    base = accessor_array(gltf, binary, primitive['attributes']['POSITION'])[:, :3].astype(np.float64)
+    base_normals = accessor_array(gltf, binary, primitive['attributes']['NORMAL'])[:, :3]
+    target = primitive['targets'][0]
+    morphed = (base + accessor_array(gltf, binary, target['POSITION'])) * scale + node['translation']
+    assert np.abs(morphed - moved).max() <= scale.max()
+
+    morphed_normals = base_normals + accessor_array(gltf, binary, target['NORMAL'])
+    expected = vertex_normals(moved, faces)
+    assert angle_deg(rendered_normals(morphed_normals, scale), expected).max() < MAX_NORMAL_ERROR_DEG
+
+
+def test_compression_report_follows_the_last_run(tmp_path):
+    vertices, faces = ellipsoid_mesh((4, 6, 8), shape=(12, 16, 20))
+    frame_meshes = {t: {'coat': (vertices + t, faces)} for t in range(2)}
+    report_path = tmp_path / 'exp.compression.json'
+    params = dict(DEFAULT_PARAMS, COAT_ANIMATION='visibility')
+
+    write_glbs(frame_meshes, 'exp', str(tmp_path), compression='quantize', params=params)
+    assert 'outer' in json.loads(report_path.read_text())
+    write_glbs(frame_meshes, 'exp', str(tmp_path), params=params)
+    assert not report_path.exists()
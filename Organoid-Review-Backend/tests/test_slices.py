@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from benchmark import make_hyperstack
+from formermatlabfunc import HyperstackReader
+from slices import SliceSource, build_pyramid
+
+
+@pytest.mark.parametrize('view', ['xy', 'xz', 'yz'])
+def test_mip_is_the_same_with_and_without_pyramid(tmp_path, view):
+    input_path = make_hyperstack(str(tmp_path / 'stack.tif'), t=1, z=24, y=520, x=600, nuclei=20)
+    reader = HyperstackReader(input_path)
+    build_pyramid(reader, input_path, str(tmp_path / 'pyramid'))
+    with_pyramid = SliceSource(reader, input_path, str(tmp_path / 'pyramid'))
+    without_pyramid = SliceSource(reader, input_path, str(tmp_path / 'missing'))
+    assert with_pyramid.pyramid is not None and without_pyramid.pyramid is None
+
+    for level in range(with_pyramid.levels + 1):
+        expected = np.asarray(without_pyramid.image(view, 0, 1, 0, level, mip=True), dtype=np.float32)
+        actual = np.asarray(with_pyramid.image(view, 0, 1, 0, level, mip=True), dtype=np.float32)
+        assert actual.shape == expected.shape == with_pyramid.view_shape(view, level)
+        # Piramida trzyma poziomy w typie surowym - różnica tylko z zaokrąglenia
+        assert np.abs(actual - expected).max() <= level
@@ -0,0 +1,273 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+from scipy import ndimage
+from scipy.spatial import cKDTree
+from skimage import measure, segmentation, filters, feature
+
+
+# Tryb kafelkowy (out-of-core) dla dużych stosów: wolumeny pośrednie klatki leżą w np.memmap na dysku,
+# a filtry / marching cubes / watershed liczone są na blokach 3D z marginesem (halo).
+# Przybliżony szczytowy koszt jednego woksela bloku (z halo) w bajtach - z niego wynika rozmiar bloku
+BYTES_PER_VOXEL = {
+    'smooth': 16,   # wejście float32 + wynik gaussian_filter
+    'coat': 24,     # blok + tablice robocze marching cubes
+    'nuclei': 64,   # maska, EDT (float64 + transformata cech), markery i wynik watershed
+}
+MIN_CORE = 16
+HISTOGRAM_BINS = 256
+
+
+def gaussian_halo(sigma):
+    # ndimage.gaussian_filter ucina jądro na truncate=4.0 sigma - z takim marginesem blok liczy się dokładnie
+    return int(4.0 * sigma + 0.5)
+
+
+def segmentation_halo(params):
+    """Margines EDT / watershed: odległości większe niż halo są przycinane (jądra o promieniu <= halo
+    dzielą się tak samo jak bez kafelkowania)."""
+    if params.get('TILE_HALO'):
+        return int(params['TILE_HALO'])
+    return gaussian_halo(params['SMOOTH_SIGMA']) + 4 * params['NUCLEI_MIN_DISTANCE']
+
+
+def use_tiling(shape, params):
+    """TILED: True / False albo 'auto' - kafelki, gdy segmentacja całej klatki nie zmieści się w budżecie."""
+    mode = params.get('TILED', 'auto')
+    if mode != 'auto':
+        return bool(mode)
+    return int(np.prod(shape)) * BYTES_PER_VOXEL['nuclei'] > memory_budget(params)
+
+
+def memory_budget(params):
+    return int(params['TILE_MEMORY_MB']) * 1024 * 1024
+
+
+def block_shape(shape, halo, budget_bytes, bytes_per_voxel):
+    """Rdzeń bloku: cały wolumen, jeśli się mieści; inaczej połowienie najdłuższej osi aż do budżetu."""
+    voxels = max(budget_bytes // bytes_per_voxel, 1)
+    core = [int(s) for s in shape]
+    while True:
+        extended = [min(c + 2 * halo, s) for c, s in zip(core, shape)]
+        axis = int(np.argmax(core))
+        if int(np.prod(extended)) <= voxels or core[axis] <= MIN_CORE:
+            return tuple(core)
+        core[axis] = max((core[axis] + 1) // 2, MIN_CORE)
+
+
+def iter_blocks(shape, core, halo=0):
+    """(rdzeń, rozszerzony blok, rdzeń we współrzędnych bloku) jako krotki slice'ów."""
+    counts = [-(-s // c) for s, c in zip(shape, core)]
+    for index in np.ndindex(*counts):
+        lo = [i * c for i, c in zip(index, core)]
+        hi = [min(l + c, s) for l, c, s in zip(lo, core, shape)]
+        elo = [max(l - halo, 0) for l in lo]
+        ehi = [min(h + halo, s) for h, s in zip(hi, shape)]
+        yield (tuple(slice(l, h) for l, h in zip(lo, hi)),
+               tuple(slice(l, h) for l, h in zip(elo, ehi)),
+               tuple(slice(l - e, h - e) for l, h, e in zip(lo, hi, elo)))
+
+
+class TileScratch:
+    """Katalog tymczasowy na wolumeny pośrednie klatki (usuwany przy close)."""
+
+    def __init__(self, params):
+        folder = params.get('TILE_SCRATCH_DIR') or None
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix='organoid-tiles-', dir=folder)
+
+    def array(self, name, shape, dtype):
+        return np.memmap(os.path.join(self.path, name + '.dat'), dtype=dtype, mode='w+', shape=tuple(shape))
+
+    def close(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def smooth_blockwise(sources, sigma, out, budget_bytes):
+    """out = gaussian_filter(suma źródeł, sigma) liczone blokami; źródła mogą być memmapami w typie surowym."""
+    halo = gaussian_halo(sigma)
+    core = block_shape(out.shape, halo, budget_bytes, BYTES_PER_VOXEL['smooth'])
+    for core_sl, ext_sl, inner_sl in iter_blocks(out.shape, core, halo):
+        block = np.asarray(sources[0][ext_sl], dtype=np.float32)
+        for source in sources[1:]:
+            block = block + np.asarray(source[ext_sl], dtype=np.float32)
+        out[core_sl] = ndimage.gaussian_filter(block, sigma=sigma)[inner_sl]
+    return out
+
+
+def blockwise_range(volume, budget_bytes):
+    low, high = np.inf, -np.inf
+    core = block_shape(volume.shape, 0, budget_bytes, BYTES_PER_VOXEL['smooth'])
+    for core_sl, _, _ in iter_blocks(volume.shape, core):
+        block = volume[core_sl]
+        low, high = min(low, float(block.min())), max(high, float(block.max()))
+    return low, high
+
+
+def otsu_blockwise(volume, budget_bytes):
+    """Próg Otsu z histogramu zbieranego blokami (ten sam podział na 256 przedziałów co threshold_otsu)."""
+    low, high = blockwise_range(volume, budget_bytes)
+    if low == high:
+        return low
+    counts = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+    core = block_shape(volume.shape, 0, budget_bytes, BYTES_PER_VOXEL['smooth'])
+    for core_sl, _, _ in iter_blocks(volume.shape, core):
+        counts += np.histogram(volume[core_sl], bins=HISTOGRAM_BINS, range=(low, high))[0]
+    edges = np.linspace(low, high, HISTOGRAM_BINS + 1)
+    return filters.threshold_otsu(hist=(counts, (edges[:-1] + edges[1:]) / 2))
+
+
+def marching_cubes_blockwise(volume, level, budget_bytes):
+    """Marching cubes blokami zachodzącymi na jedną warstwę wokseli; wspólne wierzchołki na granicach
+    bloków mają identyczne współrzędne i są scalane, więc siatka jest ciągła."""
+    core = block_shape(volume.shape, 1, budget_bytes, BYTES_PER_VOXEL['coat'])
+    all_verts, all_faces = [], []
+    offset = 0
+    for core_sl, _, _ in iter_blocks(volume.shape, core):
+        lo = [s.start for s in core_sl]
+        block_sl = tuple(slice(s.start, min(s.stop + 1, n)) for s, n in zip(core_sl, volume.shape))
+        block = np.asarray(volume[block_sl])
+        if min(block.shape) < 2 or not (block.min() < level < block.max()):
+            continue
+        verts, faces, _, _ = measure.marching_cubes(block, level)
+        all_verts.append(verts + np.asarray(lo, dtype=verts.dtype))
+        all_faces.append(faces + offset)
+        offset += len(verts)
+    if not all_verts:
+        raise ValueError("Surface level must be within volume data range.")
+
+    verts, inverse = np.unique(np.concatenate(all_verts), axis=0, return_inverse=True)
+    faces = inverse.reshape(-1)[np.concatenate(all_faces)]
+    # Ściany zdegenerowane przez scalenie (wszystkie wierzchołki na granicy w jednym punkcie)
+    keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+    return verts, faces[keep]
+
+
+def _ensure_spacing(coords, values, min_distance):
+    # Jak peak_local_max: od najwyższego piku, sąsiedzi bliżej niż min_distance (metryka max) są odrzucani
+    order = np.lexsort((np.ravel_multi_index(coords.T, coords.max(axis=0) + 1), -values))
+    coords = coords[order]
+    tree = cKDTree(coords)
+    removed = np.zeros(len(coords), dtype=bool)
+    for i in range(len(coords)):
+        if removed[i]:
+            continue
+        neighbours = tree.query_ball_point(coords[i], r=min_distance, p=np.inf)
+        removed[[j for j in neighbours if j > i]] = True
+    return coords[~removed]
+
+
+def segment_nuclei_blockwise(vol_smooth, thresh_val, params, scratch, budget_bytes):
+    """Odpowiednik threshold -> EDT -> peak_local_max -> watershed na blokach.
+    Zwraca (labels memmap int32, liczba wokseli na etykietę)."""
+    shape = vol_smooth.shape
+    min_distance = params['NUCLEI_MIN_DISTANCE']
+    halo = segmentation_halo(params)
+    # EDT w rdzeniu + min_distance jest dokładne (po przycięciu do halo), gdy blok ma margines halo + min_distance
+    margin = halo + min_distance
+    core = block_shape(shape, margin, budget_bytes, BYTES_PER_VOXEL['nuclei'])
+    distance = scratch.array('distance', shape, np.float32)
+    labels = scratch.array('labels', shape, np.int32)
+
+    # 1. EDT (przycięte do halo -> wynik nie zależy od podziału na bloki) i piki w rdzeniach
+    peaks, peak_values = [], []
+    for core_sl, ext_sl, inner_sl in iter_blocks(shape, core, margin):
+        bw = np.asarray(vol_smooth[ext_sl]) > thresh_val
+        if bw.all():
+            dist = np.full(bw.shape, halo, dtype=np.float32)
+        else:
+            dist = np.minimum(ndimage.distance_transform_edt(bw), halo).astype(np.float32)
+        distance[core_sl] = dist[inner_sl]
+        if not bw[inner_sl].any():
+            continue
+        coords = feature.peak_local_max(dist, min_distance=min_distance, labels=bw, exclude_border=False)
+        origin = np.array([s.start for s in ext_sl])
+        inner_lo = np.array([s.start for s in inner_sl])
+        inner_hi = np.array([s.stop for s in inner_sl])
+        in_core = np.all((coords >= inner_lo) & (coords < inner_hi), axis=1)
+        coords = coords[in_core]
+        # exclude_border=min_distance jak w wersji bez kafelków, ale względem brzegu całego wolumenu
+        global_coords = coords + origin
+        inside = np.all((global_coords >= min_distance) & (global_coords < np.array(shape) - min_distance), axis=1)
+        peaks.append(global_coords[inside])
+        peak_values.append(dist[tuple(coords[inside].T)])
+
+    peaks = np.concatenate(peaks) if peaks else np.zeros((0, 3), dtype=np.int64)
+    if len(peaks):
+        peaks = _ensure_spacing(peaks, np.concatenate(peak_values), min_distance)
+        # Globalne ID markerów w kolejności indeksu liniowego - niezależne od rozmiaru bloku
+        peaks = peaks[np.argsort(np.ravel_multi_index(peaks.T, shape))]
+    distance.flush()
+
+    # 2. Watershed bloku z markerami o globalnych ID (także tymi z halo sąsiadów) - te same jądra
+    #    po obu stronach granicy dostają tę samą etykietę
+    for core_sl, ext_sl, inner_sl in iter_blocks(shape, core, margin):
+        bw = np.asarray(vol_smooth[ext_sl]) > thresh_val
+        if not bw[inner_sl].any():
+            labels[core_sl] = 0
+            continue
+        markers = np.zeros(bw.shape, dtype=np.int32)
+        lo = np.array([s.start for s in ext_sl])
+        hi = np.array([s.stop for s in ext_sl])
+        inside = np.flatnonzero(np.all((peaks >= lo) & (peaks < hi), axis=1))
+        markers[tuple((peaks[inside] - lo).T)] = inside + 1
+        labels[core_sl] = segmentation.watershed(-np.asarray(distance[ext_sl]), markers, mask=bw)[inner_sl]
+
+    # 3. Szycie: fragmenty maski bez markera w bloku (ich marker jest dalej niż halo) łączymy przez granice
+    #    bloków z etykietą sąsiada; fragmenty bez żadnego markera zostają tłem, jak w zwykłym watershed
+    next_id = len(peaks) + 1
+    for core_sl, _, _ in iter_blocks(shape, core):
+        block = np.asarray(labels[core_sl])
+        orphans, count = ndimage.label((block == 0) & (np.asarray(vol_smooth[core_sl]) > thresh_val))
+        if count:
+            labels[core_sl] = np.where(orphans > 0, orphans + (next_id - 1), block)
+            next_id += count
+
+    if next_id > len(peaks) + 1:
+        lookup = _stitch_fragments(labels, shape, core, len(peaks), next_id)
+        for core_sl, _, _ in iter_blocks(shape, core):
+            labels[core_sl] = lookup[labels[core_sl]]
+
+    areas = np.zeros(len(peaks) + 1, dtype=np.int64)
+    for core_sl, _, _ in iter_blocks(shape, core):
+        areas += np.bincount(np.asarray(labels[core_sl]).ravel(), minlength=len(areas))
+    labels.flush()
+    return labels, areas
+
+
+def _stitch_fragments(labels, shape, core, num_markers, next_id):
+    """Union-find po parach wokseli sąsiadujących przez płaszczyzny granic bloków."""
+    parent = np.arange(next_id, dtype=np.int64)
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for axis, step in enumerate(core):
+        for boundary in range(step, shape[axis], step):
+            a = np.take(labels, boundary - 1, axis=axis).ravel()
+            b = np.take(labels, boundary, axis=axis).ravel()
+            touching = (a > 0) & (b > 0) & (a != b) & ((a > num_markers) | (b > num_markers))
+            for x, y in np.unique(np.stack([a[touching], b[touching]], axis=1), axis=0):
+                rx, ry = find(x), find(y)
+                if rx == ry:
+                    continue
+                # Korzeniem zostaje mniejsze ID, więc prawdziwy marker (<= num_markers) wygrywa z fragmentem.
+                # Dwa różne markery to dwa jądra - nie łączymy ich.
+                if rx <= num_markers and ry <= num_markers:
+                    continue
+                parent[max(rx, ry)] = min(rx, ry)
+
+    lookup = np.array([find(x) for x in range(next_id)], dtype=np.int32)
+    lookup[lookup > num_markers] = 0
+    return lookup
@@ -0,0 +1,146 @@
+import os
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+# Jądra jednej klatki (dane regionprops) w wokselach pełnej rozdzielczości, osie (Z, Y, X);
+# bbox = (z0, y0, x0, z1, y1, x1) jak slice'y z find_objects; pole powierzchni i sferyczność z siatki jądra
+# (nucleimesh.surface_metrics)
+REGION_DTYPE = np.dtype([('label', np.int64), ('centroid', np.float32, 3), ('volume', np.int64),
+                         ('bbox', np.int32, 6), ('mean_intensity', np.float32), ('surface_area', np.float32),
+                         ('sphericity', np.float32)])
+# Tabela ścieżek: wiersz = jądro w klatce, posortowana po (frame, label)
+TRACK_DTYPE = np.dtype([('track', np.int32), ('frame', np.int32), ('label', np.int64),
+                        ('centroid', np.float32, 3), ('volume', np.int64)])
+
+REGIONS_EXT = '.regions.npy'
+TRACKS_EXT = '.tracks.npy'
+# Ilu najbliższych sąsiadów z KD-drzewa rozważamy dla każdego jądra
+LINK_CANDIDATES = 4
+
+
+def to_full_resolution(regions, binning):
+    """Tabela z wolumenu po binningu Y/X -> woksele oryginalnego stosu (jak scene_transform dla siatek)."""
+    if binning == 1:
+        return regions
+    regions = regions.copy()
+    factor = np.array([1, binning, binning], dtype=np.float32)
+    regions['centroid'] = regions['centroid'] * factor + (factor - 1) / 2.0
+    regions['volume'] *= binning * binning
+    regions['bbox'] *= np.array([1, binning, binning, 1, binning, binning], dtype=np.int32)
+    return regions
+
+
+def write_regions(path, regions):
+    with open(path, 'wb') as f:
+        np.save(f, regions)
+
+
+def read_regions(path):
+    return np.load(path)
+
+
+def box_iou(a, b):
+    """IoU par boxów (n, 6) - przybliżenie nakładania się jąder bez etykiet wokseli poprzedniej klatki."""
+    low = np.maximum(a[:, :3], b[:, :3])
+    high = np.minimum(a[:, 3:], b[:, 3:])
+    inter = np.prod(np.clip(high - low, 0, None), axis=1, dtype=np.float64)
+    vol_a = np.prod(a[:, 3:] - a[:, :3], axis=1, dtype=np.float64)
+    vol_b = np.prod(b[:, 3:] - b[:, :3], axis=1, dtype=np.float64)
+    return inter / np.maximum(vol_a + vol_b - inter, 1.0)
+
+
+def link_frames(prev, curr, max_distance):
+    """Pary indeksów (prev, curr): kandydaci to k najbliższych centroidów z KD-drzewa w promieniu max_distance,
+    koszt = odległość / max_distance + (1 - IoU boxów), przydział zachłanny od najtańszej pary (1:1)."""
+    if not len(prev) or not len(curr):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    k = min(LINK_CANDIDATES, len(curr))
+    distance, index = cKDTree(curr['centroid']).query(prev['centroid'], k=k, distance_upper_bound=max_distance)
+    distance, index = distance.reshape(len(prev), k), index.reshape(len(prev), k)
+    valid = np.isfinite(distance)
+    i = np.repeat(np.arange(len(prev)), k).reshape(len(prev), k)[valid]
+    j = index[valid]
+    cost = distance[valid] / max_distance + (1.0 - box_iou(prev['bbox'][i], curr['bbox'][j]))
+
+    used_prev = np.zeros(len(prev), dtype=bool)
+    used_curr = np.zeros(len(curr), dtype=bool)
+    pairs_prev, pairs_curr = [], []
+    for n in np.argsort(cost, kind='stable'):
+        a, b = i[n], j[n]
+        if used_prev[a] or used_curr[b]:
+            continue
+        used_prev[a] = used_curr[b] = True
+        pairs_prev.append(a)
+        pairs_curr.append(b)
+    return np.array(pairs_prev, dtype=np.int64), np.array(pairs_curr, dtype=np.int64)
+
+
+def build_tracks(frame_regions, max_distance):
+    """frame_regions: {t: tablica REGION_DTYPE}. Łączy kolejne dostępne klatki (przy przerwie, np. FRAME_STRIDE,
+    promień rośnie z odstępem); jądro bez pary zaczyna nową ścieżkę. ID ścieżek od 1, deterministyczne."""
+    parts = []
+    next_track = 1
+    prev, prev_tracks, prev_t = None, None, None
+    for t in sorted(frame_regions):
+        regions = np.sort(frame_regions[t], order='label')
+        tracks = np.zeros(len(regions), dtype=np.int32)
+        if prev is not None:
+            i, j = link_frames(prev, regions, max_distance * (t - prev_t))
+            tracks[j] = prev_tracks[i]
+        new = tracks == 0
+        tracks[new] = np.arange(next_track, next_track + int(new.sum()), dtype=np.int32)
+        next_track += int(new.sum())
+
+        part = np.zeros(len(regions), dtype=TRACK_DTYPE)
+        part['track'] = tracks
+        part['frame'] = t
+        for name in ('label', 'centroid', 'volume'):
+            part[name] = regions[name]
+        parts.append(part)
+        prev, prev_tracks, prev_t = regions, tracks, t
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=TRACK_DTYPE)
+
+
+def write_tracks(path, tracks):
+    # Zapis atomowy, jak manifest - app.py może czytać tabelę w trakcie nowego przebiegu
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, tracks)
+    os.replace(tmp_path, path)
+
+
+def read_tracks(path):
+    return np.load(path, mmap_mode='r')
+
+
+def frame_track_ids(tracks, t, labels):
+    """ID ścieżek dla etykiet klatki t (0 = jądro spoza tabeli)."""
+    rows = tracks[tracks['frame'] == t]
+    ids = np.zeros(len(labels), dtype=np.int32)
+    if not len(rows):
+        return ids
+    labels = np.asarray(labels)
+    index = np.minimum(np.searchsorted(rows['label'], labels), len(rows) - 1)
+    found = rows['label'][index] == labels
+    ids[found] = rows['track'][index[found]]
+    return ids
+
+
+def nucleus_names(tracks, t, labels):
+    """Nazwy węzłów jąder: Nucleus_Track_<id> - ta sama nazwa w każdej klatce, w której jądro występuje."""
+    return [f"Nucleus_Track_{track}" if track else f"Nucleus_{label}"
+            for label, track in zip(labels, frame_track_ids(tracks, t, labels))]
+
+
+def track_summary(tracks):
+    """Jeden wiersz na ścieżkę: pierwsza / ostatnia klatka, liczba klatek, średnia objętość."""
+    if not len(tracks):
+        return []
+    order = np.argsort(tracks['track'], kind='stable')
+    ids, starts, counts = np.unique(tracks['track'][order], return_index=True, return_counts=True)
+    frames = tracks['frame'][order]
+    volumes = tracks['volume'][order].astype(np.float64)
+    return [{'track': int(track), 'first_frame': int(frames[s]), 'last_frame': int(frames[s + n - 1]),
+             'frames': int(n), 'mean_volume': float(volumes[s:s + n].mean())}
+            for track, s, n in zip(ids, starts, counts)]
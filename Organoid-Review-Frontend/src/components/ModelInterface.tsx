@@ -1,9 +1,9 @@
 import React, { useState, Suspense, useEffect, useMemo } from 'react';
 import { Canvas } from '@react-three/fiber';
 import { OrbitControls, Environment, Html, useProgress } from '@react-three/drei';
-import { DualSyncedModels } from './ModelReview';
+import { DualFrameModels, DualSyncedModels } from './ModelReview';
 import { Pause, PlayArrow } from '@mui/icons-material';
-import { useOrganoidModel } from '../services/GlbOrganoid';
+import { COARSE_LOD, frameGlbUrl, useOrganoidFrames, useOrganoidModel, useOrganoidTracks } from '../services/GlbOrganoid';
 
 function Loader() {
   const { progress } = useProgress();
@@ -24,17 +24,36 @@ const getModelUrl = (data: any): string | null => {
 const ModelInterface = ({ orgId }: { orgId?: number }) => {
   const [sliderValue, setSliderValue] = useState(0.0);
   const [isPlaying, setIsPlaying] = useState(false);
+  // Wybrane jądro = ID ścieżki, podświetlane we wszystkich klatkach animacji
+  const [selectedTrack, setSelectedTrack] = useState<number | null>(null);
+  const { data: tracks } = useOrganoidTracks(orgId ?? 0);
+  const trackInfo = tracks?.find((track) => track.track === selectedTrack);
+
+  // Wersje plików (?v=) z /frames - model ładujemy dopiero z nimi, żeby przeglądarka trzymała GLB w cache
+  const { data: framesData, isLoading: versionsLoading } = useOrganoidFrames(orgId ?? 0);
+  const innerVersion = framesData?.models?.inner;
+  const outerVersion = framesData?.models?.outer;
 
   const { data: innerModelData, isLoading: innerLoading } = orgId 
-    ? useOrganoidModel({ id: orgId, type: 'inner' }) 
+    ? useOrganoidModel({ id: orgId, type: 'inner', version: innerVersion }) 
     : { data: null, isLoading: false };
     
   const { data: outerModelData, isLoading: outerLoading } = orgId 
-    ? useOrganoidModel({ id: orgId, type: 'outer' }) 
+    ? useOrganoidModel({ id: orgId, type: 'outer', version: outerVersion }) 
     : { data: null, isLoading: false };
 
+  const { data: innerCoarseData } = orgId
+    ? useOrganoidModel({ id: orgId, type: 'inner', lod: COARSE_LOD, version: innerVersion })
+    : { data: null };
+
+  const { data: outerCoarseData } = orgId
+    ? useOrganoidModel({ id: orgId, type: 'outer', lod: COARSE_LOD, version: outerVersion })
+    : { data: null };
+
   const innerUrl = useMemo(() => getModelUrl(innerModelData), [innerModelData]);
   const outerUrl = useMemo(() => getModelUrl(outerModelData), [outerModelData]);
+  const innerCoarseUrl = useMemo(() => getModelUrl(innerCoarseData), [innerCoarseData]);
+  const outerCoarseUrl = useMemo(() => getModelUrl(outerCoarseData), [outerCoarseData]);
 
   useEffect(() => {
     return () => {
@@ -63,7 +82,7 @@ const ModelInterface = ({ orgId }: { orgId?: number }) => {
     setSliderValue(parseFloat(e.target.value));
   };
 
-  const isReady = !innerLoading && !outerLoading && innerUrl && outerUrl;
+  const isReady = !versionsLoading && !innerLoading && !outerLoading && innerUrl && outerUrl;
 
   return (
     <div style={{ background: '#eee', display: 'flex', flexDirection: 'column', height: '100%', flexGrow: 1 }}>
@@ -77,6 +96,7 @@ const ModelInterface = ({ orgId }: { orgId?: number }) => {
           <Canvas 
             camera={{ position: [0, 2, 5], fov: 50 }}
             style={{ position: 'absolute', top: 0, left: 0, width: '100%', height: '100%' }}
+            onPointerMissed={() => setSelectedTrack(null)}
           >
             <ambientLight intensity={0.5} />
             <directionalLight position={[10, 10, 5]} intensity={1.5} castShadow />
@@ -86,12 +106,33 @@ const ModelInterface = ({ orgId }: { orgId?: number }) => {
               <DualSyncedModels
                 innerUrl={innerUrl}
                 outerUrl={outerUrl}
+                innerCoarseUrl={innerCoarseUrl}
+                outerCoarseUrl={outerCoarseUrl}
                 animationProgress={sliderValue}
+                selectedTrack={selectedTrack}
+                onSelectTrack={setSelectedTrack}
               />
             </Suspense>
             <OrbitControls makeDefault />
           </Canvas>
         )}
+        {isReady && selectedTrack !== null && (
+          <div style={{
+            position: 'absolute', top: '10px', left: '10px', padding: '10px', background: 'rgba(255,255,255,0.85)',
+            borderRadius: '10px', boxShadow: '0 2px 5px rgba(0,0,0,0.2)', fontSize: '14px'
+          }}>
+            <b>Jądro - ścieżka #{selectedTrack}</b>
+            {/* Klatki od 1 jak w ImageJ; tabela ścieżek ma indeksy od 0 */}
+            {trackInfo ? (
+              <div>
+                Klatki T={trackInfo.first_frame + 1}-{trackInfo.last_frame + 1} ({trackInfo.frames} klatek),
+                średnia objętość {Math.round(trackInfo.mean_volume)} wokseli
+              </div>
+            ) : (
+              <div>Brak danych ścieżki</div>
+            )}
+          </div>
+        )}
       </div>
 
       <div style={{ 
@@ -128,4 +169,71 @@ const ModelInterface = ({ orgId }: { orgId?: number }) => {
   );
 };
 
+// Podgląd klatek gotowych przed końcem zadania (GLB na klatkę); lista odświeżana co kilka sekund, dopóki
+// trwa meshowanie. Bez wyboru użytkownika pokazywana jest najnowsza klatka.
+export const FramePreviewInterface = ({ orgId }: { orgId: number }) => {
+  const { data, error } = useOrganoidFrames(orgId);
+  const [selectedFrame, setSelectedFrame] = useState<number | null>(null);
+
+  const frames = data?.frames ?? [];
+  const selectedIndex = frames.findIndex((f) => f.frame === selectedFrame);
+  const index = selectedIndex >= 0 ? selectedIndex : frames.length - 1;
+  const current = index >= 0 ? frames[index] : undefined;
+
+  // Adresy wprost z frame z API - nazwa pliku klatki i adres używają tego samego indeksu
+  const innerUrl = current?.layers.includes('inner')
+    ? frameGlbUrl(orgId, current.frame, 'inner', current.versions.inner) : null;
+  const outerUrl = current?.layers.includes('outer')
+    ? frameGlbUrl(orgId, current.frame, 'outer', current.versions.outer) : null;
+
+  if (error) {
+    return <div style={{ marginLeft: '80px' }}>Błąd: {error.message}</div>;
+  }
+  if (!current) {
+    return (
+      <div style={{ marginLeft: '80px' }}>
+        {data?.stage === 'meshing' || data?.stage === 'uploaded'
+          ? 'Trwa przetwarzanie - pierwsze klatki pojawią się tutaj po ich zmeshowaniu.'
+          : 'Model organoidu nie został jeszcze utworzony'}
+      </div>
+    );
+  }
+
+  return (
+    <div style={{ background: '#eee', display: 'flex', flexDirection: 'column', height: '100%', flexGrow: 1 }}>
+      <div style={{ flexGrow: 1, position: 'relative', minHeight: '500px' }}>
+        <Canvas
+          camera={{ position: [0, 2, 5], fov: 50 }}
+          style={{ position: 'absolute', top: 0, left: 0, width: '100%', height: '100%' }}
+        >
+          <ambientLight intensity={0.5} />
+          <directionalLight position={[10, 10, 5]} intensity={1.5} castShadow />
+          <Environment preset="city" />
+
+          <Suspense fallback={<Loader />}>
+            <DualFrameModels innerUrl={innerUrl} outerUrl={outerUrl} />
+          </Suspense>
+          <OrbitControls makeDefault />
+        </Canvas>
+      </div>
+
+      <div style={{ padding: '20px', background: '#eee', display: 'flex', flexDirection: 'column', alignItems: 'center' }}>
+        {/* Etykieta od 1 jak w ImageJ i logach pipeline'u; w adresach zawsze frame z API */}
+        <div style={{ marginBottom: '10px' }}>
+          Podgląd w trakcie przetwarzania - klatka T={current.frame + 1} ({index + 1} z {frames.length} gotowych)
+        </div>
+        <input
+          type="range"
+          min={0}
+          max={frames.length - 1}
+          step={1}
+          value={index}
+          onChange={(e) => setSelectedFrame(frames[parseInt(e.target.value, 10)].frame)}
+          style={{ width: '80%', cursor: 'pointer' }}
+        />
+      </div>
+    </div>
+  );
+};
+
 export default ModelInterface;
\ No newline at end of file
@@ -1,26 +1,47 @@
-import { useEffect, useMemo } from 'react';
+import { Suspense, useEffect, useMemo } from 'react';
 import { useAnimations, useGLTF } from '@react-three/drei';
+import type { ThreeEvent } from '@react-three/fiber';
 import * as THREE from 'three';
 import type { GLTF } from 'three-stdlib';
+import { nucleusTrackId } from '../services/GlbOrganoid';
+
+// Kolor wybranego jądra (ta sama ścieżka we wszystkich klatkach)
+const HIGHLIGHT_COLOR = '#ffd54f';
 
 interface AnimatedModelProps {
   url: string;
   animationProgress: number;
   opacity?: number;
   color?: string;
+  highlightTrack?: number | null;
+  onSelectTrack?: (track: number) => void;
 }
 
 export function SingleAnimatedModel({ 
   url, 
   animationProgress, 
   opacity = 1.0,
-  color
+  color,
+  highlightTrack = null,
+  onSelectTrack
 }: AnimatedModelProps) {
   // useGLTF automatycznie pobierze model z adresu URL (czy to http:// czy blob:)
   const { scene, animations } = useGLTF(url) as GLTF;
   
-  // Klonowanie sceny
-  const clone = useMemo(() => scene.clone(), [scene]);
+  // Klonowanie sceny; materiał na siatkę - GLB bez materiałów dzielą jeden domyślny,
+  // a podświetlenie jądra nie może zmieniać pozostałych
+  const clone = useMemo(() => {
+    const copy = scene.clone();
+    copy.traverse((child) => {
+      const mesh = child as THREE.Mesh;
+      if (mesh.isMesh) {
+        mesh.material = Array.isArray(mesh.material)
+          ? mesh.material.map((mat) => mat.clone())
+          : mesh.material.clone();
+      }
+    });
+    return copy;
+  }, [scene]);
 
   // Animacje
   const { actions, names } = useAnimations(animations, clone);
@@ -31,17 +52,28 @@ export function SingleAnimatedModel({
       if ((child as THREE.Mesh).isMesh) {
         const mesh = child as THREE.Mesh;
         const materials = Array.isArray(mesh.material) ? mesh.material : [mesh.material];
+        const highlighted = highlightTrack !== null && nucleusTrackId(mesh.name) === highlightTrack;
         
         materials.forEach((mat) => {
           const standardMat = mat as THREE.MeshStandardMaterial;
           standardMat.transparent = true;
-          standardMat.opacity = opacity;
-          if (color) standardMat.color = new THREE.Color(color);
-          standardMat.depthWrite = opacity >= 1.0;
+          standardMat.opacity = highlighted ? 1.0 : opacity;
+          if (highlighted) standardMat.color = new THREE.Color(HIGHLIGHT_COLOR);
+          else if (color) standardMat.color = new THREE.Color(color);
+          standardMat.depthWrite = highlighted || opacity >= 1.0;
         });
       }
     });
-  }, [clone, opacity, color]);
+  }, [clone, opacity, color, highlightTrack]);
+
+  // Kliknięcie jądra wybiera jego ścieżkę; pozostałe siatki (np. otoczka) nie przechwytują zdarzenia
+  const handleClick = (event: ThreeEvent<MouseEvent>) => {
+    const track = nucleusTrackId(event.object.name);
+    if (track !== null && onSelectTrack) {
+      event.stopPropagation();
+      onSelectTrack(track);
+    }
+  };
 
   // Sterowanie Suwakiem
   useEffect(() => {
@@ -57,26 +89,54 @@ export function SingleAnimatedModel({
     }
   }, [actions, names, animationProgress]);
 
-  return <primitive object={clone} scale={1.5} position={[0, -1, 0]} />;
+  return (
+    <primitive object={clone} scale={1.5} position={[0, -1, 0]}
+               onClick={onSelectTrack ? handleClick : undefined} />
+  );
+}
+
+interface ProgressiveModelProps extends AnimatedModelProps {
+  coarseUrl?: string | null;
+}
+
+// Najpierw lekki poziom LOD (fallback Suspense), po doładowaniu podmieniany na pełny model
+export function ProgressiveAnimatedModel({ coarseUrl, ...props }: ProgressiveModelProps) {
+  if (!coarseUrl || coarseUrl === props.url) {
+    return <SingleAnimatedModel {...props} />;
+  }
+  return (
+    <Suspense fallback={<SingleAnimatedModel {...props} url={coarseUrl} />}>
+      <SingleAnimatedModel {...props} />
+    </Suspense>
+  );
 }
 
 interface DualSyncedModelsProps {
   outerUrl: string;
   innerUrl: string;
+  outerCoarseUrl?: string | null;
+  innerCoarseUrl?: string | null;
   animationProgress: number;
+  selectedTrack?: number | null;
+  onSelectTrack?: (track: number) => void;
 }
 
-export function DualSyncedModels({ outerUrl, innerUrl, animationProgress }: DualSyncedModelsProps) {
+export function DualSyncedModels({ outerUrl, innerUrl, outerCoarseUrl, innerCoarseUrl, animationProgress,
+                                   selectedTrack, onSelectTrack }: DualSyncedModelsProps) {
   return (
     <group position={[0, 1, 0]} scale={1.5}>
-      <SingleAnimatedModel 
+      <ProgressiveAnimatedModel 
         url={innerUrl} 
+        coarseUrl={innerCoarseUrl}
         animationProgress={animationProgress}
         opacity={0.5}
         color="#df5c5c"
+        highlightTrack={selectedTrack}
+        onSelectTrack={onSelectTrack}
       />
-      <SingleAnimatedModel 
+      <ProgressiveAnimatedModel 
         url={outerUrl} 
+        coarseUrl={outerCoarseUrl}
         animationProgress={animationProgress}
         opacity={0.5}
         color="#305064"
@@ -85,5 +145,24 @@ export function DualSyncedModels({ outerUrl, innerUrl, animationProgress }: Dual
   );
 }
 
+interface DualFrameModelsProps {
+  outerUrl?: string | null;
+  innerUrl?: string | null;
+}
+
+// Podgląd jednej klatki w trakcie przetwarzania: statyczne GLB klatki (bez animacji), kolory jak w DualSyncedModels
+export function DualFrameModels({ outerUrl, innerUrl }: DualFrameModelsProps) {
+  return (
+    <group position={[0, 1, 0]} scale={1.5}>
+      {innerUrl && (
+        <SingleAnimatedModel url={innerUrl} animationProgress={0} opacity={0.5} color="#df5c5c" />
+      )}
+      {outerUrl && (
+        <SingleAnimatedModel url={outerUrl} animationProgress={0} opacity={0.5} color="#305064" />
+      )}
+    </group>
+  );
+}
+
 // Preload jest trudny przy dynamicznych URLach (blob), więc można go pominąć 
 // lub używać tylko dla stałych zasobów.
\ No newline at end of file
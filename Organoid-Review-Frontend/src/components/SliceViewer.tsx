@@ -0,0 +1,116 @@
+import { useState } from 'react';
+import { sliceTileGrid, sliceTileUrl, useSliceInfo } from '../services/TiffOrganoid';
+import type { SliceInfo, SliceView } from '../services/TiffOrganoid';
+
+const VIEW_LABELS: Record<SliceView, string> = {
+  xy: 'XY (płaszczyzna Z)',
+  xz: 'XZ (wiersz Y)',
+  yz: 'YZ (kolumna X)',
+};
+
+// Szerokość obrazu, do której dobierany jest domyślny poziom piramidy
+const DEFAULT_VIEW_WIDTH = 1024;
+
+// Liczba położeń przekroju wzdłuż osi widoku (pełna rozdzielczość)
+const indexCount = (info: SliceInfo, view: SliceView) =>
+  ({ xy: info.slices, xz: info.height, yz: info.width })[view];
+
+const defaultLevel = (info: SliceInfo) => {
+  let level = 0;
+  while (level < info.levels && Math.floor(info.width / 2 ** level) > DEFAULT_VIEW_WIDTH) level++;
+  return level;
+};
+
+const controlStyle = { display: 'flex', alignItems: 'center', gap: '8px' };
+
+// Przekroje XY / XZ / YZ i MIP surowego stosu z kafli backendu (piramida albo memmap w locie)
+const SliceViewer = ({ orgId }: { orgId: number }) => {
+  const { data: info, isLoading, error } = useSliceInfo(orgId);
+  const [view, setView] = useState<SliceView>('xy');
+  const [frame, setFrame] = useState(0);
+  const [channel, setChannel] = useState(0);
+  const [index, setIndex] = useState<number | null>(null);
+  const [mip, setMip] = useState(false);
+  const [level, setLevel] = useState<number | null>(null);
+
+  if (isLoading) {
+    return <div style={{ marginTop: '10px' }}>Ładowanie wymiarów stosu...</div>;
+  }
+  if (error || !info) {
+    return <div style={{ marginTop: '10px' }}>Surowy stos nie jest dostępny.</div>;
+  }
+
+  const count = indexCount(info, view);
+  // Bez wyboru użytkownika - środek stosu i poziom mieszczący obraz w DEFAULT_VIEW_WIDTH
+  const currentIndex = Math.min(index ?? Math.floor(count / 2), count - 1);
+  const currentLevel = level ?? defaultLevel(info);
+  const format = info.formats.includes('webp') ? 'webp' : 'png';
+  const { rows, cols } = sliceTileGrid(info, view, currentLevel);
+
+  return (
+    <div style={{ marginTop: '10px', display: 'flex', flexDirection: 'column', gap: '10px' }}>
+      <div style={{ display: 'flex', flexWrap: 'wrap', gap: '20px', alignItems: 'center' }}>
+        <label style={controlStyle}>
+          Widok:
+          <select value={view} onChange={(e) => { setView(e.target.value as SliceView); setIndex(null); }}>
+            {info.views.map((name) => <option key={name} value={name}>{VIEW_LABELS[name]}</option>)}
+          </select>
+        </label>
+        <label style={controlStyle}>
+          Kanał:
+          <select value={channel} onChange={(e) => setChannel(parseInt(e.target.value, 10))}>
+            {Array.from({ length: info.channels }, (_, c) => <option key={c} value={c}>{c + 1}</option>)}
+          </select>
+        </label>
+        <label style={controlStyle}>
+          Rozdzielczość:
+          <select value={currentLevel} onChange={(e) => setLevel(parseInt(e.target.value, 10))}>
+            {Array.from({ length: info.levels + 1 }, (_, l) => <option key={l} value={l}>1/{2 ** l}</option>)}
+          </select>
+        </label>
+        <label style={controlStyle}>
+          <input type="checkbox" checked={mip} onChange={(e) => setMip(e.target.checked)} />
+          Projekcja maksimum (MIP)
+        </label>
+      </div>
+
+      {/* Numeracja od 1 jak w ImageJ; do API idą indeksy od 0 */}
+      <label style={controlStyle}>
+        Klatka T={frame + 1}/{info.frames}
+        <input type="range" min={0} max={info.frames - 1} step={1} value={frame}
+               onChange={(e) => setFrame(parseInt(e.target.value, 10))} style={{ flexGrow: 1 }} />
+      </label>
+      <label style={{ ...controlStyle, opacity: mip ? 0.5 : 1 }}>
+        Przekrój {currentIndex + 1}/{count}
+        <input type="range" min={0} max={count - 1} step={1} value={currentIndex} disabled={mip}
+               onChange={(e) => setIndex(parseInt(e.target.value, 10))} style={{ flexGrow: 1 }} />
+      </label>
+
+      <div style={{ overflow: 'auto', maxHeight: '70vh', background: '#000', borderRadius: '10px' }}>
+        <div style={{ display: 'grid', gridTemplateColumns: `repeat(${cols}, max-content)`, width: 'max-content',
+                      margin: '0 auto', lineHeight: 0 }}>
+          {Array.from({ length: rows * cols }, (_, i) => {
+            const tx = i % cols;
+            const ty = Math.floor(i / cols);
+            return (
+              <img
+                key={`${ty}-${tx}`}
+                src={sliceTileUrl(orgId, { view, frame, channel, level: currentLevel, tx, ty,
+                                           index: currentIndex, mip, format })}
+                alt=""
+                style={{ display: 'block', imageRendering: 'pixelated' }}
+              />
+            );
+          })}
+        </div>
+      </div>
+      {!info.pyramid && (
+        <div style={{ fontSize: '12px', color: '#666' }}>
+          Piramida przekrojów nie jest jeszcze zbudowana - kafle liczone są na bieżąco z pliku TIFF.
+        </div>
+      )}
+    </div>
+  );
+};
+
+export default SliceViewer;
@@ -10,6 +10,7 @@ const MainMenu = () => {
   const [addExtracted, setAddExtracted] = useState(false);
   const [selectedTiffFile, setSelectedTiffFile] = useState<File | null>(null);
   const [newSetName, setNewSetName] = useState('');
+  const [uploadProgress, setUploadProgress] = useState(0);
 
   const handleFileChange = (event: ChangeEvent<HTMLInputElement>) => {
     const files = event.target.files;
@@ -34,8 +35,13 @@ const MainMenu = () => {
 
     if (selectedTiffFile && newSetName) {
       
+      setUploadProgress(0);
       createOrganoid(
-        { name: newSetName, file: selectedTiffFile }, 
+        {
+          name: newSetName,
+          file: selectedTiffFile,
+          onProgress: (sent, total) => setUploadProgress(total ? Math.floor(sent / total * 100) : 0)
+        },
         {
           onSuccess: () => {
             console.log("Dodano!");
@@ -159,7 +165,7 @@ const MainMenu = () => {
                 onClick={() => {
                   handleAddDataset();
                 }}>
-                {isUploading ? 'Twra przesyłanie skanów...':'Dodaj zbiór danych do eksperymentu'}
+                {isUploading ? `Twra przesyłanie skanów... ${uploadProgress}%`:'Dodaj zbiór danych do eksperymentu'}
               </button>
             </div> :
             <div>
@@ -1,5 +1,6 @@
 import { ArrowLeft} from "@mui/icons-material";
-import ModelInterface from "../components/ModelInterface";
+import ModelInterface, { FramePreviewInterface } from "../components/ModelInterface";
+import SliceViewer from "../components/SliceViewer";
 import { useNavigate, useParams } from "react-router-dom";
 import { useOrganoid } from "../services/Organoid";
 
@@ -39,12 +40,35 @@ const SingleSetInterface = () => {
         ) : !organoidData?.isInitialized ? (
           <div style={{marginLeft: '80px'}}>Organoid nie został jeszcze zainicjalizowany.</div>
         ) : !organoidData?.isProcessedGlb ? (
-          <div style={{marginLeft: '80px'}}>Model organoidu nie został jeszcze utworzony</div>
+          <FramePreviewInterface orgId={+(id ?? 0)} />
         ) : (
           <ModelInterface orgId={+(id ?? 0)} />
         )}
         
       </div>
+      <div
+        style={{ 
+          padding: '20px', 
+          background: '#eee', 
+          boxShadow: '0 -7px 10px rgba(0,0,0,0.1)',
+          borderRadius: '20px',
+          margin: '10px'
+        }}
+      >
+        <label
+          style={{
+            fontSize: '18px',
+            fontWeight: 'bold',
+          }}
+        >
+          Przekroje surowego stosu (XY / XZ / YZ, MIP):
+        </label>
+        {!organoidData || organoidData.stage === 'uploading' ? (
+          <div style={{ marginTop: '10px' }}>Plik TIFF nie został jeszcze w całości przesłany.</div>
+        ) : (
+          <SliceViewer orgId={+(id ?? 0)} />
+        )}
+      </div>
       {/* {organoidData?.isInCurrentRdf &&  <div */}
       {<div
         style={{ 
@@ -1,4 +1,4 @@
-// import { useQuery } from '@tanstack/react-query';
+import { useQuery } from '@tanstack/react-query';
 
 const API_URL = import.meta.env.VITE_API_URL;
 
@@ -12,12 +12,25 @@ const API_URL = import.meta.env.VITE_API_URL;
 //     return response.json();
 // };
 
-export const useOrganoidModel = ({id, type} : {id: number, type: 'inner' | 'outer'}) => {
+// Najprostszy poziom piramidy LOD z backendu (?lod=2 -> ~5% ścian), ładowany przed pełnym modelem
+export const COARSE_LOD = 2;
+
+// Parametry zapytania GLB: ?lod= oraz ?v=<wersja pliku z /frames> - adres z wersją serwer oznacza jako
+// immutable (cache na rok), po ponownej publikacji wersja i adres się zmieniają
+const glbQuery = (params: { lod?: number, version?: string | null }) => {
+    const query = new URLSearchParams();
+    if (params.lod) query.set('lod', String(params.lod));
+    if (params.version) query.set('v', params.version);
+    const text = query.toString();
+    return text ? `?${text}` : '';
+};
+
+export const useOrganoidModel = ({id, type, lod = 0, version} : {id: number, type: 'inner' | 'outer', lod?: number, version?: string | null}) => {
 //   return useQuery({
 //     queryKey: ['organoids'], 
 //     queryFn: () => fetchOrganoidModel({id, type}),
 //   });
-    const url = id ? `${API_URL}/organoid/${id}/${type}` : null;
+    const url = id ? `${API_URL}/organoid/${id}/${type}${glbQuery({ lod, version })}` : null;
 
     return {
         data: url,       // Tutaj zwracamy string (URL), a nie Blob/JSON
@@ -25,4 +38,80 @@ export const useOrganoidModel = ({id, type} : {id: number, type: 'inner' | 'oute
                         // Prawdziwe ładowanie obsłuży <Suspense> w Canvasie
         error: null
     };
-};
\ No newline at end of file
+};
+
+export interface OrganoidFrame {
+    frame: number;      // indeks T w stosie od 0 - ten sam w nazwie pliku klatki, 'frame_available' i /tracks
+    layers: ('inner' | 'outer')[];
+    versions: Partial<Record<'inner' | 'outer', string>>;
+}
+
+export interface OrganoidFrames {
+    organoid_id: number;
+    stage: string | null;
+    frames: OrganoidFrame[];
+    models: Record<'inner' | 'outer', string | null>;   // wersje opublikowanych animacji (null = brak pliku)
+}
+
+// Etapy, w których przybywają nowe klatki - wtedy lista jest odświeżana
+const FRAME_POLL_STAGES = ['uploaded', 'meshing'];
+const FRAME_POLL_INTERVAL = 3000;
+
+const fetchOrganoidFrames = async (id: number): Promise<OrganoidFrames> => {
+    const response = await fetch(`${API_URL}/organoid/${id}/frames`);
+
+    if (!response.ok) {
+        throw new Error('Wystąpił błąd podczas pobierania klatek organoidu');
+    }
+
+    return response.json();
+};
+
+// Klatki dostępne przed końcem przetwarzania (statyczny GLB na klatkę) - podgląd początku timelapse'u
+export const useOrganoidFrames = (id: number) => {
+    return useQuery({
+        queryKey: ['organoidFrames', id],
+        queryFn: () => fetchOrganoidFrames(id),
+        enabled: !!id,
+        refetchInterval: (query) =>
+            FRAME_POLL_STAGES.includes(query.state.data?.stage ?? '') ? FRAME_POLL_INTERVAL : false,
+    });
+};
+
+// frame zawsze z OrganoidFrame.frame (bez przeliczania na numerację od 1)
+export const frameGlbUrl = (id: number, frame: number, type: 'inner' | 'outer', version?: string | null) =>
+    `${API_URL}/organoid/${id}/frames/${frame}/${type}${glbQuery({ version })}`;
+
+export interface NucleusTrack {
+    track: number;
+    first_frame: number;
+    last_frame: number;
+    frames: number;
+    mean_volume: number;
+}
+
+const fetchOrganoidTracks = async (id: number): Promise<NucleusTrack[]> => {
+    const response = await fetch(`${API_URL}/organoid/${id}/tracks`);
+
+    if (!response.ok) {
+        throw new Error('Wystąpił błąd podczas pobierania ścieżek jąder');
+    }
+
+    return (await response.json()).tracks;
+};
+
+// ID ścieżki z nazwy węzła jądra; GLTFLoader dopisuje _1, _2... do powtórzonych nazw (to samo jądro
+// w kolejnych klatkach), więc liczy się tylko prefiks. null = jądro bez ścieżki albo inna siatka
+export const nucleusTrackId = (name: string): number | null => {
+    const match = /^Nucleus_Track_(\d+)/.exec(name);
+    return match ? parseInt(match[1], 10) : null;
+};
+
+// Ścieżki jąder (węzły Nucleus_Track_<id> w GLB mają to samo ID w każdej klatce)
+export const useOrganoidTracks = (id: number) => {
+    return useQuery({
+        queryKey: ['organoidTracks', id],
+        queryFn: () => fetchOrganoidTracks(id),
+        enabled: !!id,
+    });
+};
@@ -8,14 +8,27 @@ export interface Organoid {
   isInitialized?: boolean;
   isProcessedGlb?: boolean;
   isInCurrentRdf?: boolean;
+  stage?: 'uploading' | 'uploaded' | 'meshing' | 'meshed' | 'packaging' | 'published' | 'failed' | null;
 }
 
 export interface OrganoidUploadPayload {
   name: string;
   file: File;
-  
+  onProgress?: (sent: number, total: number) => void;
 }
 
+interface UploadStatus {
+  id: number;
+  organoid_id: number | null;
+  total_size: number;
+  received: number;
+  chunk_size: number;
+  status: 'uploading' | 'complete' | 'failed' | 'aborted';
+  error: string | null;
+}
+
+const CHUNK_RETRIES = 3;
+
 const fetchOrganoids = async (): Promise<Organoid[]> => {
   const response = await fetch(`${API_URL}organoid/`);
   
@@ -36,28 +49,95 @@ const fetchOrganoid = async (id: number): Promise<Organoid> => {
   return response.json();
 };
 
-const uploadOrganoid = async ({ name, file }: OrganoidUploadPayload): Promise<any> => {
-  const formData = new FormData();
-  formData.append('name', name);
-  formData.append('file', file);
+const readError = async (response: Response, fallback: string): Promise<Error> => {
+  try {
+    const body = await response.json();
+    return new Error(body.error || fallback);
+  } catch {
+    return new Error(fallback);
+  }
+};
 
-  const response = await fetch(`${API_URL}dataset/`, {
+// SHA-256 porcji (hex); crypto.subtle jest dostępne tylko w bezpiecznym kontekście (https / localhost)
+const chunkChecksum = async (chunk: Blob): Promise<string | null> => {
+  if (!window.crypto?.subtle) return null;
+  const digest = await window.crypto.subtle.digest('SHA-256', await chunk.arrayBuffer());
+  return Array.from(new Uint8Array(digest), (byte) => byte.toString(16).padStart(2, '0')).join('');
+};
+
+const fetchUploadStatus = async (id: number): Promise<UploadStatus> => {
+  const response = await fetch(`${API_URL}dataset/uploads/${id}`);
+  if (!response.ok) {
+    throw await readError(response, 'Wystąpił błąd podczas sprawdzania przesyłania');
+  }
+  return response.json();
+};
+
+// Przesyłanie porcjami: init -> PUT kolejnych porcji od 'received' -> complete.
+// Serwer zwraca trwające przesyłanie tego samego pliku, więc po przerwie wznawiamy od miejsca, w którym skończyliśmy.
+const uploadOrganoid = async ({ name, file, onProgress }: OrganoidUploadPayload): Promise<UploadStatus> => {
+  const initResponse = await fetch(`${API_URL}dataset/uploads`, {
     method: 'POST',
-    body: formData,
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ name, size: file.size }),
   });
+  if (!initResponse.ok) {
+    throw await readError(initResponse, 'Wystąpił błąd podczas dodawania organoidu');
+  }
 
-  if (!response.ok) {
-    const errorText = await response.text();
-    throw new Error(errorText || 'Wystąpił błąd podczas dodawania organoidu');
+  let upload: UploadStatus = await initResponse.json();
+  let failures = 0;
+  onProgress?.(upload.received, file.size);
+
+  while (upload.received < file.size) {
+    const offset = upload.received;
+    const chunk = file.slice(offset, offset + upload.chunk_size);
+    const checksum = await chunkChecksum(chunk);
+    const headers: Record<string, string> = {
+      'Content-Type': 'application/octet-stream',
+      'Upload-Offset': String(offset),
+    };
+    if (checksum) headers['X-Chunk-Sha256'] = checksum;
+
+    let response: Response | null = null;
+    try {
+      response = await fetch(`${API_URL}dataset/uploads/${upload.id}`, { method: 'PUT', headers, body: chunk });
+    } catch {
+      response = null;
+    }
+
+    if (response?.ok) {
+      upload = await response.json();
+      failures = 0;
+      onProgress?.(upload.received, file.size);
+      continue;
+    }
+    // 422 = plik odrzucony przez walidację nagłówka ImageJ, nie ma sensu ponawiać
+    if (response?.status === 422 || ++failures > CHUNK_RETRIES) {
+      throw response ? await readError(response, 'Wystąpił błąd podczas przesyłania pliku')
+                     : new Error('Wystąpił błąd podczas przesyłania pliku');
+    }
+    // Sieć / zła suma / niezgodny offset: ustalamy stan po stronie serwera i ponawiamy od 'received'
+    upload = await fetchUploadStatus(upload.id);
   }
 
-  return response.json();
+  const completeResponse = await fetch(`${API_URL}dataset/uploads/${upload.id}/complete`, { method: 'POST' });
+  if (!completeResponse.ok) {
+    throw await readError(completeResponse, 'Wystąpił błąd podczas kończenia przesyłania');
+  }
+  return completeResponse.json();
 };
 
+// Etapy przetwarzania - organoid jest odświeżany, żeby po publikacji podgląd klatek zastąpił pełny model
+const PROCESSING_STAGES = ['uploaded', 'meshing', 'meshed', 'packaging'];
+const ORGANOID_POLL_INTERVAL = 5000;
+
 export const useOrganoid = (id: number) => {
   return useQuery({
     queryKey: ['organoidModel', id], 
     queryFn: () => fetchOrganoid(id),
+    refetchInterval: (query) =>
+      PROCESSING_STAGES.includes(query.state.data?.stage ?? '') ? ORGANOID_POLL_INTERVAL : false,
   });
 };
 
@@ -0,0 +1,77 @@
+import { useQuery } from '@tanstack/react-query';
+
+const API_URL = import.meta.env.VITE_API_URL;
+
+export type SliceView = 'xy' | 'xz' | 'yz';
+export type SliceFormat = 'png' | 'webp';
+
+export interface SliceInfo {
+    organoid_id: number;
+    frames: number;
+    channels: number;
+    slices: number;
+    height: number;
+    width: number;
+    levels: number;     // poziomy ponad pełną rozdzielczością (0 = pełna)
+    tile_size: number;
+    views: SliceView[];
+    formats: SliceFormat[];
+    pyramid: boolean;   // false - kafle liczone w locie, dopóki zadanie mesh nie zbuduje piramidy
+}
+
+const fetchSliceInfo = async (id: number): Promise<SliceInfo> => {
+    const response = await fetch(`${API_URL}/organoid/${id}/slices`);
+
+    if (!response.ok) {
+        throw new Error('Wystąpił błąd podczas pobierania wymiarów stosu');
+    }
+
+    return response.json();
+};
+
+export const useSliceInfo = (id: number) => {
+    return useQuery({
+        queryKey: ['organoidSlices', id],
+        queryFn: () => fetchSliceInfo(id),
+        enabled: !!id,
+    });
+};
+
+export interface SliceTile {
+    view: SliceView;
+    frame: number;
+    channel: number;
+    level: number;
+    tx: number;
+    ty: number;
+    index?: number;     // płaszczyzna Z (xy), wiersz Y (xz) albo kolumna X (yz) w pełnej rozdzielczości
+    mip?: boolean;      // projekcja maksimum wzdłuż osi widoku
+    format?: SliceFormat;
+    min?: number;       // okno intensywności - domyślnie z percentyli klatki
+    max?: number;
+}
+
+// Adres kafla dla <img> / tekstury - przeglądarka cache'uje go i rewaliduje po ETag
+export const sliceTileUrl = (id: number, tile: SliceTile) => {
+    const params = new URLSearchParams();
+    if (tile.mip) {
+        params.set('mip', '1');
+    } else {
+        params.set('index', String(tile.index ?? 0));
+    }
+    if (tile.format) params.set('format', tile.format);
+    if (tile.min !== undefined) params.set('min', String(tile.min));
+    if (tile.max !== undefined) params.set('max', String(tile.max));
+    return `${API_URL}/organoid/${id}/slices/${tile.view}/${tile.frame}/${tile.channel}/${tile.level}/${tile.tx}/${tile.ty}?${params}`;
+};
+
+// Wiersze / kolumny siatki kafli widoku na poziomie (jak SliceSource.view_shape w backendzie)
+export const sliceTileGrid = (info: SliceInfo, view: SliceView, level: number) => {
+    const size = (n: number) => Math.max(0, Math.floor(n / 2 ** level));
+    const [rows, cols] = {
+        xy: [size(info.height), size(info.width)],
+        xz: [size(info.slices), size(info.width)],
+        yz: [size(info.slices), size(info.height)],
+    }[view];
+    return { rows: Math.ceil(rows / info.tile_size), cols: Math.ceil(cols / info.tile_size) };
+};